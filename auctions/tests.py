@@ -0,0 +1,55 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.testing import make_user
+
+from .models import Auction, Bid
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class AuctionDetailQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bidders = [make_user(f'bidder {i}') for i in 'abcdefghij' * 2]
+        seller = make_user('seller')
+        cls.auction, cls.empty_auction = [
+            Auction.objects.create(
+                seller=seller, title='piano', starting_price=10,
+                current_price=10,
+                expires_at=timezone.now() + timedelta(days=1)
+            )
+            for _ in range(2)
+        ]
+        now = timezone.now()
+        Bid.objects.bulk_create([
+            Bid(auction=cls.auction, bidder=bidder, amount=20 + i,
+                created_at=now - timedelta(minutes=i))
+            for i, bidder in enumerate(cls.bidders * 2)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def queries(self, auction):
+        url = reverse('auctions:detail', args=[auction.id])
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return len(ctx), response
+
+    def test_bidders_are_loaded_with_one_query(self):
+        page_queries = self.queries(self.empty_auction)[0]
+        count, response = self.queries(self.auction)
+        self.assertEqual(count, page_queries + 1)
+        self.assertEqual(
+            [b.bidder_name for b in response.context['bids'][:20]],
+            [u.fullName for u in self.bidders]
+        )
+        # names are cached now
+        self.assertEqual(self.queries(self.auction)[0], page_queries)
@@ -5,6 +5,7 @@ from .models import Auction, Bid
 from .forms import AuctionCreateForm, BidForm
 from users.views import session_login_required
 from users.models import User
+from users.names import display_name, display_names
 import secrets
 from django.db.models import Q
 
@@ -61,11 +62,15 @@ def auction_create(request):
 
 
 def auction_detail(request, auction_id):
-    auction = get_object_or_404(Auction.objects.prefetch_related('bid_set__bidder'), pk=auction_id)
+    auction = get_object_or_404(Auction, pk=auction_id)
     bid_form = BidForm()
-    bids = auction.bid_set.all().order_by('-created_at')
+    bids = list(auction.bid_set.order_by('-created_at'))
+    # one query (or none, when cached) for the names of all bidders
+    names = display_names(b.bidder_id for b in bids)
+    for b in bids:
+        b.bidder_name = display_name(b.bidder_id, names)
     user_id = request.session.get('user_id')
-    is_seller = str(user_id) == str(getattr(auction.seller, 'id', ''))
+    is_seller = str(user_id) == str(auction.seller_id or '')
     return render(request, 'auctions/detail.html', {
         'auction': auction,
         'bids': bids,
@@ -0,0 +1,295 @@
+"""
+Alignment-based scoring. Instead of comparing time-averaged features of
+the first few seconds, the whole student take is aligned to the
+reference on chroma with a banded, multi-resolution DTW and pitch and
+timing are compared segment by segment along the alignment path.
+
+Memory stays linear in the recording length: features are extracted in
+fixed-size blocks, and the DTW only keeps two rows of accumulated cost
+plus one int8 step per cell inside the band, never the full N x M
+matrix. The number of cells evaluated at each resolution is bounded by
+max_cells.
+"""
+import math
+
+import librosa
+import numpy as np
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
+
+from .analysis import track_pitch
+
+ALIGN_SR = 22050
+ALIGN_HOP = 1024
+ALIGN_N_FFT = 2048
+
+# step codes stored for backtracking
+_DIAG, _UP, _LEFT, _START = 0, 1, 2, 3
+
+
+def _blockwise(fn, y, hop, block_frames=640, margin_frames=4):
+    """
+    Apply a frame-wise feature fn(y) -> (..., n_frames) to y in blocks of
+    block_frames frames. Each block is given margin_frames of context on
+    both sides, so frames computed from a block match those computed
+    from the whole signal as long as fn's window is within the margin.
+    """
+    n_frames = 1 + len(y) // hop
+    blocks = []
+    for f0 in range(0, n_frames, block_frames):
+        f1 = min(f0 + block_frames, n_frames)
+        s0 = max(0, f0 - margin_frames) * hop
+        s1 = min(len(y), (f1 + margin_frames) * hop)
+        feats = fn(y[s0:s1])
+        skip = f0 - s0 // hop
+        blocks.append(feats[..., skip:skip + f1 - f0])
+    return np.concatenate(blocks, axis=-1)
+
+
+def extract_alignment_features(y, sr, pitch_backend='yin'):
+    """
+    Frame-level chroma, pitch and RMS of a whole recording on a common
+    ALIGN_HOP grid at ALIGN_SR.
+    """
+    y = np.asarray(y, dtype=np.float32)
+    if sr != ALIGN_SR:
+        y = librosa.resample(y, orig_sr=sr, target_sr=ALIGN_SR)
+    chroma = _blockwise(
+        lambda seg: librosa.feature.chroma_stft(
+            y=seg, sr=ALIGN_SR, n_fft=ALIGN_N_FFT, hop_length=ALIGN_HOP,
+            tuning=0.0
+        ),
+        y, ALIGN_HOP
+    )
+    pitches = _blockwise(
+        lambda seg: track_pitch(
+            seg, ALIGN_SR, pitch_backend, hop_length=ALIGN_HOP
+        )[0],
+        y, ALIGN_HOP
+    )
+    rms = _blockwise(
+        lambda seg: librosa.feature.rms(
+            y=seg, frame_length=ALIGN_N_FFT, hop_length=ALIGN_HOP
+        )[0],
+        y, ALIGN_HOP
+    )
+    return {
+        'chroma': chroma.astype(np.float32),
+        'pitches': pitches.astype(np.float32),
+        'energy': rms.astype(np.float32),
+    }
+
+
+def _unit_columns(X):
+    norms = np.linalg.norm(X, axis=0)
+    return X / np.where(norms > 0, norms, 1)
+
+
+def _downsample(X, factor):
+    n = X.shape[1]
+    pad = -n % factor
+    if pad:
+        X = np.pad(X, ((0, 0), (0, pad)), mode='edge')
+    return X.reshape(X.shape[0], -1, factor).mean(axis=2)
+
+
+def _shift(D, D_lo, lo, hi):
+    # D (known on columns D_lo..D_lo+len(D)) read on columns lo..hi
+    out = np.full(hi - lo, np.inf)
+    a = max(lo, D_lo)
+    b = min(hi, D_lo + len(D))
+    if a < b:
+        out[a - lo:b - lo] = D[a - D_lo:b - D_lo]
+    return out
+
+
+def banded_dtw(X, Y, lo, hi, subsequence=False):
+    """
+    DTW of X (d, N) against Y (d, M), both with unit-norm columns, using
+    cosine distance and only the columns lo[i]..hi[i] of each row i.
+    With subsequence=True, X may match any contiguous part of Y.
+    Returns the path as an (L, 2) array of (i, j) pairs and the cost of
+    every step on it.
+    """
+    N = X.shape[1]
+    steps = []
+    D = None
+    D_lo = 0
+    for i in range(N):
+        l, h = int(lo[i]), int(hi[i])
+        cost = 1.0 - Y[:, l:h].T @ X[:, i]
+        if i == 0:
+            if subsequence:
+                D = cost.astype(np.float64)
+                step = np.full(h - l, _START, dtype=np.int8)
+            else:
+                D = np.cumsum(cost, dtype=np.float64)
+                step = np.full(h - l, _LEFT, dtype=np.int8)
+                step[0] = _START
+        else:
+            up = _shift(D, D_lo, l, h)
+            diag = _shift(D, D_lo, l - 1, h - 1)
+            a = np.minimum(diag, up)
+            # D[j] = cost[j] + min(a[j], D[j - 1]) for the whole row at
+            # once: D = C + cummin(a - C_prev) with C the running cost.
+            C = np.cumsum(cost, dtype=np.float64)
+            t = a - (C - cost)
+            best = np.minimum.accumulate(t)
+            D = C + best
+            step = np.where(
+                t > best, _LEFT, np.where(up < diag, _UP, _DIAG)
+            ).astype(np.int8)
+        steps.append(step)
+        D_lo = l
+
+    if subsequence:
+        j = D_lo + int(np.argmin(D))
+    else:
+        j = int(hi[N - 1]) - 1
+    i = N - 1
+    path = [(i, j)]
+    while True:
+        s = steps[i][j - int(lo[i])]
+        if s == _START:
+            break
+        if s == _DIAG:
+            i, j = i - 1, j - 1
+        elif s == _UP:
+            i -= 1
+        else:
+            j -= 1
+        path.append((i, j))
+    path = np.array(path[::-1])
+    costs = 1.0 - np.einsum(
+        'dk,dk->k', X[:, path[:, 0]], Y[:, path[:, 1]]
+    )
+    return path, costs
+
+
+def _band_from_path(path, factor, N, M, radius):
+    lo = np.full(N, M, dtype=np.int64)
+    hi = np.zeros(N, dtype=np.int64)
+    # path cells are (row, column) of the coarser resolution
+    for ci, cj in path:
+        r0, r1 = ci * factor, min(N, (ci + 1) * factor)
+        c0 = max(0, (cj - radius) * factor)
+        c1 = min(M, (cj + 1 + radius) * factor)
+        lo[r0:r1] = np.minimum(lo[r0:r1], c0)
+        hi[r0:r1] = np.maximum(hi[r0:r1], c1)
+    width = 2 * radius * factor + 1
+    lo = minimum_filter1d(lo, width, mode='nearest')
+    hi = maximum_filter1d(hi, width, mode='nearest')
+    # keep the band monotonic so every row connects to the previous one
+    lo = np.minimum.accumulate(lo[::-1])[::-1]
+    hi = np.maximum.accumulate(hi)
+    return lo, hi
+
+
+def align(X, Y, max_cells=1_000_000, radius=1, subsequence=True):
+    """
+    Multi-resolution DTW: if the full N x M grid is over max_cells, align
+    downsampled sequences first and refine inside a band around the
+    projected coarse path.
+    """
+    N, M = X.shape[1], Y.shape[1]
+    if N * M <= max_cells:
+        lo = np.zeros(N, dtype=np.int64)
+        hi = np.full(N, M, dtype=np.int64)
+        return banded_dtw(X, Y, lo, hi, subsequence)
+    factor = math.ceil(math.sqrt(N * M / max_cells))
+    coarse_path, _ = align(
+        _unit_columns(_downsample(X, factor)),
+        _unit_columns(_downsample(Y, factor)),
+        max_cells, radius, subsequence
+    )
+    lo, hi = _band_from_path(coarse_path, factor, N, M, radius)
+    return banded_dtw(X, Y, lo, hi, subsequence)
+
+
+def _semitone_errors(stu_pitches, ref_pitches):
+    voiced = (stu_pitches > 0) & (ref_pitches > 0)
+    diff = 12 * np.log2(stu_pitches[voiced] / ref_pitches[voiced])
+    # fold octaves, trackers jump octaves far more often than students do
+    return np.abs((diff + 6) % 12 - 6)
+
+
+def _timing_score(deviation_percentage):
+    # same curve evaluate_performance uses for the tempo difference
+    return 100 * (1 / (1 + (deviation_percentage / 15) ** 2))
+
+
+def evaluate_alignment(ref_feats, stu_feats, segment_seconds=2.0,
+                       max_cells=1_000_000):
+    """
+    Align the student take to the reference and score it. Returns the
+    usual pitch/tempo/energy/similarity/overall scores plus a list of
+    per-segment pitch and timing deviations.
+    """
+    X = _unit_columns(stu_feats['chroma'])
+    Y = _unit_columns(ref_feats['chroma'])
+    if X.shape[1] < 2 or Y.shape[1] < 2:
+        raise ValueError('recording is too short to align')
+    path, costs = align(X, Y, max_cells=max_cells)
+    stu_idx, ref_idx = path[:, 0], path[:, 1]
+    frame_seconds = ALIGN_HOP / ALIGN_SR
+    start_offset = int(stu_idx[0]) - int(ref_idx[0])
+    errors = _semitone_errors(
+        stu_feats['pitches'][stu_idx], ref_feats['pitches'][ref_idx]
+    )
+
+    segment_frames = max(1, int(round(segment_seconds / frame_seconds)))
+    segments = []
+    for seg_start in range(int(ref_idx[0]), int(ref_idx[-1]) + 1,
+                           segment_frames):
+        seg_end = seg_start + segment_frames
+        in_seg = (ref_idx >= seg_start) & (ref_idx < seg_end)
+        if not in_seg.any():
+            continue
+        s_idx, r_idx = stu_idx[in_seg], ref_idx[in_seg]
+        ref_span = int(r_idx[-1] - r_idx[0]) + 1
+        stu_span = int(s_idx[-1] - s_idx[0]) + 1
+        seg_errors = _semitone_errors(
+            stu_feats['pitches'][s_idx], ref_feats['pitches'][r_idx]
+        )
+        segments.append({
+            'start': round(float(r_idx[0] * frame_seconds), 2),
+            'end': round(float((r_idx[-1] + 1) * frame_seconds), 2),
+            'timing_offset': round(float(
+                (int(s_idx[0]) - int(r_idx[0]) - start_offset) *
+                frame_seconds
+            ), 3),
+            'tempo_ratio': round(stu_span / ref_span, 3),
+            'pitch_deviation': round(float(np.median(seg_errors)), 2)
+            if len(seg_errors) else None,
+            'pitch_match': round(float(np.mean(seg_errors <= 0.5)), 3)
+            if len(seg_errors) else None,
+            'similarity': round(float(1 - np.mean(costs[in_seg])), 3),
+        })
+
+    results = {}
+    pitch_score = float(np.mean(errors <= 0.5)) * 100 if len(errors) else 0.0
+    results['pitch_score'] = round(pitch_score, 2)
+    deviations = [abs(seg['tempo_ratio'] - 1) * 100 for seg in segments]
+    tempo_score = float(np.mean([_timing_score(d) for d in deviations]))
+    results['tempo_score'] = round(tempo_score, 2)
+    energy_score = max(
+        0,
+        100 - abs(
+            float(np.mean(ref_feats['energy'])) -
+            float(np.mean(stu_feats['energy']))
+        ) * 1000
+    )
+    results['energy_score'] = round(float(energy_score), 2)
+    sim_score = round(float(1 - np.mean(costs)) * 100, 2)
+    results['similarity_score'] = sim_score
+    results['coverage'] = round(
+        float(ref_idx[-1] - ref_idx[0] + 1) / Y.shape[1], 3
+    )
+    final_score = (
+        (0.5 * results['pitch_score']) +
+        (0.15 * tempo_score) +
+        (0.15 * energy_score) +
+        (0.2 * sim_score)
+    )
+    results['overall_score'] = round(float(final_score), 2)
+    results['segments'] = segments
+    return results
@@ -0,0 +1,239 @@
+from functools import cached_property
+
+import librosa
+import numpy as np
+import scipy.fft
+
+
+class SpectralAnalysis:
+    """
+    Spectral front end for one recording. The STFT is computed once and
+    every spectral feature (MFCC, chroma, contrast, onset envelope for
+    tempo, harmonic part for tonnetz) is derived from it, instead of each
+    librosa.feature call recomputing its own spectrogram.
+
+    The parameters match librosa's defaults, so results are the same as
+    calling the individual librosa functions on the signal.
+    """
+
+    def __init__(self, y, sr, n_fft=2048, hop_length=512):
+        self.y = y
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+
+    @cached_property
+    def stft(self):
+        return librosa.stft(
+            self.y, n_fft=self.n_fft, hop_length=self.hop_length
+        )
+
+    @cached_property
+    def magnitude(self):
+        return np.abs(self.stft)
+
+    @cached_property
+    def power(self):
+        return self.magnitude ** 2
+
+    @cached_property
+    def log_mel(self):
+        mel = librosa.feature.melspectrogram(S=self.power, sr=self.sr)
+        return librosa.power_to_db(mel)
+
+    @cached_property
+    def rms(self):
+        # Time-domain RMS on the same frame grid as the STFT
+        return librosa.feature.rms(
+            y=self.y,
+            frame_length=self.n_fft,
+            hop_length=self.hop_length
+        )[0]
+
+    @cached_property
+    def onset_envelope(self):
+        # Same aggregation beat_track uses when given raw audio
+        return librosa.onset.onset_strength(
+            S=self.log_mel,
+            sr=self.sr,
+            hop_length=self.hop_length,
+            aggregate=np.median
+        )
+
+    @cached_property
+    def tempo(self):
+        tempo, _ = librosa.beat.beat_track(
+            onset_envelope=self.onset_envelope,
+            sr=self.sr,
+            hop_length=self.hop_length
+        )
+        return tempo
+
+    def mfcc(self, n_mfcc=20):
+        return librosa.feature.mfcc(S=self.log_mel, n_mfcc=n_mfcc)
+
+    def chroma(self):
+        return librosa.feature.chroma_stft(
+            S=self.power, sr=self.sr, hop_length=self.hop_length
+        )
+
+    def contrast(self):
+        return librosa.feature.spectral_contrast(
+            S=self.magnitude, sr=self.sr, hop_length=self.hop_length
+        )
+
+    def harmonic(self):
+        stft_harm = librosa.decompose.hpss(self.stft)[0]
+        return librosa.istft(
+            stft_harm,
+            dtype=self.y.dtype,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            length=self.y.shape[-1]
+        )
+
+    def tonnetz(self):
+        return librosa.feature.tonnetz(y=self.harmonic(), sr=self.sr)
+
+    def tonnetz_from_chroma(self, chroma=None):
+        # Tonal centroids of the STFT chroma, skipping HPSS and the CQT
+        if chroma is None:
+            chroma = self.chroma()
+        return librosa.feature.tonnetz(chroma=chroma)
+
+    def advanced_features(self, features=('mfccs', 'chroma', 'contrast',
+                                          'tonnetz')):
+        """
+        Time-averaged spectral features. `features` picks which ones are
+        computed, see exercise.profiles for the names.
+        """
+        frames = {}
+        if 'mfccs' in features:
+            frames['mfccs'] = self.mfcc()
+        if 'chroma' in features or 'tonnetz_chroma' in features:
+            frames['chroma'] = self.chroma()
+        if 'contrast' in features:
+            frames['contrast'] = self.contrast()
+        if 'tonnetz' in features:
+            frames['tonnetz'] = self.tonnetz()
+        if 'tonnetz_chroma' in features:
+            frames['tonnetz_chroma'] = self.tonnetz_from_chroma(
+                frames['chroma']
+            )
+        return {name: np.mean(frames[name], axis=1) for name in features}
+
+
+# ---------- pitch tracking ----------
+
+PIANO_FMIN = librosa.note_to_hz('C2')
+PIANO_FMAX = librosa.note_to_hz('C7')
+
+PITCH_BACKENDS = {}
+
+
+def register_pitch_backend(name):
+    """
+    Register fn(y, sr, fmin, fmax, hop_length=...) -> (pitches,
+    voiced_flag) under name, selectable per deployment with the
+    EXERCISE_PITCH_BACKEND setting.
+    """
+    def decorator(fn):
+        PITCH_BACKENDS[name] = fn
+        return fn
+    return decorator
+
+
+def track_pitch(y, sr, backend='yin', fmin=PIANO_FMIN, fmax=PIANO_FMAX,
+                **kwargs):
+    try:
+        fn = PITCH_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f'unknown pitch backend {backend!r}')
+    return fn(y, sr, fmin, fmax, **kwargs)
+
+
+@register_pitch_backend('yin')
+def yin_pitch(y, sr, fmin, fmax, hop_length=512):
+    pitches = librosa.yin(
+        y, fmin=fmin, fmax=fmax, sr=sr, hop_length=hop_length
+    )
+    return pitches, pitches > 0
+
+
+@register_pitch_backend('yin_coarse')
+def coarse_yin_pitch(y, sr, fmin, fmax, hop_length=1024):
+    # Half the frames of the default hop, roughly half the cost
+    pitches = librosa.yin(
+        y, fmin=fmin, fmax=fmax, sr=sr, hop_length=hop_length
+    )
+    return pitches, pitches > 0
+
+
+@register_pitch_backend('autocorr')
+def autocorr_pitch(y, sr, fmin, fmax, frame_length=1024, hop_length=512,
+                   threshold=0.3, octave_tolerance=0.9):
+    """
+    Normalized autocorrelation tracker computed for all frames at once
+    through one batched float32 FFT. The pitch period is the shortest lag
+    whose autocorrelation peak comes within octave_tolerance of the
+    strongest peak in the fmin..fmax lag range, which avoids sub-octave
+    errors. Frames whose best peak is below threshold are unvoiced
+    (pitch 0). 1024-sample frames still hold three periods of C2.
+    """
+    y = np.pad(np.asarray(y, dtype=np.float32), frame_length // 2)
+    # one frame per row, so the FFTs run over contiguous memory
+    frames = librosa.util.frame(
+        y, frame_length=frame_length, hop_length=hop_length
+    ).T
+    return autocorr_frames_pitch(
+        frames, sr, fmin, fmax, threshold, octave_tolerance
+    )
+
+
+def autocorr_frames_pitch(frames, sr, fmin, fmax, threshold=0.3,
+                          octave_tolerance=0.9):
+    """autocorr_pitch on frames that are already cut, one per row."""
+    frame_length = frames.shape[1]
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    n_fft = 2 * frame_length
+    spectrum = scipy.fft.rfft(frames, n=n_fft, axis=-1)
+    acf = scipy.fft.irfft(
+        spectrum.real ** 2 + spectrum.imag ** 2, n=n_fft, axis=-1
+    )
+
+    min_lag = max(1, int(np.floor(sr / fmax)))
+    max_lag = min(frame_length - 2, int(np.ceil(sr / fmin)))
+    # one extra lag on each side so every candidate has two neighbours
+    window = acf[:, min_lag - 1:max_lag + 2]
+    energy = acf[:, :1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nacf = np.where(energy > 0, window / energy, 0.0)
+    mid = nacf[:, 1:-1]
+    peaks = (mid >= nacf[:, :-2]) & (mid > nacf[:, 2:])
+    peak_values = np.where(peaks, mid, -np.inf)
+    best = peak_values.max(axis=1)
+    candidates = peak_values >= octave_tolerance * best[:, None]
+    idx = np.argmax(candidates, axis=1)
+
+    # parabolic interpolation around the chosen lag
+    rows = np.arange(len(idx))
+    a = nacf[rows, idx]
+    b = nacf[rows, idx + 1]
+    c = nacf[rows, idx + 2]
+    denom = a - 2 * b + c
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(denom != 0, 0.5 * (a - c) / denom, 0.0)
+    lag = min_lag + idx + np.clip(shift, -0.5, 0.5)
+
+    voiced_flag = np.isfinite(best) & (best >= threshold)
+    pitches = np.where(voiced_flag, sr / lag, 0.0)
+    return pitches, voiced_flag
+
+
+@register_pitch_backend('pyin')
+def pyin_pitch(y, sr, fmin, fmax, hop_length=512):
+    # Much slower than YIN, meant for offline re-scoring
+    f0, voiced_flag, _ = librosa.pyin(
+        y, fmin=fmin, fmax=fmax, sr=sr, hop_length=hop_length
+    )
+    return np.nan_to_num(f0), voiced_flag
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ExerciseConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "exercise"
+
+    def ready(self):
+        from .warmup import configure_jit_cache, serving, start_warmup
+
+        # before librosa is imported, so its kernels load from disk
+        configure_jit_cache(settings.EXERCISE_JIT_CACHE_DIR)
+        if settings.EXERCISE_WARMUP_ON_STARTUP and serving():
+            start_warmup()
@@ -0,0 +1,515 @@
+"""
+Benchmarks for the exercise scoring pipeline, run through
+`manage.py benchmark_exercise`. Every suite returns a list of row dicts.
+"""
+import io
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import librosa
+import numpy as np
+import soundfile as sf
+from scipy.signal import butter, filtfilt
+from scipy.spatial.distance import cosine
+from threadpoolctl import threadpool_limits
+
+from . import synthetic
+from .alignment import evaluate_alignment, extract_alignment_features
+from .analysis import PITCH_BACKENDS, SpectralAnalysis, track_pitch
+from .profiles import SCORING_PROFILES, SPECTRAL_FEATURES
+from .tiered import TierStats
+from .windowed import analyze_windowed
+from .views import (
+    evaluate_performance, extract_pitch, load_and_extract_features_from_array,
+    load_features_from_bytes, load_reference_features, pitch_histogram,
+    preprocess_audio, score_tiered
+)
+
+
+def measure(fn, *args, repeat=3):
+    """
+    Best wall time over repeat runs, plus peak traced memory of one run.
+    Returns (seconds, peak_bytes, result).
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def piano_signals():
+    yield 'scale 8s @22.05k', synthetic.piano_sequence(
+        synthetic.c_major_scale(), sr=22050
+    ), 22050
+    yield 'scale 8s @44.1k', synthetic.piano_sequence(
+        synthetic.c_major_scale(), sr=44100
+    ), 44100
+    yield 'chords 60s @44.1k', synthetic.piano_sequence(
+        synthetic.chord_progression(repeats=15), sr=44100, note_seconds=1.0
+    ), 44100
+
+
+def legacy_preprocess_audio(y, sr, target_sr=22050):
+    # preprocess_audio as it was before SOS filters and float32 buffers
+    if y.ndim > 1:
+        y = librosa.to_mono(y)
+    if sr != target_sr:
+        y = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
+        sr = target_sr
+    nyq = 0.5 * sr
+    b, a = butter(4, [80 / nyq, 4000 / nyq], btype='band')
+    y = filtfilt(b, a, y)
+    y, _ = librosa.effects.trim(y, top_db=20)
+    y = librosa.util.normalize(y)
+    max_len = 60000
+    if len(y) < max_len:
+        y = np.pad(y, (0, max_len - len(y)))
+    else:
+        y = y[:max_len]
+    return y, sr
+
+
+def _yin(y):
+    return librosa.yin(
+        y, fmin=librosa.note_to_hz('C2'), fmax=librosa.note_to_hz('C7')
+    )
+
+
+def benchmark_preprocess(repeat=3):
+    rows = []
+    for name, y, sr in piano_signals():
+        old_t, old_mem, (old_y, _) = measure(
+            legacy_preprocess_audio, y, sr, repeat=repeat
+        )
+        new_t, new_mem, (new_y, _) = measure(
+            preprocess_audio, y, sr, repeat=repeat
+        )
+        pitch_sim = 1 - cosine(
+            pitch_histogram(_yin(old_y)), pitch_histogram(_yin(new_y))
+        )
+        rows.append({
+            'signal': name,
+            'old_ms': round(old_t * 1000, 1),
+            'new_ms': round(new_t * 1000, 1),
+            'old_peak_mb': round(old_mem / 2 ** 20, 1),
+            'new_peak_mb': round(new_mem / 2 ** 20, 1),
+            'max_abs_diff': f'{np.max(np.abs(old_y - new_y)):.1e}',
+            'pitch_hist_sim': round(float(pitch_sim), 4),
+            'dtype': str(new_y.dtype),
+        })
+    return rows
+
+
+def pitch_signals():
+    yield 'scale', synthetic.c_major_scale()
+    yield 'low scale', synthetic.c_major_scale(root=36)
+    yield 'chords', synthetic.chord_progression()
+    yield 'melody+rests', [60, None, 64, 67, None, 72, 71, None, 67, 64]
+
+
+def _truth_histogram(notes):
+    midi = [
+        m for item in notes if item is not None
+        for m in (item if isinstance(item, tuple) else (item,))
+    ]
+    return pitch_histogram(librosa.midi_to_hz(np.array(midi, dtype=float)))
+
+
+def benchmark_pitch(repeat=3, sr=22050):
+    """
+    Cost of every registered pitch backend, and how well its pitch
+    histogram agrees with the default YIN and with the notes played.
+    """
+    rows = []
+    for name, notes in pitch_signals():
+        y = synthetic.piano_sequence(notes, sr=sr)
+        truth = _truth_histogram(notes)
+        baseline = pitch_histogram(track_pitch(y, sr, 'yin')[0])
+        for backend in PITCH_BACKENDS:
+            # pYIN takes seconds per run, one timing is enough
+            runs = 1 if backend == 'pyin' else repeat
+            seconds, _, (pitches, _) = measure(
+                track_pitch, y, sr, backend, repeat=runs
+            )
+            hist = pitch_histogram(pitches)
+            rows.append({
+                'signal': name,
+                'backend': backend,
+                'ms': round(seconds * 1000, 1),
+                'frames_per_sec': int(len(pitches) / seconds),
+                'agree_yin': round(float(1 - cosine(baseline, hist)), 4),
+                'agree_truth': round(float(1 - cosine(truth, hist)), 4),
+            })
+    return rows
+
+
+def benchmark_alignment(repeat=1, sr=22050):
+    """
+    Alignment scoring of long takes: the student plays the reference
+    10% slower with every 25th note wrong.
+    """
+    rows = []
+    for minutes in (1, 5):
+        n_notes = int(minutes * 60 / 0.5)
+        scale = synthetic.c_major_scale()
+        notes = [scale[i % len(scale)] for i in range(n_notes)]
+        wrong = [n + 1 if i % 25 == 0 else n for i, n in enumerate(notes)]
+        ref_y = synthetic.piano_sequence(notes, sr=sr)
+        stu_y = synthetic.piano_sequence(
+            wrong, sr=sr, note_seconds=0.55, seed=1
+        )
+        extract_t, extract_mem, ref_feats = measure(
+            extract_alignment_features, ref_y, sr, repeat=repeat
+        )
+        stu_feats = extract_alignment_features(stu_y, sr)
+        align_t, align_mem, result = measure(
+            evaluate_alignment, ref_feats, stu_feats, repeat=repeat
+        )
+        n, m = stu_feats['chroma'].shape[1], ref_feats['chroma'].shape[1]
+        rows.append({
+            'minutes': minutes,
+            'frames': f'{n}x{m}',
+            'full_dtw_mb': round(n * m * 9 / 2 ** 20, 1),
+            'extract_ms': round(extract_t * 1000, 1),
+            'extract_peak_mb': round(extract_mem / 2 ** 20, 1),
+            'align_ms': round(align_t * 1000, 1),
+            'align_peak_mb': round(align_mem / 2 ** 20, 1),
+            'pitch_score': result['pitch_score'],
+            'tempo_ratio': round(float(np.median(
+                [seg['tempo_ratio'] for seg in result['segments']]
+            )), 3),
+            'overall': result['overall_score'],
+        })
+    return rows
+
+
+def _wav_bytes(y, sr):
+    buf = io.BytesIO()
+    sf.write(buf, y, sr, format='WAV')
+    return buf.getvalue()
+
+
+def tiered_takes(sr=22050):
+    yield 'same piece', synthetic.piano_sequence(
+        synthetic.c_major_scale(), sr=sr, noise=1e-2, seed=1
+    )
+    yield 'same key, other piece', synthetic.piano_sequence(
+        synthetic.chord_progression(), sr=sr
+    )
+    yield 'other key', synthetic.piano_sequence(
+        synthetic.c_major_scale(root=66), sr=sr
+    )
+    yield 'chromatic run', synthetic.piano_sequence(
+        list(range(60, 76)), sr=sr
+    )
+    yield 'silence', np.zeros(8 * sr, dtype=np.float32)
+    yield '1 s clip', synthetic.piano_sequence([60, 62], sr=sr)[:sr]
+
+
+def benchmark_tiered(repeat=1, sr=22050):
+    """
+    Tiered against untiered summary scoring of a C major scale
+    reference, over a mix of matching and obviously wrong takes.
+    """
+    ref_data = _wav_bytes(
+        synthetic.piano_sequence(synthetic.c_major_scale(), sr=sr), sr
+    )
+    # warm the reference caches so both paths only pay for the student
+    score_tiered(ref_data, ref_data, stats=TierStats())
+    load_reference_features(ref_data)
+    stats = TierStats()
+    rows = []
+    for name, y in tiered_takes(sr):
+        data = _wav_bytes(y, sr)
+        tiered = score_tiered(ref_data, data, stats=stats)
+        full_t, _, full = measure(
+            lambda: evaluate_performance(
+                load_reference_features(ref_data),
+                load_features_from_bytes(data)
+            ),
+            repeat=repeat
+        )
+        rows.append({
+            'take': name,
+            'early_exit': tiered['early_exit'] or '-',
+            'coarse_ms': tiered['tiers']['coarse_ms'],
+            'full_ms': tiered['tiers'].get('full_ms', '-'),
+            'untiered_ms': round(full_t * 1000, 1),
+            'tiered_overall': tiered['overall_score'],
+            'untiered_overall': full['overall_score'],
+        })
+    summary = stats.summary()
+    rows.append({
+        'take': 'all',
+        'early_exit': f"rate {summary['early_exit_rate']}",
+        'coarse_ms': summary['coarse_ms'],
+        'full_ms': summary['full_ms'],
+        'untiered_ms': round(
+            float(np.mean([row['untiered_ms'] for row in rows])), 1
+        ),
+        'tiered_overall': '-',
+        'untiered_overall': f"cpu saved {summary['cpu_saved']}",
+    })
+    return rows
+
+
+def benchmark_windowed(repeat=1, sr=22050):
+    """
+    Whole-signal against windowed feature extraction of a two minute
+    take, with the windows on process pools of different sizes.
+    """
+    notes = [
+        synthetic.c_major_scale()[i % 15] if i % 3
+        else synthetic.chord_progression()[i % 8]
+        for i in range(240)
+    ]
+    y = synthetic.piano_sequence(notes, sr=sr)
+    single_t, _, single = measure(
+        SpectralAnalysis(y, sr).advanced_features, repeat=repeat
+    )
+    rows = [{
+        'workers': 'single',
+        'ms': round(single_t * 1000, 1),
+        'speedup': 1.0,
+        'max_rel_diff': '-',
+    }]
+    for workers in (1, 2, 4):
+        with ProcessPoolExecutor(workers) as executor:
+            windowed_t, _, tracks = measure(
+                analyze_windowed, y, sr, executor, repeat=repeat
+            )
+        diff = max(
+            float(np.max(np.abs(
+                np.mean(tracks[track], axis=1) - single[name]
+            )) / np.max(np.abs(single[name])))
+            for name, track in (
+                ('mfccs', 'mfcc'), ('chroma', 'chroma'),
+                ('contrast', 'contrast'), ('tonnetz', 'tonnetz')
+            )
+        )
+        rows.append({
+            'workers': workers,
+            'ms': round(windowed_t * 1000, 1),
+            'speedup': round(single_t / windowed_t, 2),
+            'max_rel_diff': f'{diff:.1e}',
+        })
+    return rows
+
+
+def benchmark_concurrent(repeat=3, sr=22050):
+    """
+    Wall and CPU time of extracting a reference and a student take one
+    after the other against side by side on a thread pool, with BLAS
+    capped to share the cores between the two.
+    """
+    ref = synthetic.piano_sequence(synthetic.c_major_scale(), sr=sr)
+    take = synthetic.piano_sequence(
+        synthetic.c_major_scale(), sr=sr, noise=1e-2, seed=1
+    )
+
+    def serial():
+        return [load_and_extract_features_from_array(y, sr)
+                for y in (take, ref)]
+
+    def concurrent(executor):
+        futures = [
+            executor.submit(load_and_extract_features_from_array, y, sr)
+            for y in (take, ref)
+        ]
+        return [future.result() for future in futures]
+
+    def timed(fn, *args):
+        cpu = time.process_time()
+        seconds, _, _ = measure(fn, *args, repeat=repeat)
+        # CPU time per run; above the wall time means the two overlapped
+        return seconds, (time.process_time() - cpu) / (repeat + 1)
+
+    serial_t, serial_cpu = timed(serial)
+    rows = [{
+        'mode': 'serial',
+        'wall_ms': round(serial_t * 1000, 1),
+        'cpu_ms': round(serial_cpu * 1000, 1),
+        'speedup': 1.0,
+    }]
+    blas = max(1, (os.cpu_count() or 1) // 2)
+    with threadpool_limits(limits=blas, user_api='blas'), \
+            ThreadPoolExecutor(2) as executor:
+        concurrent_t, concurrent_cpu = timed(concurrent, executor)
+    rows.append({
+        'mode': f'2 threads, blas={blas}',
+        'wall_ms': round(concurrent_t * 1000, 1),
+        'cpu_ms': round(concurrent_cpu * 1000, 1),
+        'speedup': round(serial_t / concurrent_t, 2),
+    })
+    return rows
+
+
+def profile_takes(sr=22050):
+    """Reference plus matching and mismatching takes, as (name, y, match)."""
+    scale = synthetic.c_major_scale()
+    ref = synthetic.piano_sequence(scale, sr=sr)
+    takes = [
+        ('same, noisy', synthetic.piano_sequence(
+            scale, sr=sr, noise=1e-2, seed=1
+        ), True),
+        ('same, 10% slower', synthetic.piano_sequence(
+            scale, sr=sr, note_seconds=0.55, seed=2
+        ), True),
+        ('same, wrong notes', synthetic.piano_sequence(
+            [n + 1 if i % 4 == 0 else n for i, n in enumerate(scale)],
+            sr=sr, seed=3
+        ), True),
+        ('chords', synthetic.piano_sequence(
+            synthetic.chord_progression(), sr=sr
+        ), False),
+        ('other key', synthetic.piano_sequence(
+            synthetic.c_major_scale(root=66), sr=sr
+        ), False),
+        ('chromatic', synthetic.piano_sequence(
+            list(range(60, 76)), sr=sr
+        ), False),
+    ]
+    return ref, takes
+
+
+def _component_points(ref_feats, stu_feats, profile):
+    """Points each feature adds to the overall score under profile."""
+    result = evaluate_performance(ref_feats, stu_feats, profile.name)
+    share = profile.similarity_weight / len(profile.similarity)
+    points = {
+        'pitch': profile.pitch_weight * result['pitch_score'],
+        'tempo': profile.tempo_weight * result['tempo_score'],
+        'energy': profile.energy_weight * result['energy_score'],
+    }
+    for name in profile.similarity:
+        sim = 1 - cosine(ref_feats[name], stu_feats[name])
+        points[name] = share * sim * 100
+    return points
+
+
+def benchmark_feature_cost(repeat=3, sr=22050):
+    """
+    CPU cost of every feature on an 8 s take, next to how many points
+    it adds to the overall score (full profile; tonnetz_chroma under
+    balanced) and how well those points separate matching takes from
+    other pieces.
+    """
+    ref, takes = profile_takes(sr)
+    y = takes[0][1]
+    S = SpectralAnalysis(y, sr).stft
+
+    def analysis():
+        # fresh analysis with the shared STFT already computed
+        a = SpectralAnalysis(y, sr)
+        a.__dict__['stft'] = S
+        return a
+
+    costs = {
+        'stft (shared)': measure(
+            lambda: SpectralAnalysis(y, sr).stft, repeat=repeat
+        )[0],
+        'pitch': measure(extract_pitch, y, sr, repeat=repeat)[0],
+        'energy': measure(lambda: analysis().rms, repeat=repeat)[0],
+        'tempo': measure(lambda: analysis().tempo, repeat=repeat)[0],
+        'mfccs': measure(lambda: analysis().mfcc(), repeat=repeat)[0],
+        'chroma': measure(lambda: analysis().chroma(), repeat=repeat)[0],
+        'contrast': measure(lambda: analysis().contrast(), repeat=repeat)[0],
+        'tonnetz': measure(lambda: analysis().tonnetz(), repeat=repeat)[0],
+        'tonnetz_chroma': measure(
+            lambda: analysis().tonnetz_from_chroma(), repeat=repeat
+        )[0],
+    }
+
+    ref_feats = load_and_extract_features_from_array(
+        ref, sr, features=SPECTRAL_FEATURES
+    )
+    points = {True: [], False: []}
+    for _, take, match in takes:
+        stu_feats = load_and_extract_features_from_array(
+            take, sr, features=SPECTRAL_FEATURES
+        )
+        full = _component_points(
+            ref_feats, stu_feats, SCORING_PROFILES['full']
+        )
+        balanced = _component_points(
+            ref_feats, stu_feats, SCORING_PROFILES['balanced']
+        )
+        full['tonnetz_chroma'] = balanced['tonnetz_chroma']
+        points[match].append(full)
+
+    rows = []
+    for name, seconds in costs.items():
+        row = {'feature': name, 'cpu_ms': round(seconds * 1000, 1)}
+        if name in points[True][0]:
+            matching = np.mean([p[name] for p in points[True]])
+            other = np.mean([p[name] for p in points[False]])
+            row['points_matching'] = round(float(matching), 2)
+            row['points_other'] = round(float(other), 2)
+            row['separation'] = round(float(matching - other), 2)
+        else:
+            row.update(points_matching='-', points_other='-', separation='-')
+        rows.append(row)
+    return rows
+
+
+def benchmark_profiles(repeat=3, sr=22050):
+    """
+    Student extraction cost and overall scores of every scoring profile,
+    with the largest change against the full profile.
+    """
+    ref, takes = profile_takes(sr)
+    ref_feats = load_and_extract_features_from_array(
+        ref, sr, features=SPECTRAL_FEATURES
+    )
+    full_scores = None
+    rows = []
+    for profile in SCORING_PROFILES.values():
+        seconds, _, _ = measure(
+            load_and_extract_features_from_array, takes[0][1], sr, False,
+            profile.similarity, repeat=repeat
+        )
+        scores = {True: [], False: []}
+        overall = []
+        for _, take, match in takes:
+            stu_feats = load_and_extract_features_from_array(
+                take, sr, features=profile.similarity
+            )
+            score = evaluate_performance(
+                ref_feats, stu_feats, profile.name
+            )['overall_score']
+            scores[match].append(score)
+            overall.append(score)
+        if full_scores is None:
+            full_scores = overall
+        rows.append({
+            'profile': profile.name,
+            'extract_ms': round(seconds * 1000, 1),
+            'overall_matching': round(float(np.mean(scores[True])), 2),
+            'overall_other': round(float(np.mean(scores[False])), 2),
+            'max_diff_vs_full': round(float(np.max(np.abs(
+                np.subtract(overall, full_scores)
+            ))), 2),
+        })
+    return rows
+
+
+SUITES = {
+    'preprocess': benchmark_preprocess,
+    'pitch': benchmark_pitch,
+    'alignment': benchmark_alignment,
+    'tiered': benchmark_tiered,
+    'windowed': benchmark_windowed,
+    'concurrent': benchmark_concurrent,
+    'feature_cost': benchmark_feature_cost,
+    'profiles': benchmark_profiles,
+}
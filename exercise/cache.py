@@ -0,0 +1,141 @@
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from .features import FeatureRecord
+
+
+class FeatureCache:
+    """
+    On-disk cache of extracted audio features, one compressed .npz
+    archive or serialized FeatureRecord per recording, keyed by the
+    content hash of the audio bytes and the feature pipeline version.
+    Least recently used entries are evicted once the directory grows
+    past max_bytes.
+    """
+
+    suffix = '.npz'
+    record_suffix = '.rec'
+
+    def __init__(self, directory, max_bytes, version):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.version = version
+
+    def key(self, data, kind=None):
+        digest = hashlib.sha256(data).hexdigest()
+        if kind:
+            return f'v{self.version}-{kind}-{digest}'
+        return f'v{self.version}-{digest}'
+
+    def _path(self, key, suffix=None):
+        return os.path.join(self.directory, key + (suffix or self.suffix))
+
+    @staticmethod
+    def _touch(path):
+        try:
+            # bump mtime so eviction sees this entry as recently used
+            os.utime(path)
+        except OSError:
+            pass
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as archive:
+                feats = {name: archive[name] for name in archive.files}
+        except (OSError, ValueError):
+            # missing or unreadable entry, treat as a miss
+            return None
+        self._touch(path)
+        if 'sr' in feats:
+            feats['sr'] = int(feats['sr'])
+        return feats
+
+    def set(self, key, feats):
+        os.makedirs(self.directory, exist_ok=True)
+        arrays = {
+            name: np.asarray(value)
+            for name, value in feats.items()
+            if name != 'y'  # raw audio is never needed for scoring
+        }
+        self._write(
+            self._path(key), lambda f: np.savez_compressed(f, **arrays)
+        )
+
+    def get_record(self, key):
+        path = self._path(key, self.record_suffix)
+        try:
+            with open(path, 'rb') as f:
+                record = FeatureRecord.from_bytes(f.read())
+        except OSError:
+            return None
+        except ValueError:
+            # corrupt entry, drop it so it is rewritten on the next set
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        self._touch(path)
+        return record
+
+    def set_record(self, key, record):
+        os.makedirs(self.directory, exist_ok=True)
+        data = record.to_bytes()
+        self._write(
+            self._path(key, self.record_suffix), lambda f: f.write(data)
+        )
+
+    def _write(self, path, write):
+        fd, tmp_path = tempfile.mkstemp(
+            dir=self.directory, suffix='.tmp'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                write(tmp)
+            # atomic rename, concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith((self.suffix, self.record_suffix)):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith((self.suffix, self.record_suffix)):
+                os.remove(os.path.join(self.directory, name))
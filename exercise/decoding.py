@@ -0,0 +1,73 @@
+import io
+import tempfile
+
+import audioread
+import librosa
+import numpy as np
+import soundfile as sf
+
+
+class AudioTooLongError(ValueError):
+    pass
+
+
+def _check_duration(duration, max_duration):
+    if max_duration and duration and duration > max_duration:
+        raise AudioTooLongError(
+            f'recording is {duration:.0f}s long, '
+            f'the limit is {max_duration:.0f}s'
+        )
+
+
+def decode_audio(data, max_seconds=None, max_duration=None):
+    """
+    Decode uploaded audio bytes to a mono float32 signal at its native
+    sample rate, like librosa.load(..., sr=None), but stop reading after
+    max_seconds. Files whose header says they are longer than
+    max_duration are rejected before any samples are decoded.
+    """
+    try:
+        return _decode_soundfile(data, max_seconds, max_duration)
+    except sf.SoundFileRuntimeError:
+        # not a format libsndfile understands, let audioread try
+        return _decode_audioread(data, max_seconds, max_duration)
+
+
+def _decode_soundfile(data, max_seconds, max_duration):
+    with sf.SoundFile(io.BytesIO(data)) as f:
+        sr = f.samplerate
+        if f.frames > 0:
+            _check_duration(f.frames / sr, max_duration)
+        frames = -1 if max_seconds is None else int(max_seconds * sr)
+        # only the requested span is read from the stream
+        y = f.read(frames=frames, dtype='float32', always_2d=False).T
+    return librosa.to_mono(y), sr
+
+
+def _decode_audioread(data, max_seconds, max_duration):
+    # audioread backends need a real file to hand to ffmpeg/gstreamer
+    with tempfile.NamedTemporaryFile() as tmp:
+        tmp.write(data)
+        tmp.flush()
+        with audioread.audio_open(tmp.name) as f:
+            _check_duration(f.duration, max_duration)
+            sr = f.samplerate
+            channels = f.channels
+            limit = None
+            if max_seconds is not None:
+                limit = int(max_seconds * sr) * channels
+            blocks = []
+            n = 0
+            for buf in f:
+                block = librosa.util.buf_to_float(buf, dtype=np.float32)
+                blocks.append(block)
+                n += len(block)
+                if limit is not None and n >= limit:
+                    break
+    if blocks:
+        y = np.concatenate(blocks)[:limit]
+    else:
+        y = np.zeros(0, dtype=np.float32)
+    if channels > 1:
+        y = librosa.to_mono(y.reshape((-1, channels)).T)
+    return y, sr
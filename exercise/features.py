@@ -0,0 +1,154 @@
+"""
+Compact record of the features one recording is scored on. Only what
+evaluate_performance needs is kept: no raw audio, float32 arrays, and a
+plain binary layout that round-trips exactly.
+"""
+import json
+import struct
+from dataclasses import dataclass, field
+from typing import ClassVar
+
+import numpy as np
+
+_MAGIC = b'PNFR'
+_HEADER = struct.Struct('<4sI')
+
+
+@dataclass(slots=True)
+class FeatureRecord:
+    """
+    Pitch track, energy, tempo and averaged spectral features of one
+    recording, plus optional frame-level tracks kept for library
+    references. Indexing by name (record['chroma']) works like the
+    feature dicts it replaces.
+    """
+
+    SCHEMA_VERSION: ClassVar[int] = 1
+    TRACKS: ClassVar[tuple] = ('pitches', 'voiced_flag', 'energy')
+
+    sr: int
+    tempo: float
+    pitches: np.ndarray
+    voiced_flag: np.ndarray
+    energy: np.ndarray
+    spectral: dict = field(default_factory=dict)
+    frames: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.sr = int(self.sr)
+        self.tempo = float(np.float32(np.ravel(self.tempo)[0]))
+        self.pitches = _float32(self.pitches)
+        self.voiced_flag = np.asarray(self.voiced_flag, dtype=bool)
+        self.energy = _float32(self.energy)
+        self.spectral = {
+            name: _float32(value) for name, value in self.spectral.items()
+        }
+        self.frames = {
+            name: _float32(value) for name, value in self.frames.items()
+        }
+
+    def __getitem__(self, name):
+        if name in ('sr', 'tempo') or name in self.TRACKS:
+            return getattr(self, name)
+        if name in self.spectral:
+            return self.spectral[name]
+        try:
+            return self.frames[name]
+        except KeyError:
+            raise KeyError(name) from None
+
+    def __contains__(self, name):
+        return (
+            name in ('sr', 'tempo') or name in self.TRACKS or
+            name in self.spectral or name in self.frames
+        )
+
+    def keys(self):
+        return [
+            'sr', 'tempo', *self.TRACKS, *self.spectral, *self.frames
+        ]
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+    def _arrays(self):
+        return [
+            *((name, getattr(self, name)) for name in self.TRACKS),
+            *(('spectral.' + name, v) for name, v in self.spectral.items()),
+            *(('frames.' + name, v) for name, v in self.frames.items()),
+        ]
+
+    @property
+    def nbytes(self):
+        return sum(value.nbytes for _, value in self._arrays())
+
+    def to_bytes(self):
+        """
+        Magic, header length, a JSON header describing each array, then
+        the raw array buffers back to back.
+        """
+        arrays = self._arrays()
+        header = json.dumps({
+            'schema': self.SCHEMA_VERSION,
+            'sr': self.sr,
+            'tempo': self.tempo,
+            'arrays': [
+                [name, value.dtype.str, list(value.shape)]
+                for name, value in arrays
+            ],
+        }).encode()
+        return b''.join([
+            _HEADER.pack(_MAGIC, len(header)), header,
+            *(np.ascontiguousarray(value).tobytes() for _, value in arrays),
+        ])
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Inverse of to_bytes. Arrays are read-only views into data. Raises
+        ValueError for anything that is not a record of this schema.
+        """
+        data = memoryview(data)
+        try:
+            magic, length = _HEADER.unpack_from(data)
+            offset = _HEADER.size + length
+            header = json.loads(bytes(data[_HEADER.size:offset]))
+        except (struct.error, ValueError) as e:
+            raise ValueError(f"not a feature record: {e}") from None
+        if magic != _MAGIC or not isinstance(header, dict):
+            raise ValueError("not a feature record")
+        if header.get('schema') != cls.SCHEMA_VERSION:
+            raise ValueError(
+                f"feature record schema {header.get('schema')}, "
+                f"expected {cls.SCHEMA_VERSION}"
+            )
+        try:
+            return cls._from_header(header, data, offset)
+        except (KeyError, TypeError, ValueError) as e:
+            # truncated buffers or a damaged header
+            raise ValueError(f"corrupt feature record: {e!r}") from None
+
+    @classmethod
+    def _from_header(cls, header, data, offset):
+        values = {'spectral': {}, 'frames': {}}
+        for name, dtype, shape in header['arrays']:
+            dtype = np.dtype(dtype)
+            count = int(np.prod(shape))
+            value = np.frombuffer(
+                data, dtype=dtype, count=count, offset=offset
+            ).reshape(shape)
+            offset += count * dtype.itemsize
+            group, _, key = name.rpartition('.')
+            if group:
+                values[group][key] = value
+            else:
+                values[name] = value
+        return cls(sr=header['sr'], tempo=header['tempo'], **values)
+
+    def __reduce__(self):
+        # ship records between processes in the compact layout
+        return (FeatureRecord.from_bytes, (self.to_bytes(),))
+
+
+def _float32(value):
+    return np.asarray(value, dtype=np.float32)
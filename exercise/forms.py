@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from bson import ObjectId
 from .models import Exercise
 
@@ -18,6 +19,31 @@ class AudioUploadForm(forms.Form):
             attrs={'accept': 'audio/*', 'id': 'id_user_audio'}
         )
     )
+    scoring_mode = forms.ChoiceField(
+        label='روش ارزیابی',
+        required=False,
+        choices=[
+            ('summary', 'سریع'),
+            ('alignment', 'کامل (هم‌ترازی با قطعه مرجع)'),
+        ]
+    )
+
+    scoring_profile = forms.ChoiceField(
+        label='پروفایل امتیازدهی',
+        required=False,
+        choices=[
+            ('fast', 'سریع'),
+            ('balanced', 'متعادل'),
+            ('full', 'کامل'),
+        ]
+    )
+
+    def clean_scoring_mode(self):
+        return self.cleaned_data.get('scoring_mode') or 'summary'
+
+    def clean_scoring_profile(self):
+        return self.cleaned_data.get('scoring_profile') or \
+            settings.EXERCISE_SCORING_PROFILE
 
 
 class ExerciseCreateForm(forms.ModelForm):
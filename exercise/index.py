@@ -0,0 +1,134 @@
+"""
+In-process nearest-neighbour index over reference embeddings, used to
+suggest which library reference a student take belongs to.
+"""
+import itertools
+import threading
+
+import numpy as np
+
+# averaged features making up an embedding, in order; mfcc[0] is
+# dropped since it mostly tracks loudness
+EMBEDDING_BLOCKS = (
+    ('mfccs', slice(1, None)),
+    ('chroma', slice(None)),
+    ('contrast', slice(None)),
+    ('tonnetz', slice(None)),
+)
+EMBEDDING_DIM = 19 + 12 + 7 + 6
+
+
+def _unit(v):
+    norm = np.linalg.norm(v, axis=-1, keepdims=True)
+    return v / np.where(norm > 0, norm, 1)
+
+
+def reference_embedding(feats):
+    """
+    Embedding of averaged spectral features (as produced by
+    extract_advanced_features). Each block is centered and normalized on
+    its own so no feature family dominates the cosine by scale alone.
+    """
+    blocks = []
+    for name, part in EMBEDDING_BLOCKS:
+        block = np.asarray(feats[name], dtype=np.float32)[part]
+        blocks.append(_unit(block - block.mean()))
+    return _unit(np.concatenate(blocks))
+
+
+class ReferenceIndex:
+    """
+    Cosine search over unit-normalized embeddings kept in one growing
+    NumPy matrix. Small libraries are searched exhaustively with a
+    single matrix-vector product. Once the index holds ivf_threshold
+    vectors it trains an IVF coarse quantizer (spherical k-means) and
+    only scans the n_probe closest lists per query. New vectors are
+    appended and assigned to their nearest list without retraining.
+    """
+
+    def __init__(self, dim, ivf_threshold=4096, n_probe=8):
+        self.dim = dim
+        self.ivf_threshold = ivf_threshold
+        self.n_probe = n_probe
+        self.names = []
+        self._rows = {}
+        self._vectors = np.zeros((64, dim), dtype=np.float32)
+        self._centroids = None
+        # row numbers in each IVF list, and each row's list
+        self._lists = None
+        self._assignments = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def add(self, name, vector):
+        vector = _unit(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            row = self._rows.get(name)
+            if row is None:
+                row = len(self.names)
+                if row == len(self._vectors):
+                    grown = np.zeros(
+                        (2 * len(self._vectors), self.dim), dtype=np.float32
+                    )
+                    grown[:row] = self._vectors
+                    self._vectors = grown
+                self.names.append(name)
+                self._rows[name] = row
+            self._vectors[row] = vector
+            if self._centroids is not None:
+                if row in self._assignments:
+                    self._lists[self._assignments[row]].remove(row)
+                self._assign(row, int(np.argmax(self._centroids @ vector)))
+            elif len(self) >= self.ivf_threshold:
+                self._train()
+
+    def _train(self, n_iter=10, seed=0):
+        vectors = self._vectors[:len(self)]
+        n_lists = max(1, int(np.sqrt(len(vectors))))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            empty = ~sums.any(axis=1)
+            # reseed empty lists with random vectors
+            sums[empty] = vectors[rng.choice(len(vectors), empty.sum())]
+            centroids = _unit(sums)
+        self._centroids = centroids
+        self._lists = [[] for _ in range(n_lists)]
+        for row, lst in enumerate(np.argmax(vectors @ centroids.T, axis=1)):
+            self._assign(row, int(lst))
+
+    def _assign(self, row, lst):
+        self._lists[lst].append(row)
+        self._assignments[row] = lst
+
+    def search(self, vector, k=5):
+        """Top-k (name, cosine similarity) pairs, best first."""
+        query = _unit(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            vectors = self._vectors[:len(self)]
+            if self._centroids is None:
+                rows = np.arange(len(vectors))
+            else:
+                lists = np.argsort(self._centroids @ query)[-self.n_probe:]
+                rows = np.fromiter(
+                    itertools.chain.from_iterable(
+                        self._lists[i] for i in lists
+                    ),
+                    dtype=np.intp
+                )
+            scores = vectors[rows] @ query
+            names = self.names
+        k = min(k, len(rows))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(names[rows[i]], float(scores[i])) for i in top]
@@ -0,0 +1,256 @@
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from multiprocessing.util import Finalize
+
+import django
+from bson import ObjectId
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from threadpoolctl import threadpool_limits
+
+from . import warmup
+from .models import ScoringJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_analysis_executor = None
+_extraction_executor = None
+_executor_lock = threading.Lock()
+_in_worker = False
+
+
+def _init_worker():
+    global _in_worker, _analysis_executor, _extraction_executor
+    _in_worker = True
+    # pools forked from the parent come without their threads and processes
+    _analysis_executor = _extraction_executor = None
+    # The worker warms up below instead of on the thread ready() would
+    # start when setup runs it in a spawned worker.
+    warmup.skip_background_warmup()
+    # Workers only run the audio pipeline, but importing it pulls in
+    # Django models, so make sure the app registry is ready.
+    django.setup()
+    if settings.EXERCISE_WARMUP_ON_STARTUP:
+        # before the first task, whatever state was inherited by fork
+        warmup.warm_up_logged()
+
+
+def new_scoring_pool(max_workers=None):
+    """A process pool whose workers can run the scoring pipeline."""
+    return ProcessPoolExecutor(
+        max_workers=max_workers or settings.EXERCISE_SCORING_WORKERS,
+        initializer=_init_worker
+    )
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = new_scoring_pool()
+    return _executor
+
+
+def _submit(fn, *args):
+    """
+    Submit fn(*args) to the scoring pool. A worker that died (OOM, killed)
+    breaks the whole pool, so a broken pool is replaced once and the
+    submit retried.
+    """
+    global _executor
+    broken = get_executor()
+    try:
+        return broken.submit(fn, *args)
+    except BrokenProcessPool:
+        logger.warning("scoring pool is broken, starting a new one")
+    with _executor_lock:
+        # another request may have replaced it already
+        if _executor is broken:
+            _executor = new_scoring_pool()
+        executor = _executor
+    broken.shutdown(wait=False)
+    return executor.submit(fn, *args)
+
+
+def analysis_workers():
+    """
+    Analysis processes available to this process. Scoring workers split
+    EXERCISE_ANALYSIS_WORKERS between them, so the total stays fixed.
+    """
+    workers = settings.EXERCISE_ANALYSIS_WORKERS
+    if _in_worker:
+        workers //= settings.EXERCISE_SCORING_WORKERS
+    return workers
+
+
+def get_analysis_executor():
+    """
+    Pool for windowed analysis of long recordings, one per process with
+    analysis_workers() processes. None when that is below 2.
+    """
+    global _analysis_executor
+    workers = analysis_workers()
+    if workers < 2:
+        return None
+    with _executor_lock:
+        if _analysis_executor is None:
+            _analysis_executor = ProcessPoolExecutor(max_workers=workers)
+            if _in_worker:
+                # a worker exits by joining its children without running
+                # the atexit hook that would stop this pool, so stop it
+                # first, while its call queue (finalized at priority 10)
+                # can still deliver the stop sentinels
+                Finalize(
+                    None, _analysis_executor.shutdown, exitpriority=100
+                )
+    return _analysis_executor
+
+
+def extraction_blas_threads():
+    """
+    BLAS threads per extraction in this process. Scoring workers run side
+    by side, so each one only gets its share of the cores.
+    """
+    limit = settings.EXERCISE_EXTRACTION_BLAS_THREADS
+    if _in_worker:
+        limit //= settings.EXERCISE_SCORING_WORKERS
+    return max(1, limit)
+
+
+def get_extraction_executor():
+    """
+    Thread pool shared by everything scoring in this process (requests,
+    or the tasks of one scoring worker) for extracting the reference and
+    the student take of one evaluation side by side. None when
+    EXERCISE_EXTRACTION_THREADS is below 2.
+    """
+    global _extraction_executor
+    if settings.EXERCISE_EXTRACTION_THREADS < 2:
+        return None
+    with _executor_lock:
+        if _extraction_executor is None:
+            # BLAS pools are per process, so cap them once for every
+            # thread instead of letting each extraction spawn one per core
+            threadpool_limits(
+                limits=extraction_blas_threads(), user_api='blas'
+            )
+            _extraction_executor = ThreadPoolExecutor(
+                max_workers=settings.EXERCISE_EXTRACTION_THREADS,
+                thread_name_prefix='extraction'
+            )
+    return _extraction_executor
+
+
+def run_concurrently(*calls):
+    """
+    Run (fn, *args) calls side by side and return their results in
+    order. The first call runs on the calling thread, the others on the
+    extraction pool; everything runs serially when there is no pool.
+    """
+    executor = get_extraction_executor()
+    if executor is None:
+        return [fn(*args) for fn, *args in calls]
+    futures = [executor.submit(*call) for call in calls[1:]]
+    fn, *args = calls[0]
+    try:
+        first = fn(*args)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    return [first] + [future.result() for future in futures]
+
+
+def submit_scoring_job(user, exercise, fn, *args, on_success=None):
+    """
+    Create a pending ScoringJob and run fn(*args) on the local process
+    pool. When it finishes, the job is marked done with fn's return value
+    (or failed with the error) and on_success(job) is called. A job that
+    cannot be queued at all is returned already failed.
+    """
+    fail_stale_jobs()
+    job = ScoringJob.objects.create(
+        id=str(ObjectId()),
+        user=user,
+        exercise=exercise,
+        status=ScoringJob.PENDING,
+        createdAt=timezone.now()
+    )
+    try:
+        future = _submit(fn, *args)
+    except Exception as e:
+        logger.exception("failed to queue scoring job %s", job.id)
+        job.status = ScoringJob.FAILED
+        job.error = str(e) or e.__class__.__name__
+        job.finishedAt = timezone.now()
+        job.save()
+        return job
+    future.add_done_callback(
+        lambda f: _finish_job(job.id, f, on_success)
+    )
+    return job
+
+
+def fail_stale_jobs(jobs=None):
+    """
+    Mark jobs pending for longer than EXERCISE_SCORING_JOB_TIMEOUT as
+    failed. Their result would have been recorded by the process that
+    queued them, which has since restarted or died. Returns the count.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.EXERCISE_SCORING_JOB_TIMEOUT)
+    jobs = ScoringJob.objects.all() if jobs is None else jobs
+    return jobs.filter(
+        status=ScoringJob.PENDING, createdAt__lt=cutoff
+    ).update(
+        status=ScoringJob.FAILED,
+        error='scoring did not finish, please try again',
+        finishedAt=now
+    )
+
+
+def submit_background(fn, *args):
+    """
+    Run fn(*args) on the process pool without tracking it as a job;
+    failures are only logged.
+    """
+    future = _submit(fn, *args)
+    future.add_done_callback(_log_background_failure)
+    return future
+
+
+def _log_background_failure(future):
+    error = future.exception()
+    if error is not None:
+        logger.error("background task failed", exc_info=error)
+
+
+def _finish_job(job_id, future, on_success):
+    # Runs on the executor's management thread, not in a request
+    close_old_connections()
+    try:
+        job = ScoringJob.objects.get(id=job_id)
+        try:
+            job.result = future.result()
+            job.status = ScoringJob.DONE
+        except Exception as e:
+            job.status = ScoringJob.FAILED
+            job.error = str(e)
+        job.finishedAt = timezone.now()
+        if job.status == ScoringJob.DONE and on_success:
+            # before the job is saved as done, so a client polling for it
+            # finds the metrics already written
+            try:
+                on_success(job)
+            except Exception:
+                logger.exception("failed to record results of job %s", job_id)
+        job.save()
+    except Exception:
+        logger.exception("failed to record scoring job %s", job_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,205 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.utils.text import get_valid_filename
+
+
+class ReferenceLibrary:
+    """
+    Reference recordings stored once per content hash, each with a
+    precomputed feature directory holding one .npy file per array.
+
+    Feature arrays are opened with np.load(mmap_mode='r'), so every
+    worker process scoring against the same reference shares a single
+    page-cache copy instead of unpacking its own. Feature directories
+    live under a version subdirectory and are rebuilt when the feature
+    pipeline changes.
+    """
+
+    def __init__(self, audio_dir, feature_dir, version):
+        self.audio_dir = str(audio_dir)
+        self.feature_dir = str(feature_dir)
+        self.version = version
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def _prefix(digest):
+        return digest[:16] + '_'
+
+    def audio_name(self, digest):
+        """Filename of the stored recording with this hash, if any."""
+        pattern = os.path.join(
+            self.audio_dir, glob.escape(self._prefix(digest)) + '*'
+        )
+        for path in glob.glob(pattern):
+            return os.path.basename(path)
+        return None
+
+    def read_audio(self, digest):
+        """Bytes of the stored recording with this hash."""
+        name = self.audio_name(digest)
+        if name is None:
+            raise FileNotFoundError(f'no recording with hash {digest}')
+        with open(os.path.join(self.audio_dir, name), 'rb') as f:
+            return f.read()
+
+    def add(self, data, name):
+        """
+        Store a recording unless identical bytes are already in the
+        library. Returns (filename, digest, created).
+        """
+        digest = self.digest(data)
+        existing = self._existing(digest)
+        if existing:
+            return existing, digest, False
+        os.makedirs(self.audio_dir, exist_ok=True)
+        filename = self._filename(digest, name)
+        fd, tmp_path = tempfile.mkstemp(dir=self.audio_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, os.path.join(self.audio_dir, filename))
+        return filename, digest, True
+
+    def add_chunks(self, chunks, name):
+        """
+        add() for a recording given as an iterable of byte chunks, e.g. an
+        UploadedFile's chunks(). It is hashed while it is written to a
+        temporary file, so it is never held in memory whole.
+        """
+        os.makedirs(self.audio_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.audio_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in chunks:
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+            digest = hasher.hexdigest()
+            existing = self._existing(digest)
+            if existing:
+                return existing, digest, False
+            filename = self._filename(digest, name)
+            os.replace(tmp_path, os.path.join(self.audio_dir, filename))
+            return filename, digest, True
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _existing(self, digest):
+        existing = self.audio_name(digest)
+        if existing:
+            try:
+                # bump mtime so eviction sees it as recently used
+                os.utime(os.path.join(self.audio_dir, existing))
+            except OSError:
+                pass
+        return existing
+
+    def _filename(self, digest, name):
+        return self._prefix(digest) + get_valid_filename(
+            os.path.basename(name)
+        )
+
+    def evict(self, max_bytes=None, max_age=None):
+        """
+        Delete recordings, and their features, that were last stored more
+        than max_age seconds ago, then the least recently stored ones
+        until the audio takes at most max_bytes. Returns the number of
+        recordings deleted.
+        """
+        entries = []
+        try:
+            names = os.listdir(self.audio_dir)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.audio_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        cutoff = time.time() - max_age if max_age is not None else None
+        removed = 0
+        for mtime, size, name in entries:
+            expired = cutoff is not None and mtime < cutoff
+            if not expired and (max_bytes is None or total <= max_bytes):
+                break
+            try:
+                os.remove(os.path.join(self.audio_dir, name))
+            except FileNotFoundError:
+                pass
+            # audio names start with the first 16 digits of the digest
+            for path in glob.glob(os.path.join(
+                self.feature_dir, 'v*', glob.escape(name[:16]) + '*'
+            )):
+                shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def _feature_path(self, digest):
+        return os.path.join(self.feature_dir, f'v{self.version}', digest)
+
+    def digests(self):
+        """Hashes of every reference with features for this version."""
+        try:
+            names = os.listdir(
+                os.path.join(self.feature_dir, f'v{self.version}')
+            )
+        except FileNotFoundError:
+            return []
+        return [name for name in names if not name.endswith('.tmp')]
+
+    def has_features(self, digest):
+        return os.path.isdir(self._feature_path(digest))
+
+    def save_features(self, digest, feats):
+        path = self._feature_path(digest)
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, suffix='.tmp')
+        try:
+            meta = {}
+            for name, value in feats.items():
+                value = np.asarray(value)
+                if value.ndim == 0:
+                    meta[name] = value.item()
+                else:
+                    np.save(os.path.join(tmp_dir, name + '.npy'), value)
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+                json.dump(meta, f)
+            # the directory appears complete or not at all
+            os.rename(tmp_dir, path)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            # another worker finished the same reference first
+            if not self.has_features(digest):
+                raise
+
+    def load_features(self, digest):
+        path = self._feature_path(digest)
+        try:
+            with open(os.path.join(path, 'meta.json')) as f:
+                feats = json.load(f)
+            for name in os.listdir(path):
+                if name.endswith('.npy'):
+                    feats[name[:-4]] = np.load(
+                        os.path.join(path, name), mmap_mode='r'
+                    )
+        except (OSError, ValueError):
+            return None
+        return feats
@@ -0,0 +1,354 @@
+"""
+Live practice scoring over a WebSocket, served by pianote.asgi.
+
+Protocol on /ws/exercise/live/ (the session cookie must belong to a
+logged-in user):
+
+    -> {"type": "start", "reference": "<file in REFERENCE_DIR>",
+        "sample_rate": 44100, "format": "f32"}       # or "s16"
+    <- {"type": "ready"}
+    -> binary messages of mono little-endian PCM
+    <- {"type": "score", ...} a few times per second
+    -> {"type": "stop"}
+    <- {"type": "final", ...} and the socket is closed
+
+An unknown format, a sample rate that is not an integer in
+MIN_SAMPLE_RATE..MAX_SAMPLE_RATE or a binary message that is not a whole
+number of samples gets {"type": "error", "error": ...} and the socket is
+closed with code 1007.
+
+Incoming audio goes into a ring buffer and only frames that became
+complete since the last chunk are analysed. Pitch, energy and chroma
+are folded into running totals, so past audio is never recomputed, and
+compared with the same statistics over the elapsed part of the cached
+frame-level reference features.
+"""
+import json
+import os
+import time
+from importlib import import_module
+
+import librosa
+import numpy as np
+import soxr
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import parse_cookie
+
+from .alignment import ALIGN_HOP, ALIGN_SR
+from .analysis import PIANO_FMAX, PIANO_FMIN, autocorr_frames_pitch
+from .views import REFERENCE_DIR, load_reference_alignment_features
+
+LIVE_PATH = '/ws/exercise/live/'
+PCM_FORMATS = {'f32': '<f4', 's16': '<i2'}
+# sample rates a client may announce in its start message
+MIN_SAMPLE_RATE, MAX_SAMPLE_RATE = 8000, 192000
+# close code for a message the server cannot accept (RFC 6455)
+CLOSE_INVALID_DATA = 1007
+
+
+class RingBuffer:
+    """
+    Fixed-size float32 sample buffer addressed by absolute sample index;
+    writing past the end overwrites the oldest samples.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.total = 0
+        self._data = np.zeros(capacity, dtype=np.float32)
+
+    def write(self, samples):
+        samples = samples[-self.capacity:]
+        start = self.total % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self.total += len(samples)
+
+    def read(self, start, stop):
+        if start < self.total - self.capacity or stop > self.total:
+            raise IndexError('samples no longer (or not yet) buffered')
+        idx = np.arange(start, stop) % self.capacity
+        return self._data[idx]
+
+
+def _pitch_counts(pitches, bins=36):
+    # one-hot rows of the pitch_histogram bins, zero for unvoiced frames
+    pitches = np.asarray(pitches, dtype=np.float64)
+    voiced = np.isfinite(pitches) & (pitches > 0)
+    counts = np.zeros((len(pitches), bins))
+    if voiced.any():
+        midi = librosa.hz_to_midi(pitches[voiced])
+        idx = np.floor((midi - 21) / (87 / bins)).astype(int)
+        idx = np.where(midi == 108, bins - 1, idx)
+        inside = (idx >= 0) & (idx < bins)
+        rows = np.flatnonzero(voiced)[inside]
+        counts[rows, idx[inside]] = 1
+    return counts
+
+
+def _similarity(a, b):
+    norm = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(np.dot(a, b) / norm) if norm > 0 else 0.0
+
+
+class LiveScorer:
+    """
+    Incremental scorer for one live take against the frame-level
+    reference features returned by load_reference_alignment_features.
+    Scores compare everything played so far with the same stretch of
+    the reference.
+    """
+
+    def __init__(self, ref_feats, sample_rate, sr=22050, frame_length=2048,
+                 hop_length=512, pitch_frame_length=1024,
+                 update_seconds=0.25):
+        self.sr = sr
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.pitch_frame_length = pitch_frame_length
+        self.update_frames = max(1, int(update_seconds * sr / hop_length))
+        self.resampler = None
+        if sample_rate != sr:
+            self.resampler = soxr.ResampleStream(sample_rate, sr, 1)
+
+        # prefix sums, so any elapsed stretch of the reference is O(1)
+        self.ref_pitch = np.cumsum(_pitch_counts(ref_feats['pitches']), axis=0)
+        self.ref_chroma = np.cumsum(
+            np.asarray(ref_feats['chroma'], dtype=np.float64).T, axis=0
+        )
+        self.ref_energy = np.cumsum(
+            np.asarray(ref_feats['energy'], dtype=np.float64)
+        )
+
+        self.window = librosa.filters.get_window('hann', frame_length)
+        self.chroma_fb = librosa.filters.chroma(
+            sr=sr, n_fft=frame_length, tuning=0.0
+        )
+        # two seconds of history is plenty for one frame of context
+        self.ring = RingBuffer(max(2 * sr, 4 * frame_length))
+        # frames are centered like librosa's, so start with half a frame
+        # of silence
+        self.ring.write(np.zeros(frame_length // 2, dtype=np.float32))
+        self.next_frame_end = frame_length
+        self.n_frames = 0
+        self.frames_since_update = 0
+        self.energy_sum = 0.0
+        self.chroma_sum = np.zeros(12)
+        self.pitch_counts = np.zeros(36)
+        self.processing_seconds = 0.0
+
+    def push(self, pcm):
+        """
+        Add a chunk of PCM at the client sample rate. Returns True when
+        enough new audio arrived for another score update.
+        """
+        started = time.perf_counter()
+        y = np.asarray(pcm, dtype=np.float32)
+        if self.resampler is not None:
+            y = self.resampler.resample_chunk(y)
+        # keep each write well inside the ring
+        step = self.ring.capacity // 2
+        for i in range(0, len(y), step):
+            self.ring.write(y[i:i + step])
+            self._analyse_new_frames()
+        self.processing_seconds += time.perf_counter() - started
+        if self.frames_since_update >= self.update_frames:
+            self.frames_since_update = 0
+            return True
+        return False
+
+    def _analyse_new_frames(self):
+        available = self.ring.total - self.next_frame_end
+        if available < 0:
+            return
+        k = available // self.hop_length + 1
+        last_end = self.next_frame_end + (k - 1) * self.hop_length
+        span = self.ring.read(last_end - self.frame_length - (k - 1) *
+                              self.hop_length, last_end)
+        frames = librosa.util.frame(
+            span, frame_length=self.frame_length, hop_length=self.hop_length
+        ).T
+        self.next_frame_end = last_end + self.hop_length
+
+        # energy: same frame RMS as librosa.feature.rms
+        self.energy_sum += float(np.sqrt(np.mean(frames ** 2, axis=1)).sum())
+
+        # chroma, normalized per frame like chroma_stft
+        spectrum = np.fft.rfft(frames * self.window, axis=1)
+        chroma = (np.abs(spectrum) ** 2) @ self.chroma_fb.T
+        peak = chroma.max(axis=1, keepdims=True)
+        self.chroma_sum += (chroma / np.where(peak > 0, peak, 1)).sum(axis=0)
+
+        # pitch from the middle of each frame
+        lo = (self.frame_length - self.pitch_frame_length) // 2
+        pitches, voiced = autocorr_frames_pitch(
+            frames[:, lo:lo + self.pitch_frame_length],
+            self.sr, PIANO_FMIN, PIANO_FMAX
+        )
+        self.pitch_counts += _pitch_counts(pitches).sum(axis=0)
+
+        self.n_frames += k
+        self.frames_since_update += k
+
+    def scores(self):
+        if not self.n_frames:
+            return {'elapsed': 0.0}
+        elapsed = self.n_frames * self.hop_length / self.sr
+        ref_frames = int(round(elapsed * ALIGN_SR / ALIGN_HOP))
+        r = min(max(ref_frames, 1), len(self.ref_energy)) - 1
+        pitch_score = round(
+            _similarity(self.ref_pitch[r], self.pitch_counts) * 100, 2
+        )
+        energy_score = max(
+            0,
+            100 - abs(
+                self.ref_energy[r] / (r + 1) -
+                self.energy_sum / self.n_frames
+            ) * 1000
+        )
+        sim_score = round(
+            _similarity(self.ref_chroma[r], self.chroma_sum) * 100, 2
+        )
+        # tempo needs more context than a live take provides, so the
+        # overall score reweights the remaining components
+        overall = (
+            (0.5 * pitch_score) + (0.15 * energy_score) + (0.2 * sim_score)
+        ) / 0.85
+        return {
+            'elapsed': round(elapsed, 2),
+            'pitch_score': pitch_score,
+            'energy_score': round(float(energy_score), 2),
+            'similarity_score': sim_score,
+            'overall_score': round(float(overall), 2),
+        }
+
+
+def _session_user_id(scope):
+    # scope['session'] is set by in-process clients such as the replay
+    # harness; real connections are authenticated by their cookie
+    if 'session' in scope:
+        return scope['session'].get('user_id')
+    headers = dict(scope.get('headers') or [])
+    cookies = parse_cookie(headers.get(b'cookie', b'').decode('latin-1'))
+    session_key = cookies.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    engine = import_module(settings.SESSION_ENGINE)
+    return engine.SessionStore(session_key).get('user_id')
+
+
+def _load_reference(name):
+    path = os.path.join(REFERENCE_DIR, os.path.basename(name or ''))
+    with open(path, 'rb') as f:
+        return load_reference_alignment_features(f.read())
+
+
+async def _send_json(send, payload):
+    await send({'type': 'websocket.send', 'text': json.dumps(payload)})
+
+
+async def _reject(send, error):
+    """Tell the client what was wrong with its input and hang up."""
+    await _send_json(send, {'type': 'error', 'error': error})
+    await send({'type': 'websocket.close', 'code': CLOSE_INVALID_DATA})
+
+
+def _stream_format(data):
+    """
+    PCM dtype and sample rate announced by a start message. Raises
+    ValueError for an unknown format or an unusable sample rate.
+    """
+    fmt = data.get('format') or 'f32'
+    if fmt not in PCM_FORMATS:
+        raise ValueError(
+            f'format must be one of {", ".join(PCM_FORMATS)}'
+        )
+    sample_rate = data.get('sample_rate') or 22050
+    if isinstance(sample_rate, str):
+        sample_rate = sample_rate.strip()
+    try:
+        sample_rate = int(sample_rate)
+    except (TypeError, ValueError):
+        raise ValueError('sample_rate must be an integer') from None
+    if not MIN_SAMPLE_RATE <= sample_rate <= MAX_SAMPLE_RATE:
+        raise ValueError(
+            f'sample_rate must be between {MIN_SAMPLE_RATE} and '
+            f'{MAX_SAMPLE_RATE}'
+        )
+    return np.dtype(PCM_FORMATS[fmt]), sample_rate
+
+
+async def live_scoring_app(scope, receive, send):
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+    if scope['path'] != LIVE_PATH:
+        await send({'type': 'websocket.close', 'code': 4404})
+        return
+    user_id = await sync_to_async(_session_user_id)(scope)
+    if not user_id:
+        await send({'type': 'websocket.close', 'code': 4401})
+        return
+    await send({'type': 'websocket.accept'})
+
+    scorer = None
+    dtype = np.dtype(PCM_FORMATS['f32'])
+    while True:
+        message = await receive()
+        if message['type'] == 'websocket.disconnect':
+            return
+        if message.get('bytes') is not None:
+            if scorer is None:
+                await _send_json(send, {
+                    'type': 'error', 'error': 'send start first'
+                })
+                continue
+            if len(message['bytes']) % dtype.itemsize:
+                await _reject(send, (
+                    f'audio frames must be a whole number of '
+                    f'{dtype.itemsize}-byte samples'
+                ))
+                return
+            pcm = np.frombuffer(message['bytes'], dtype=dtype)
+            if dtype == PCM_FORMATS['s16']:
+                pcm = pcm / 32768.0
+            # per-chunk work is a few frames, cheap enough for the loop
+            if scorer.push(pcm):
+                await _send_json(send, {'type': 'score', **scorer.scores()})
+            continue
+
+        try:
+            data = json.loads(message.get('text') or '')
+        except ValueError:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        if data.get('type') == 'start':
+            try:
+                dtype, sample_rate = _stream_format(data)
+            except ValueError as e:
+                await _reject(send, str(e))
+                return
+            if not isinstance(data.get('reference'), str):
+                await _reject(send, 'reference must be a file name')
+                return
+            try:
+                ref_feats = await sync_to_async(
+                    _load_reference, thread_sensitive=False
+                )(data['reference'])
+            except (OSError, ValueError) as e:
+                await _send_json(send, {'type': 'error', 'error': str(e)})
+                continue
+            scorer = LiveScorer(ref_feats, sample_rate)
+            await _send_json(send, {'type': 'ready'})
+        elif data.get('type') == 'stop':
+            final = scorer.scores() if scorer else {}
+            await _send_json(send, {'type': 'final', **final})
+            await send({'type': 'websocket.close', 'code': 1000})
+            return
+        else:
+            await _send_json(send, {
+                'type': 'error', 'error': 'unknown message'
+            })
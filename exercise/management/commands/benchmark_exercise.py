@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from exercise.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the exercise scoring pipeline on synthetic piano audio.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'suites', nargs='*', choices=sorted(SUITES),
+            help='Suites to run (default: all).'
+        )
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        for name in options['suites'] or sorted(SUITES):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            rows = SUITES[name](repeat=options['repeat'])
+            self.write_table(rows)
+            self.stdout.write('')
+
+    def write_table(self, rows):
+        if not rows:
+            return
+        columns = list(rows[0])
+        widths = [
+            max(len(col), *(len(str(row[col])) for row in rows))
+            for col in columns
+        ]
+        self.stdout.write('  '.join(
+            col.ljust(width) for col, width in zip(columns, widths)
+        ))
+        for row in rows:
+            self.stdout.write('  '.join(
+                str(row[col]).ljust(width)
+                for col, width in zip(columns, widths)
+            ))
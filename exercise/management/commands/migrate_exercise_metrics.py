@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+
+from exercise.metrics import canonical_metric, legacy_metric_id
+from exercise.models import Exercise, ExerciseMetric
+
+
+class Command(BaseCommand):
+    help = (
+        'Move the metrics list stored on each exercise into '
+        'ExerciseMetric documents with the canonical schema. Entries '
+        'without a usable date are left on the exercise. Safe to re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report what would be migrated without writing.'
+        )
+
+    def handle(self, *args, **options):
+        migrated = kept = exercises = 0
+        for ex in Exercise.objects.exclude(metrics=[]).iterator():
+            if not ex.metrics:
+                continue
+            records = []
+            leftovers = []
+            for i, entry in enumerate(ex.metrics):
+                values = canonical_metric(entry) if isinstance(
+                    entry, dict
+                ) else None
+                if values is None:
+                    # no usable date or an unknown shape: never dropped,
+                    # it stays on the exercise for a manual look
+                    leftovers.append(entry)
+                    continue
+                records.append(ExerciseMetric(
+                    id=legacy_metric_id(ex.id, i), exercise=ex, **values
+                ))
+            exercises += 1
+            migrated += len(records)
+            kept += len(leftovers)
+            if leftovers:
+                self.stderr.write(self.style.WARNING(
+                    f'{ex.id}: {len(leftovers)} entries without a usable '
+                    f'date stay in Exercise.metrics'
+                ))
+            if options['dry_run'] or not records:
+                continue
+            # replace whatever an interrupted earlier run left behind
+            ExerciseMetric.objects.filter(
+                id__in=[r.id for r in records]
+            ).delete()
+            ExerciseMetric.objects.bulk_create(records)
+            Exercise.objects.filter(id=ex.id).update(metrics=leftovers)
+
+        prefix = 'Would migrate' if options['dry_run'] else 'Migrated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {migrated} metrics from {exercises} exercises '
+            f'({kept} entries without a date left in place).'
+        ))
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+
+import numpy as np
+import soundfile as sf
+from django.core.management.base import BaseCommand, CommandError
+
+from exercise.live import LIVE_PATH, live_scoring_app
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a recording through the live scoring WebSocket app as a '
+        'simulated client and report per-chunk processing cost.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('take', help='Audio file streamed as the student.')
+        parser.add_argument(
+            '--reference', required=True,
+            help='Reference file name in the reference_audios directory.'
+        )
+        parser.add_argument('--chunk-ms', type=int, default=100)
+        parser.add_argument(
+            '--realtime', action='store_true',
+            help='Pace chunks at the speed of the recording.'
+        )
+        parser.add_argument('--user-id', default='replay')
+
+    def handle(self, *args, **options):
+        try:
+            y, sr = sf.read(options['take'], dtype='float32', always_2d=True)
+        except (OSError, RuntimeError) as e:
+            raise CommandError(str(e))
+        y = y.mean(axis=1)
+        chunk = max(1, sr * options['chunk_ms'] // 1000)
+        chunks = [y[i:i + chunk] for i in range(0, len(y), chunk)]
+        report = asyncio.run(self.replay(chunks, sr, options))
+
+        chunk_ms = options['chunk_ms']
+        timings = np.array(report['timings']) * 1000
+        self.stdout.write(f"chunks           {len(chunks)} x {chunk_ms} ms")
+        self.stdout.write(f"mean per chunk   {timings.mean():.2f} ms")
+        self.stdout.write(f"max per chunk    {timings.max():.2f} ms")
+        self.stdout.write(
+            f"real-time factor {timings.sum() / (len(y) / sr * 1000):.4f}"
+        )
+        self.stdout.write(
+            f"score updates    {report['updates']} "
+            f"({report['updates'] / (len(y) / sr):.1f}/s of audio)"
+        )
+        self.stdout.write(f"final            {json.dumps(report['final'])}")
+
+    async def replay(self, chunks, sr, options):
+        incoming = asyncio.Queue()
+        outgoing = asyncio.Queue()
+        scope = {
+            'type': 'websocket',
+            'path': LIVE_PATH,
+            'headers': [],
+            'session': {'user_id': options['user_id']},
+        }
+        server = asyncio.create_task(
+            live_scoring_app(scope, incoming.get, outgoing.put)
+        )
+
+        async def expect(kind):
+            message = await outgoing.get()
+            if message['type'] == 'websocket.close':
+                raise CommandError(f"closed with code {message['code']}")
+            data = json.loads(message.get('text') or '{}')
+            if data.get('type') == 'error':
+                raise CommandError(data['error'])
+            if kind and data.get('type') != kind:
+                raise CommandError(f'unexpected message {data}')
+            return data
+
+        await incoming.put({'type': 'websocket.connect'})
+        accept = await outgoing.get()
+        if accept['type'] != 'websocket.accept':
+            raise CommandError(f"closed with code {accept.get('code')}")
+        await incoming.put({'type': 'websocket.receive', 'text': json.dumps({
+            'type': 'start',
+            'reference': options['reference'],
+            'sample_rate': sr,
+            'format': 'f32',
+        })})
+        await expect('ready')
+
+        timings = []
+        updates = 0
+        started = time.perf_counter()
+        for i, samples in enumerate(chunks):
+            if options['realtime']:
+                due = started + i * options['chunk_ms'] / 1000
+                await asyncio.sleep(max(0, due - time.perf_counter()))
+            t0 = time.perf_counter()
+            await incoming.put({
+                'type': 'websocket.receive',
+                'bytes': samples.astype('<f4').tobytes(),
+            })
+            # yield until the app has taken the chunk; it handles it
+            # without awaiting anything else, so by the time it is back
+            # waiting on receive the chunk is fully processed
+            while not incoming.empty() and not server.done():
+                await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            timings.append(time.perf_counter() - t0)
+            while not outgoing.empty():
+                await expect('score')
+                updates += 1
+
+        await incoming.put({
+            'type': 'websocket.receive', 'text': json.dumps({'type': 'stop'})
+        })
+        while True:
+            data = await expect(None)
+            if data['type'] == 'score':
+                updates += 1
+                continue
+            final = data
+            break
+        await server
+        final.pop('type', None)
+        return {'timings': timings, 'updates': updates, 'final': final}
@@ -0,0 +1,194 @@
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from datetime import time as dt_time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from exercise.jobs import new_scoring_pool
+from exercise.models import ExerciseMetric
+from exercise.profiles import SCORING_PROFILES
+from exercise.views import rescore_recordings
+
+RESCORED_FIELDS = [
+    'pitch_score', 'tempo_score', 'energy_score', 'final_score', 'profile'
+]
+
+
+def _parse_when(value):
+    # createdAt is aware, a bare date means midnight in the current zone
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'invalid date: {value}')
+        when = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
+
+
+class Command(BaseCommand):
+    help = (
+        'Score saved attempts again from their stored recordings with the '
+        'current pipeline, on a process pool. Progress is checkpointed '
+        'after every chunk so an interrupted run can be resumed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--exercise', action='append', default=[],
+            help='Only attempts of this exercise id (repeatable).'
+        )
+        parser.add_argument(
+            '--user', action='append', default=[],
+            help='Only attempts of exercises owned by this user id '
+                 '(repeatable).'
+        )
+        parser.add_argument(
+            '--since', help='Only attempts created at or after this date.'
+        )
+        parser.add_argument(
+            '--until', help='Only attempts created before this date.'
+        )
+        parser.add_argument(
+            '--profile', choices=sorted(SCORING_PROFILES),
+            help='Scoring profile to use instead of each attempt\'s own.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.EXERCISE_SCORING_WORKERS
+        )
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument(
+            '--checkpoint', default=str(settings.EXERCISE_RESCORE_CHECKPOINT)
+        )
+        parser.add_argument(
+            '--resume', action='store_true',
+            help='Continue after the last attempt of the checkpoint.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report how many attempts would be re-scored.'
+        )
+
+    def selection(self, options):
+        qs = ExerciseMetric.objects.filter(deleteFlag=False).exclude(
+            take_digest=''
+        )
+        if options['exercise']:
+            qs = qs.filter(exercise_id__in=options['exercise'])
+        if options['user']:
+            qs = qs.filter(exercise__user_id__in=options['user'])
+        if options['since']:
+            qs = qs.filter(createdAt__gte=_parse_when(options['since']))
+        if options['until']:
+            qs = qs.filter(createdAt__lt=_parse_when(options['until']))
+        return qs.order_by('id')
+
+    def handle(self, *args, **options):
+        qs = self.selection(options)
+        # a checkpoint only applies to the selection it was made for
+        key = {
+            name: options[name]
+            for name in ('exercise', 'user', 'since', 'until', 'profile')
+        }
+        state = {'key': key, 'last_id': '', 'done': 0, 'failed': 0}
+        if options['resume']:
+            saved = self.read_checkpoint(options['checkpoint'])
+            if saved is None:
+                self.stdout.write('No checkpoint, starting from the top.')
+            elif saved['key'] != key:
+                raise CommandError(
+                    'The checkpoint was made for a different selection: '
+                    f'{saved["key"]}'
+                )
+            else:
+                state = saved
+        if state['last_id']:
+            qs = qs.filter(id__gt=state['last_id'])
+
+        total = qs.count()
+        if options['dry_run']:
+            self.stdout.write(f'Would re-score {total} attempts.')
+            return
+
+        started = time.perf_counter()
+        done = 0
+        with new_scoring_pool(options['workers']) as pool:
+            while True:
+                chunk = list(qs.filter(id__gt=state['last_id']).only(
+                    'id', 'mode', 'profile', 'reference_digest',
+                    'take_digest', *RESCORED_FIELDS
+                )[:options['chunk_size']])
+                if not chunk:
+                    break
+                failed = self.rescore_chunk(pool, chunk, options['profile'])
+                state['last_id'] = chunk[-1].id
+                state['done'] += len(chunk) - failed
+                state['failed'] += failed
+                self.write_checkpoint(options['checkpoint'], state)
+
+                done += len(chunk)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{done}/{total} attempts, {done / elapsed:.1f}/s, '
+                    f'{state["failed"]} failed'
+                )
+
+        # finished, the next run starts from the top
+        try:
+            os.remove(options['checkpoint'])
+        except FileNotFoundError:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f'Re-scored {state["done"]} attempts '
+            f'({state["failed"]} failed).'
+        ))
+
+    def rescore_chunk(self, pool, chunk, profile):
+        """Score chunk on pool and bulk-write it; returns the failures."""
+        futures = [
+            pool.submit(
+                rescore_recordings, metric.reference_digest,
+                metric.take_digest, metric.mode,
+                profile or metric.profile or None
+            )
+            for metric in chunk
+        ]
+        updated = []
+        for metric, future in zip(chunk, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                self.stderr.write(f'{metric.id}: {e}')
+                continue
+            metric.pitch_score = result.get('pitch_score', 0)
+            metric.tempo_score = result.get('tempo_score', 0)
+            metric.energy_score = result.get('energy_score', 0)
+            metric.final_score = result.get('overall_score', 0)
+            metric.profile = result.get('profile', metric.profile)
+            updated.append(metric)
+        ExerciseMetric.objects.bulk_update(updated, RESCORED_FIELDS)
+        return len(chunk) - len(updated)
+
+    @staticmethod
+    def read_checkpoint(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def write_checkpoint(path, state):
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump(state, tmp)
+        os.replace(tmp_path, path)
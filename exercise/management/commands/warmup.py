@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from exercise.warmup import warm_up
+
+
+def _row(run, timings):
+    return {
+        'run': run,
+        **{name: round(t * 1000, 1) for name, t in timings.items()},
+        'total_ms': round(sum(timings.values()) * 1000, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Warm the scoring pipeline, compiling numba kernels into the '
+        'on-disk JIT cache, and report cold and warm latency per stage.'
+    )
+    # system checks import the views, which would hide the import cost;
+    # for the same reason the table code of benchmark_exercise (which
+    # imports the benchmarks) is not reused
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--compare', action='store_true',
+            help='Compare fresh processes with an empty and a filled JIT '
+                 'cache against a warm process.'
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Print the timings of a cold and a warm pass as JSON.'
+        )
+
+    def handle(self, *args, **options):
+        if options['compare']:
+            return self.compare()
+        cold = warm_up()
+        warm = warm_up()
+        if options['json']:
+            self.stdout.write(json.dumps([cold, warm]))
+            return
+        self.write_table([_row('first pass', cold), _row('second pass', warm)])
+
+    def fresh_process(self, cache_dir):
+        env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+        out = subprocess.run(
+            [sys.executable, sys.argv[0], 'warmup', '--json'],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(out.strip().splitlines()[-1])
+
+    def compare(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            empty, warm = self.fresh_process(cache_dir)
+            cached, _ = self.fresh_process(cache_dir)
+        self.write_table([
+            _row('cold, empty JIT cache', empty),
+            _row('cold, JIT cache on disk', cached),
+            _row('warm process', warm),
+        ])
+
+    def write_table(self, rows):
+        columns = list(rows[0])
+        widths = [
+            max(len(col), *(len(str(row[col])) for row in rows))
+            for col in columns
+        ]
+        for row in [dict(zip(columns, columns)), *rows]:
+            self.stdout.write('  '.join(
+                str(row[col]).ljust(width)
+                for col, width in zip(columns, widths)
+            ))
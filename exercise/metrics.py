@@ -0,0 +1,221 @@
+"""
+Exercise metrics history: the canonical attempt schema, keyset
+pagination over ExerciseMetric and daily/weekly rollups computed by
+MongoDB. Dated entries still in an exercise's legacy metrics list are
+merged in, so history shows up before migrate_exercise_metrics has run.
+"""
+import base64
+import hashlib
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import ExerciseMetric
+
+SCORES = ('pitch_score', 'tempo_score', 'energy_score', 'final_score')
+
+# spellings found in metrics saved by earlier versions, canonical first
+LEGACY_KEYS = {
+    'pitch_score': ('pitch_score', 'pitch', 'pitchScore'),
+    'tempo_score': ('tempo_score', 'tempo', 'tempoScore'),
+    'energy_score': ('energy_score', 'energy', 'energyScore'),
+    'final_score': (
+        'final_score', 'overall_score', 'finalScore', 'overallScore'
+    ),
+    'createdAt': ('createdAt', 'created_at'),
+}
+
+ROLLUP_UNITS = ('day', 'week')
+
+METRICS_PAGE_SIZE = 500
+METRICS_MAX_PAGE_SIZE = 5000
+
+
+def canonical_metric(entry):
+    """
+    Map one legacy metrics-list entry onto the ExerciseMetric fields.
+    Returns None for entries without a usable date.
+    """
+    values = {}
+    for field, keys in LEGACY_KEYS.items():
+        values[field] = next(
+            (entry[k] for k in keys if entry.get(k) not in (None, '')),
+            None
+        )
+    created = values['createdAt']
+    if isinstance(created, str):
+        created = parse_datetime(created)
+    if created is None:
+        return None
+    if timezone.is_naive(created):
+        created = timezone.make_aware(created, dt_timezone.utc)
+    values['createdAt'] = created
+    for field in SCORES:
+        try:
+            values[field] = float(values[field] or 0)
+        except (TypeError, ValueError):
+            values[field] = 0.0
+    values['deleteFlag'] = bool(entry.get('deleteFlag', False))
+    return values
+
+
+def legacy_metric_id(exercise_id, index):
+    # deterministic, so re-running the migration replaces instead of
+    # duplicating
+    digest = hashlib.sha1(f'{exercise_id}:{index}'.encode()).hexdigest()
+    return digest[:24]
+
+
+def legacy_metrics(exercise):
+    """
+    Dated, not deleted entries of the exercise's legacy metrics list as
+    unsaved ExerciseMetric rows, oldest first. Empty once
+    migrate_exercise_metrics has moved them.
+    """
+    rows = []
+    for i, entry in enumerate(exercise.metrics or []):
+        values = canonical_metric(entry) if isinstance(
+            entry, dict
+        ) else None
+        if values is None or values['deleteFlag']:
+            continue
+        rows.append(ExerciseMetric(
+            id=legacy_metric_id(exercise.id, i), exercise=exercise, **values
+        ))
+    if rows:
+        # an interrupted migration may have copied some of them already
+        migrated = set(ExerciseMetric.objects.filter(
+            id__in=[m.id for m in rows]
+        ).values_list('id', flat=True))
+        rows = [m for m in rows if m.id not in migrated]
+    rows.sort(key=lambda m: (m.createdAt, m.id))
+    return rows
+
+
+def encode_cursor(metric):
+    raw = f'{metric.createdAt.isoformat()}|{metric.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created, metric_id = raw.rsplit('|', 1)
+    except (ValueError, UnicodeError):
+        raise ValueError('invalid cursor')
+    created = parse_datetime(created)
+    if created is None:
+        raise ValueError('invalid cursor')
+    return created, metric_id
+
+
+def metrics_page(exercise, since=None, limit=METRICS_PAGE_SIZE,
+                 cursor=None):
+    """
+    The most recent `limit` attempts at or after since and older than
+    cursor, oldest first, plus the cursor for the next (older) page or
+    None when there is nothing left.
+    """
+    qs = exercise.metric_entries.filter(deleteFlag=False)
+    legacy = legacy_metrics(exercise)
+    if since is not None:
+        qs = qs.filter(createdAt__gte=since)
+        legacy = [m for m in legacy if m.createdAt >= since]
+    if cursor:
+        created, metric_id = decode_cursor(cursor)
+        qs = qs.filter(
+            Q(createdAt__lt=created) | Q(createdAt=created, id__lt=metric_id)
+        )
+        legacy = [
+            m for m in legacy if (m.createdAt, m.id) < (created, metric_id)
+        ]
+    rows = list(qs.order_by('-createdAt', '-id')[:limit + 1])
+    if legacy:
+        rows = sorted(
+            rows + legacy, key=lambda m: (m.createdAt, m.id), reverse=True
+        )[:limit + 1]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    rows.reverse()
+    return rows, next_cursor
+
+
+def rollup_pipeline(exercise_id, unit, since=None):
+    match = {'exercise_id': exercise_id, 'deleteFlag': False}
+    if since is not None:
+        match['createdAt'] = {'$gte': since}
+    bucket = {
+        'date': '$createdAt',
+        'unit': unit,
+        'timezone': timezone.get_current_timezone_name(),
+    }
+    if unit == 'week':
+        # Persian calendar weeks start on Saturday
+        bucket['startOfWeek'] = 'saturday'
+    group = {'_id': {'$dateTrunc': bucket}, 'count': {'$sum': 1}}
+    for field in SCORES:
+        group[f'{field}_mean'] = {'$avg': f'${field}'}
+        group[f'{field}_min'] = {'$min': f'${field}'}
+        group[f'{field}_max'] = {'$max': f'${field}'}
+    return [
+        {'$match': match},
+        {'$group': group},
+        {'$sort': {'_id': 1}},
+    ]
+
+
+def _bucket_start(created, unit):
+    # what $dateTrunc in rollup_pipeline gives, for legacy entries
+    day = timezone.localtime(created).date()
+    if unit == 'week':
+        # back to Saturday
+        day -= timedelta(days=(day.weekday() - 5) % 7)
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start.astimezone(dt_timezone.utc)
+
+
+def metrics_rollup(exercise, unit, since=None):
+    """Per-day or per-week count, mean, min and max of every score."""
+    db = connections[ExerciseMetric.objects.db]
+    collection = db.get_collection(ExerciseMetric._meta.db_table)
+    stats = {}
+    pipeline = rollup_pipeline(exercise.id, unit, since)
+    for row in collection.aggregate(pipeline):
+        start = row['_id']
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start, dt_timezone.utc)
+        stats[start.astimezone(dt_timezone.utc)] = row
+    for metric in legacy_metrics(exercise):
+        if since is not None and metric.createdAt < since:
+            continue
+        start = _bucket_start(metric.createdAt, unit)
+        row = stats.setdefault(start, {'count': 0})
+        count = row['count']
+        for field in SCORES:
+            value = getattr(metric, field)
+            if not count:
+                row[f'{field}_mean'] = row[f'{field}_min'] = \
+                    row[f'{field}_max'] = value
+                continue
+            row[f'{field}_mean'] += (value - row[f'{field}_mean']) / (
+                count + 1
+            )
+            row[f'{field}_min'] = min(row[f'{field}_min'], value)
+            row[f'{field}_max'] = max(row[f'{field}_max'], value)
+        row['count'] = count + 1
+    buckets = []
+    for start, row in sorted(stats.items()):
+        bucket = {'start': start.isoformat(), 'count': row['count']}
+        for field in SCORES:
+            bucket[field] = {
+                stat: round(row[f'{field}_{stat}'], 2)
+                for stat in ('mean', 'min', 'max')
+            }
+        buckets.append(bucket)
+    return buckets
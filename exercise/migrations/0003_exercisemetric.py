@@ -0,0 +1,30 @@
+# Generated by Django 5.1.8 on 2026-10-18 14:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercise', '0002_scoringjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExerciseMetric',
+            fields=[
+                ('id', models.CharField(editable=False, max_length=24, primary_key=True, serialize=False)),
+                ('pitch_score', models.FloatField(default=0)),
+                ('tempo_score', models.FloatField(default=0)),
+                ('energy_score', models.FloatField(default=0)),
+                ('final_score', models.FloatField(default=0)),
+                ('createdAt', models.DateTimeField()),
+                ('deleteFlag', models.BooleanField(default=False)),
+                ('exercise', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_entries', to='exercise.exercise')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['exercise', 'createdAt'], name='exercise_metric_ex_created')],
+            },
+        ),
+    ]
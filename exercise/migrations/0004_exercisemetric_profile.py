@@ -0,0 +1,18 @@
+# Generated by Django 5.1.8 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercise', '0003_exercisemetric'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercisemetric',
+            name='profile',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+    ]
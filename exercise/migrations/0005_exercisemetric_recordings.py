@@ -0,0 +1,28 @@
+# Generated by Django 5.1.8 on 2026-10-18 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exercise', '0004_exercisemetric_profile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exercisemetric',
+            name='mode',
+            field=models.CharField(blank=True, default='', max_length=16),
+        ),
+        migrations.AddField(
+            model_name='exercisemetric',
+            name='reference_digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='exercisemetric',
+            name='take_digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -1,4 +1,6 @@
+from bson import ObjectId
 from django.db import models
+from django.utils.dateparse import parse_datetime
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -13,16 +15,91 @@ class Exercise(models.Model):
     deleteFlag = models.BooleanField(default=False)
 
     def add_metrics(self, pitch_score, tempo_score, energy_score,
-                    final_score, createdDate, delete_flag=False):
-        if hasattr(createdDate, 'isoformat'):
-            createdDate = createdDate.isoformat()
-        metric = {
-            "pitch_score": pitch_score,
-            "tempo_score": tempo_score,
-            "energy_score": energy_score,
-            "final_score": final_score,
-            "createdAt": createdDate,
-            "deleteFlag": delete_flag
+                    final_score, createdDate, delete_flag=False,
+                    profile='', mode='', recordings=None):
+        """
+        Record one attempt as its own ExerciseMetric document. A single
+        insert is atomic, so concurrent evaluations of the same exercise
+        cannot overwrite each other, and the exercise itself is not
+        rewritten. `metrics` only holds history from before the split.
+        recordings is the (reference, take) pair of stored upload hashes
+        the attempt can be re-scored from.
+        """
+        if isinstance(createdDate, str):
+            createdDate = parse_datetime(createdDate)
+        reference_digest, take_digest = recordings or ('', '')
+        return ExerciseMetric.objects.create(
+            id=str(ObjectId()),
+            exercise=self,
+            pitch_score=pitch_score,
+            tempo_score=tempo_score,
+            energy_score=energy_score,
+            final_score=final_score,
+            createdAt=createdDate,
+            deleteFlag=delete_flag,
+            profile=profile,
+            mode=mode,
+            reference_digest=reference_digest,
+            take_digest=take_digest
+        )
+
+
+class ExerciseMetric(models.Model):
+    id = models.CharField(max_length=24, primary_key=True, editable=False)
+    exercise = models.ForeignKey(
+        Exercise, on_delete=models.CASCADE, related_name='metric_entries'
+    )
+    pitch_score = models.FloatField(default=0)
+    tempo_score = models.FloatField(default=0)
+    energy_score = models.FloatField(default=0)
+    final_score = models.FloatField(default=0)
+    createdAt = models.DateTimeField()
+    deleteFlag = models.BooleanField(default=False)
+    # scoring profile the attempt was scored with, empty for old entries
+    profile = models.CharField(max_length=16, blank=True, default='')
+    # scoring mode and sha256 of the stored reference and take uploads,
+    # so `manage.py rescore` can score the attempt again
+    mode = models.CharField(max_length=16, blank=True, default='')
+    reference_digest = models.CharField(max_length=64, blank=True, default='')
+    take_digest = models.CharField(max_length=64, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['exercise', 'createdAt'],
+                name='exercise_metric_ex_created'
+            ),
+        ]
+
+    def as_dict(self):
+        return {
+            'pitch_score': self.pitch_score,
+            'tempo_score': self.tempo_score,
+            'energy_score': self.energy_score,
+            'final_score': self.final_score,
+            'createdAt': self.createdAt.isoformat(),
+            'profile': self.profile,
         }
-        self.metrics.append(metric)
-        self.save()
+
+
+class ScoringJob(models.Model):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    id = models.CharField(max_length=24, primary_key=True, editable=False)
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE)
+    exercise = models.ForeignKey(
+        Exercise, on_delete=models.CASCADE, null=True, blank=True
+    )
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=PENDING
+    )
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    createdAt = models.DateTimeField()
+    finishedAt = models.DateTimeField(null=True, blank=True)
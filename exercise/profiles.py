@@ -0,0 +1,41 @@
+"""
+Scoring profiles: which spectral features summary scoring extracts and
+compares, and how the score components are weighted.
+"""
+from dataclasses import dataclass
+
+# every averaged spectral feature the pipeline knows how to extract;
+# tonnetz needs HPSS and a CQT, tonnetz_chroma reuses the STFT chroma
+SPECTRAL_FEATURES = (
+    'mfccs', 'chroma', 'contrast', 'tonnetz', 'tonnetz_chroma'
+)
+
+
+@dataclass(frozen=True)
+class ScoringProfile:
+    name: str
+    # features averaged into the similarity score
+    similarity: tuple
+    pitch_weight: float = 0.5
+    tempo_weight: float = 0.15
+    energy_weight: float = 0.15
+    similarity_weight: float = 0.2
+
+
+SCORING_PROFILES = {
+    profile.name: profile for profile in (
+        # the original scoring, HPSS-based tonnetz included
+        ScoringProfile('full', ('mfccs', 'chroma', 'contrast', 'tonnetz')),
+        ScoringProfile(
+            'balanced', ('mfccs', 'chroma', 'contrast', 'tonnetz_chroma')
+        ),
+        ScoringProfile('fast', ('mfccs', 'chroma')),
+    )
+}
+
+
+def get_profile(name):
+    try:
+        return SCORING_PROFILES[name]
+    except KeyError:
+        raise ValueError(f'unknown scoring profile {name!r}')
@@ -2,7 +2,7 @@ document.addEventListener('DOMContentLoaded', () => {
     setupAudioHandlers();
     setupSongSelection();
     initInitialUIState();
-    handleServerResult();
+    setupScoringForm();
     const selectedInput = document.getElementById('selectedExerciseInput');
     if (selectedInput && selectedInput.value) {
         const exerciseId = selectedInput.value;
@@ -165,6 +165,47 @@ function setupAudioHandlers() {
     });
 }
 
+// when exercise selected, fetch metrics and render chart via global helpers
+async function fetchAndRenderMetrics(exerciseId) {
+    try {
+        const res = await fetch(`/exercise/ajax/metrics/${exerciseId}/`);
+        const data = await res.json();
+        if (!data.success) {
+            console.warn('metrics fetch failed', data);
+            return;
+        }
+        const metrics = data.metrics || [];
+        const labels = metrics.map(m => m.createdAt ? new Date(m.createdAt).toLocaleString() : '');
+        const pitch = metrics.map(m => Number(m.pitch_score) || 0);
+        const tempo = metrics.map(m => Number(m.tempo_score) || 0);
+        const energy = metrics.map(m => Number(m.energy_score) || 0);
+        const finalS = metrics.map(m => Number(m.final_score) || 0);
+        if (!metrics.length) {
+            // hide performance metrics and clear chart
+            const perf = document.getElementById('performanceMetrics');
+            if (perf) perf.style.display = 'none';
+            updateGlobalChart([], [], [], [], []);
+        } else {
+            // show and populate latest metric
+            const perf = document.getElementById('performanceMetrics');
+            if (perf) perf.style.display = '';
+            const latest = metrics[metrics.length - 1];
+            // update metric cards
+            const overallEl = document.getElementById('overallScoreValue');
+            const pitchEl = document.getElementById('pitchScoreValue');
+            const tempoEl = document.getElementById('tempoScoreValue');
+            const energyEl = document.getElementById('energyScoreValue');
+            if (overallEl) overallEl.textContent = latest.final_score ?? latest.overall_score ?? '0';
+            if (pitchEl) pitchEl.textContent = latest.pitch_score ?? '0';
+            if (tempoEl) tempoEl.textContent = latest.tempo_score ?? latest.tempo_diff_percentage ?? '0';
+            if (energyEl) energyEl.textContent = latest.energy_score ?? '0';
+            updateGlobalChart(labels, pitch, tempo, energy, finalS);
+        }
+    } catch (err) {
+        console.error('failed to load metrics', err);
+    }
+}
+
 // Setup song selection and audio playback
 function setupSongSelection() {
     const songCards = document.querySelectorAll('.song-card');
@@ -175,47 +216,6 @@ function setupSongSelection() {
     const practiceUpload = document.getElementById('practiceUpload');
     const metricsArea = document.getElementById('metricsArea');
 
-    // when exercise selected, fetch metrics and render chart via global helpers
-    async function fetchAndRenderMetrics(exerciseId) {
-        try {
-            const res = await fetch(`/exercise/ajax/metrics/${exerciseId}/`);
-            const data = await res.json();
-            if (!data.success) {
-                console.warn('metrics fetch failed', data);
-                return;
-            }
-            const metrics = data.metrics || [];
-            const labels = metrics.map(m => m.createdAt ? new Date(m.createdAt).toLocaleString() : '');
-            const pitch = metrics.map(m => Number(m.pitch_score) || 0);
-            const tempo = metrics.map(m => Number(m.tempo_score) || 0);
-            const energy = metrics.map(m => Number(m.energy_score) || 0);
-            const finalS = metrics.map(m => Number(m.final_score) || 0);
-            if (!metrics.length) {
-                // hide performance metrics and clear chart
-                const perf = document.getElementById('performanceMetrics');
-                if (perf) perf.style.display = 'none';
-                updateGlobalChart([], [], [], [], []);
-            } else {
-                // show and populate latest metric
-                const perf = document.getElementById('performanceMetrics');
-                if (perf) perf.style.display = '';
-                const latest = metrics[metrics.length - 1];
-                // update metric cards
-                const overallEl = document.getElementById('overallScoreValue');
-                const pitchEl = document.getElementById('pitchScoreValue');
-                const tempoEl = document.getElementById('tempoScoreValue');
-                const energyEl = document.getElementById('energyScoreValue');
-                if (overallEl) overallEl.textContent = latest.final_score ?? latest.overall_score ?? '0';
-                if (pitchEl) pitchEl.textContent = latest.pitch_score ?? '0';
-                if (tempoEl) tempoEl.textContent = latest.tempo_score ?? latest.tempo_diff_percentage ?? '0';
-                if (energyEl) energyEl.textContent = latest.energy_score ?? '0';
-                updateGlobalChart(labels, pitch, tempo, energy, finalS);
-            }
-        } catch (err) {
-            console.error('failed to load metrics', err);
-        }
-    }
-
     songCards.forEach((card, idx) => {
         const btn = card.querySelector('.select-btn');
         btn.addEventListener('click', function(e) {
@@ -447,15 +447,77 @@ function updateGlobalChart(labels, pitch, tempo, energy, finalS) {
     chart.update();
 }
 
-function handleServerResult() {
-    // If server provided `result`, Django rendered it via json_script with id chartjsResultData
-    const jsonEl = document.getElementById('chartjsResultData');
-    if (!jsonEl) return;
-    let result = {};
-    try {
-        result = JSON.parse(jsonEl.textContent || jsonEl.innerText || '{}');
-    } catch (e) {
-        console.warn('failed to parse server result', e);
+// Scoring runs as a background job: submit the recordings, then poll the
+// job until it is done and show its result
+const JOB_POLL_INTERVAL_MS = 1000;
+const JOB_POLL_MAX_INTERVAL_MS = 5000;
+
+function setupScoringForm() {
+    const form = document.getElementById('scoringForm');
+    if (!form) return;
+    form.addEventListener('submit', async function(e) {
+        e.preventDefault();
+        const analyzeBtn = document.getElementById('analyzeBtn');
+        const label = analyzeBtn ? analyzeBtn.textContent : '';
+        if (analyzeBtn) {
+            analyzeBtn.disabled = true;
+            analyzeBtn.textContent = 'در حال تحلیل...';
+        }
+        showScoringError('');
+        try {
+            const res = await fetch(form.action, {
+                method: 'POST',
+                headers: {'X-CSRFToken': form.querySelector('[name=csrfmiddlewaretoken]').value},
+                body: new FormData(form)
+            });
+            const data = await res.json();
+            if (!data.success) {
+                showScoringError(data.error || 'فایل‌های صوتی را بررسی کنید');
+                return;
+            }
+            const job = await pollScoringJob(data.job_id);
+            if (job.status === 'done') {
+                renderResult(job.result);
+                const exerciseId = form.querySelector('[name=selected_exercise]').value;
+                if (exerciseId) fetchAndRenderMetrics(exerciseId);
+            } else {
+                showScoringError(job.error || 'تحلیل ناموفق بود');
+            }
+        } catch (err) {
+            console.error('scoring failed', err);
+            showScoringError('خطا در ارتباط با سرور');
+        } finally {
+            if (analyzeBtn) {
+                analyzeBtn.disabled = false;
+                analyzeBtn.textContent = label;
+            }
+        }
+    });
+}
+
+async function pollScoringJob(jobId) {
+    let interval = JOB_POLL_INTERVAL_MS;
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, interval));
+        const res = await fetch(`/exercise/ajax/jobs/${jobId}/`);
+        const job = await res.json();
+        if (!job.success) return {status: 'failed', error: job.error};
+        if (job.status !== 'pending') return job;
+        interval = Math.min(interval * 1.5, JOB_POLL_MAX_INTERVAL_MS);
+    }
+}
+
+function showScoringError(message) {
+    const errorEl = document.getElementById('scoringError');
+    const textEl = document.getElementById('scoringErrorText');
+    if (textEl) textEl.textContent = message;
+    if (errorEl) errorEl.style.display = message ? '' : 'none';
+}
+
+function renderResult(result) {
+    if (!result) return;
+    if (result.error) {
+        showScoringError(result.error);
         return;
     }
     // show performance metrics area
@@ -463,6 +525,16 @@ function handleServerResult() {
     if (perf) perf.style.display = '';
     const metricsArea = document.getElementById('metricsArea');
     if (metricsArea) metricsArea.style.display = '';
+    const values = {
+        overallScoreValue: result.overall_score ?? result.final_score,
+        pitchScoreValue: result.pitch_score,
+        tempoScoreValue: result.tempo_diff_percentage ?? result.tempo_score,
+        energyScoreValue: result.energy_score
+    };
+    for (const [id, value] of Object.entries(values)) {
+        const el = document.getElementById(id);
+        if (el) el.textContent = value ?? '0';
+    }
     // create single-point chart from result
     const label = result.createdAt ? new Date(result.createdAt).toLocaleString('fa-IR') : new Date().toLocaleString('fa-IR');
     const labels = [label];
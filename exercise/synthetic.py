@@ -0,0 +1,55 @@
+import librosa
+import numpy as np
+
+
+def piano_tone(midi, sr, seconds, partials=8, inharmonicity=1e-4):
+    """
+    Rough piano-like tone: stretched harmonic partials with a short
+    attack and a decay that is faster for the upper partials.
+    """
+    f0 = librosa.midi_to_hz(midi)
+    t = np.arange(int(seconds * sr)) / sr
+    y = np.zeros_like(t)
+    for k in range(1, partials + 1):
+        fk = k * f0 * np.sqrt(1 + inharmonicity * k ** 2)
+        if fk >= sr / 2:
+            break
+        y += np.exp(-t * (1.5 + 0.7 * k)) * np.sin(2 * np.pi * fk * t) / k
+    attack = min(len(t), int(0.005 * sr))
+    y[:attack] *= np.linspace(0, 1, attack, endpoint=False)
+    return y
+
+
+def piano_sequence(notes, sr=22050, note_seconds=0.5, noise=1e-3, seed=0):
+    """
+    Render a sequence of notes. Each item is a MIDI number, a tuple of
+    MIDI numbers for a chord, or None for a rest.
+    """
+    hop = int(note_seconds * sr)
+    # let the last note ring for one extra note length
+    y = np.zeros(hop * (len(notes) + 1))
+    for i, item in enumerate(notes):
+        if item is None:
+            continue
+        chord = item if isinstance(item, (tuple, list)) else (item,)
+        for midi in chord:
+            tone = piano_tone(midi, sr, 2 * note_seconds)
+            span = y[i * hop:i * hop + len(tone)]
+            span += 0.3 * tone[:len(span)] / len(chord)
+    y += noise * np.random.default_rng(seed).standard_normal(len(y))
+    return y.astype(np.float32)
+
+
+def c_major_scale(octaves=2, root=60):
+    steps = [0, 2, 4, 5, 7, 9, 11]
+    notes = [root + 12 * o + s for o in range(octaves) for s in steps]
+    return notes + [root + 12 * octaves]
+
+
+def chord_progression(repeats=2, root=48):
+    # I - IV - V - I in root position
+    chords = [(0, 4, 7), (5, 9, 12), (7, 11, 14), (0, 4, 7)]
+    return [
+        tuple(root + i for i in chord)
+        for _ in range(repeats) for chord in chords
+    ]
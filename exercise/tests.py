@@ -1 +1,860 @@
-# Create your tests here.
\ No newline at end of file
+import asyncio
+import gc
+import io
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
+
+import librosa
+import numpy as np
+from bson import ObjectId
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.testing import make_user
+
+from . import jobs, synthetic, views, warmup
+from .analysis import SpectralAnalysis
+from .alignment import (
+    ALIGN_HOP, ALIGN_SR, _unit_columns, align, evaluate_alignment,
+    extract_alignment_features
+)
+from .benchmarks import _wav_bytes, tiered_takes
+from .cache import FeatureCache
+from .features import FeatureRecord
+from .metrics import legacy_metrics, metrics_page, metrics_rollup
+from .jobs import (
+    fail_stale_jobs, new_scoring_pool, run_concurrently, submit_background,
+    submit_scoring_job
+)
+from .library import ReferenceLibrary
+from .management.commands.rescore import _parse_when
+from .live import CLOSE_INVALID_DATA, LIVE_PATH, live_scoring_app
+from .models import Exercise, ExerciseMetric, ScoringJob
+from .profiles import SCORING_PROFILES
+from .tiered import TierStats
+from .warmup import serving
+from .windowed import analyze_windowed
+from .views import (
+    evaluate_performance, extract_features_windowed,
+    load_and_extract_features_from_array
+)
+
+SR = 22050
+
+
+def _thread_name():
+    return threading.current_thread().name
+
+
+def _analysis_pid():
+    # the pid of the analysis process a scoring worker hands a window to
+    return jobs.get_analysis_executor().submit(os.getpid).result()
+
+
+def _warm_up_calls():
+    # warm_up is a mock inherited from the test process by fork
+    return warmup.warm_up.call_count
+
+
+def _extraction_thread_names():
+    # what a scoring job's pair extraction runs on, inside a pool worker
+    return run_concurrently((_thread_name,), (_thread_name,))
+
+
+@override_settings(EXERCISE_ANALYSIS_WORKERS=1)
+class FeatureRecordTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.take = synthetic.piano_sequence(
+            synthetic.c_major_scale() * 2, sr=SR, noise=1e-2, seed=1
+        )
+        cls.record = load_and_extract_features_from_array(
+            cls.take, SR, frames=True,
+            features=SCORING_PROFILES['fast'].similarity
+        )
+
+    def test_bytes_round_trip_is_lossless(self):
+        restored = FeatureRecord.from_bytes(self.record.to_bytes())
+        self.assertEqual(restored.keys(), self.record.keys())
+        self.assertEqual(restored.sr, self.record.sr)
+        self.assertEqual(restored.tempo, self.record.tempo)
+        for name in self.record.keys()[2:]:
+            np.testing.assert_array_equal(restored[name], self.record[name])
+            self.assertEqual(restored[name].dtype, self.record[name].dtype)
+        self.assertEqual(
+            evaluate_performance(restored, restored, 'fast'),
+            evaluate_performance(self.record, self.record, 'fast')
+        )
+
+    def test_pickles_through_compact_layout(self):
+        restored = pickle.loads(pickle.dumps(self.record))
+        np.testing.assert_array_equal(
+            restored['mfcc_frames'], self.record['mfcc_frames']
+        )
+
+    def test_rejects_other_schema(self):
+        data = bytearray(self.record.to_bytes())
+        with self.assertRaises(ValueError):
+            FeatureRecord.from_bytes(b'not a record')
+        header = data.replace(b'"schema": 1', b'"schema": 9')
+        with self.assertRaises(ValueError):
+            FeatureRecord.from_bytes(bytes(header))
+
+    def test_rejects_truncated_and_damaged_records(self):
+        data = self.record.to_bytes()
+        for cut in range(0, len(data), 97):
+            with self.assertRaises(ValueError):
+                FeatureRecord.from_bytes(data[:cut])
+        # same length, so only the dtype is wrong
+        damaged = data.replace(b'"<f4"', b'12345', 1)
+        with self.assertRaises(ValueError):
+            FeatureRecord.from_bytes(damaged)
+
+    def test_cache_drops_corrupt_records(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = FeatureCache(tmp, max_bytes=1 << 30, version=1)
+            key = cache.key(b'take')
+            cache.set_record(key, self.record)
+            path = cache._path(key, cache.record_suffix)
+            with open(path, 'r+b') as f:
+                f.truncate(os.path.getsize(path) // 2)
+            self.assertIsNone(cache.get_record(key))
+            self.assertFalse(os.path.exists(path))
+
+    def test_float32_without_raw_audio(self):
+        self.assertNotIn('y', self.record)
+        self.assertEqual(self.record['chroma'].dtype, np.float32)
+        self.assertEqual(self.record['energy'].dtype, np.float32)
+
+    def test_evaluation_does_not_retain_audio(self):
+        features = SCORING_PROFILES['fast'].similarity
+        gc.collect()
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            take = synthetic.piano_sequence(
+                synthetic.c_major_scale(), sr=SR, noise=1e-2, seed=2
+            )
+            audio_bytes = take.nbytes
+            stu = load_and_extract_features_from_array(
+                take, SR, features=features
+            )
+            del take
+            gc.collect()
+            # what stays alive for the rest of the request
+            retained = tracemalloc.get_traced_memory()[0] - baseline
+            evaluate_performance(self.record, stu, 'fast')
+        finally:
+            tracemalloc.stop()
+        # the old feature dicts kept the whole signal next to the features
+        self.assertLess(retained, audio_bytes / 10)
+        self.assertLess(len(stu.to_bytes()), audio_bytes / 10)
+
+
+class AlignmentTests(SimpleTestCase):
+
+    def chroma(self, rng, n):
+        return _unit_columns(rng.random((12, n)))
+
+    def assert_matches_librosa(self, X, Y, subsequence):
+        path, costs = align(X, Y, subsequence=subsequence)
+        D, wp = librosa.sequence.dtw(
+            X, Y, metric='cosine', subseq=subsequence
+        )
+        np.testing.assert_array_equal(path, wp[::-1])
+        total = D[-1].min() if subsequence else D[-1, -1]
+        self.assertAlmostEqual(float(costs.sum()), float(total), places=9)
+
+    def test_full_grid_matches_librosa(self):
+        rng = np.random.default_rng(0)
+        for n, m in [(30, 40), (40, 30), (2, 25)]:
+            with self.subTest(n=n, m=m):
+                self.assert_matches_librosa(
+                    self.chroma(rng, n), self.chroma(rng, m), False
+                )
+
+    def test_full_grid_subsequence_matches_librosa(self):
+        rng = np.random.default_rng(1)
+        for n, m in [(20, 60), (35, 40)]:
+            with self.subTest(n=n, m=m):
+                self.assert_matches_librosa(
+                    self.chroma(rng, n), self.chroma(rng, m), True
+                )
+
+    def test_five_minute_pair_stays_small(self):
+        rng = np.random.default_rng(2)
+        n = int(300 * ALIGN_SR / ALIGN_HOP)
+        X = self.chroma(rng, n).astype(np.float32)
+        Y = self.chroma(rng, n).astype(np.float32)
+        tracemalloc.start()
+        try:
+            path, _ = align(X, Y)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # the full cost matrix alone would be n * n * 8 bytes, ~330 MB
+        self.assertLess(peak, 4 * 1024 * 1024)
+        # the whole take is aligned
+        self.assertEqual((path[0][0], path[-1][0]), (0, n - 1))
+
+    def test_too_short_input_is_rejected(self):
+        feats = {
+            'chroma': np.ones((12, 1), dtype=np.float32),
+            'pitches': np.zeros(1, dtype=np.float32),
+            'energy': np.zeros(1, dtype=np.float32),
+        }
+        longer = {
+            name: np.repeat(value, 50, axis=-1)
+            for name, value in feats.items()
+        }
+        with self.assertRaises(ValueError):
+            evaluate_alignment(longer, feats)
+        with self.assertRaises(ValueError):
+            evaluate_alignment(feats, longer)
+
+
+class FeatureCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = FeatureCache(tmp.name, max_bytes=1 << 30, version=1)
+        rng = np.random.default_rng(0)
+        self.keys = []
+        now = time.time()
+        for i in range(5):
+            key = self.cache.key(bytes([i]))
+            self.cache.set(key, {'sr': 22050, 'mfcc': rng.random(2000)})
+            # oldest first, one minute apart
+            os.utime(self.cache._path(key), (now - 600 + 60 * i,) * 2)
+            self.keys.append(key)
+
+    def sizes(self):
+        return {
+            key: os.path.getsize(self.cache._path(key))
+            for key in self.keys if os.path.exists(self.cache._path(key))
+        }
+
+    def test_evicts_oldest_entries_past_the_limit(self):
+        sizes = self.sizes()
+        self.cache.max_bytes = sum(sizes[key] for key in self.keys[2:])
+        self.cache.evict()
+        self.assertEqual(list(self.sizes()), self.keys[2:])
+        self.assertLessEqual(sum(self.sizes().values()), self.cache.max_bytes)
+
+    def test_reads_count_as_use(self):
+        self.assertIsNotNone(self.cache.get(self.keys[0]))
+        sizes = self.sizes()
+        self.cache.max_bytes = sizes[self.keys[0]] + sizes[self.keys[4]]
+        self.cache.evict()
+        self.assertEqual(set(self.sizes()), {self.keys[0], self.keys[4]})
+
+    def test_writes_past_the_limit_evict(self):
+        self.cache.max_bytes = sum(self.sizes().values())
+        key = self.cache.key(b'new')
+        self.cache.set(key, {'sr': 22050, 'mfcc': np.ones(2000) / 3})
+        remaining = self.sizes()
+        self.assertNotIn(self.keys[0], remaining)
+        self.assertTrue(os.path.exists(self.cache._path(key)))
+        total = sum(remaining.values()) + os.path.getsize(
+            self.cache._path(key)
+        )
+        self.assertLessEqual(total, self.cache.max_bytes)
+
+
+@override_settings(EXERCISE_SCORING_JOB_TIMEOUT=60, ALLOWED_HOSTS=['*'])
+class StaleScoringJobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('student')
+
+    def make_job(self, age):
+        return ScoringJob.objects.create(
+            id=str(ObjectId()), user=self.user, status=ScoringJob.PENDING,
+            createdAt=timezone.now() - timedelta(seconds=age)
+        )
+
+    def test_jobs_of_a_lost_process_fail(self):
+        stale, fresh = self.make_job(120), self.make_job(10)
+        self.assertEqual(fail_stale_jobs(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual(stale.status, ScoringJob.FAILED)
+        self.assertTrue(stale.error)
+        self.assertIsNotNone(stale.finishedAt)
+        self.assertEqual(fresh.status, ScoringJob.PENDING)
+
+    def test_finished_jobs_are_left_alone(self):
+        job = self.make_job(120)
+        ScoringJob.objects.filter(id=job.id).update(status=ScoringJob.DONE)
+        self.assertEqual(fail_stale_jobs(), 0)
+
+    def test_polling_a_stale_job_reports_failure(self):
+        session = self.client.session
+        session['user_id'] = self.user.id
+        session.save()
+        job = self.make_job(120)
+        response = self.client.get(
+            reverse('ajax_scoring_job_status', args=[job.id])
+        )
+        self.assertEqual(response.json()['status'], ScoringJob.FAILED)
+        self.assertTrue(response.json()['error'])
+
+
+class BrokenPoolTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('student')
+
+    def broken_pool(self):
+        pool = mock.Mock()
+        pool.submit.side_effect = BrokenProcessPool('a worker died')
+        return pool
+
+    def working_pool(self):
+        pool = mock.Mock()
+        pool.submit.return_value = Future()
+        return pool
+
+    def test_broken_pool_is_replaced(self):
+        broken, working = self.broken_pool(), self.working_pool()
+        with mock.patch.object(jobs, '_executor', broken), \
+                mock.patch.object(jobs, 'new_scoring_pool',
+                                  return_value=working):
+            job = submit_scoring_job(self.user, None, len, b'take')
+            self.assertIs(jobs._executor, working)
+        working.submit.assert_called_once_with(len, b'take')
+        broken.shutdown.assert_called_once_with(wait=False)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScoringJob.PENDING)
+
+    def test_job_fails_when_the_new_pool_breaks_too(self):
+        with mock.patch.object(jobs, '_executor', self.broken_pool()), \
+                mock.patch.object(jobs, 'new_scoring_pool',
+                                  return_value=self.broken_pool()):
+            job = submit_scoring_job(self.user, None, len, b'take')
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScoringJob.FAILED)
+        self.assertEqual(job.error, 'a worker died')
+        self.assertIsNotNone(job.finishedAt)
+
+    def test_background_tasks_recover_too(self):
+        working = self.working_pool()
+        with mock.patch.object(jobs, '_executor', self.broken_pool()), \
+                mock.patch.object(jobs, 'new_scoring_pool',
+                                  return_value=working):
+            submit_background(len, b'take')
+        working.submit.assert_called_once_with(len, b'take')
+
+
+@override_settings(
+    EXERCISE_EXTRACTION_THREADS=2, EXERCISE_EXTRACTION_BLAS_THREADS=4,
+    EXERCISE_SCORING_WORKERS=2, EXERCISE_WARMUP_ON_STARTUP=False
+)
+class WorkerExtractionTests(SimpleTestCase):
+
+    def test_workers_extract_the_pair_side_by_side(self):
+        pool = new_scoring_pool(1)
+        try:
+            names = pool.submit(_extraction_thread_names).result()
+        finally:
+            pool.shutdown()
+        self.assertEqual(names[0], 'MainThread')
+        self.assertTrue(names[1].startswith('extraction'))
+
+    def test_workers_cap_blas_at_their_share(self):
+        with mock.patch.object(jobs, '_in_worker', True), \
+                mock.patch.object(jobs, '_extraction_executor', None), \
+                mock.patch.object(jobs, 'threadpool_limits') as limits:
+            jobs.get_extraction_executor().shutdown()
+        limits.assert_called_once_with(limits=2, user_api='blas')
+
+
+@override_settings(
+    EXERCISE_ANALYSIS_WORKERS=4, EXERCISE_SCORING_WORKERS=2,
+    EXERCISE_WARMUP_ON_STARTUP=False
+)
+class WorkerAnalysisTests(SimpleTestCase):
+
+    def test_workers_analyse_on_their_own_pool(self):
+        pool = new_scoring_pool(1)
+        try:
+            worker = pool.submit(os.getpid).result()
+            analysis = pool.submit(_analysis_pid).result()
+        finally:
+            pool.shutdown()
+        self.assertNotIn(analysis, (worker, os.getpid()))
+
+    def test_workers_split_the_analysis_processes(self):
+        with mock.patch.object(jobs, '_in_worker', True):
+            self.assertEqual(jobs.analysis_workers(), 2)
+            with self.settings(EXERCISE_ANALYSIS_WORKERS=3):
+                self.assertIsNone(jobs.get_analysis_executor())
+
+    def test_long_takes_in_workers_are_windowed(self):
+        take = np.zeros(SR * 31, dtype=np.float32)
+        executor = mock.Mock()
+        with mock.patch.object(views, 'get_analysis_executor',
+                               return_value=executor), \
+                mock.patch.object(views, 'extract_features_windowed') as wf:
+            load_and_extract_features_from_array(take, SR)
+        self.assertIs(wf.call_args.args[2], executor)
+
+
+class RescoreSelectionTests(SimpleTestCase):
+
+    @override_settings(TIME_ZONE='Asia/Tehran')
+    def test_bounds_are_aware(self):
+        day = _parse_when('2026-03-01')
+        self.assertTrue(timezone.is_aware(day))
+        self.assertEqual(
+            day.utcoffset(), timedelta(hours=3, minutes=30)
+        )
+        self.assertTrue(timezone.is_aware(_parse_when('2026-03-01T10:00')))
+        self.assertEqual(
+            _parse_when('2026-03-01T10:00+00:00').utcoffset(), timedelta(0)
+        )
+
+
+class LiveProtocolTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.take = synthetic.piano_sequence(
+            synthetic.c_major_scale()[:4], sr=SR
+        )
+        cls.reference = extract_alignment_features(cls.take, SR, 'yin')
+
+    def converse(self, *messages):
+        """Feed messages to the app, return what it sent after accepting."""
+        async def run():
+            incoming = asyncio.Queue()
+            sent = []
+            await incoming.put({'type': 'websocket.connect'})
+            for message in messages:
+                if isinstance(message, bytes):
+                    message = {'type': 'websocket.receive', 'bytes': message}
+                else:
+                    message = {
+                        'type': 'websocket.receive',
+                        'text': json.dumps(message)
+                    }
+                await incoming.put(message)
+            await incoming.put({'type': 'websocket.disconnect'})
+            scope = {
+                'type': 'websocket', 'path': LIVE_PATH, 'headers': [],
+                'session': {'user_id': 'student'},
+            }
+            with mock.patch(
+                'exercise.live._load_reference', return_value=self.reference
+            ):
+                await asyncio.wait_for(
+                    live_scoring_app(scope, incoming.get, self.collect(sent)),
+                    timeout=30
+                )
+            return sent
+        sent = asyncio.run(run())
+        self.assertEqual(sent[0]['type'], 'websocket.accept')
+        return sent[1:]
+
+    @staticmethod
+    def collect(sent):
+        async def send(message):
+            sent.append(message)
+        return send
+
+    def start(self, **fields):
+        return {'type': 'start', 'reference': 'ref.wav', **fields}
+
+    def assertRejected(self, sent, fragment):
+        *replies, close = sent
+        self.assertEqual(close, {
+            'type': 'websocket.close', 'code': CLOSE_INVALID_DATA
+        })
+        error = json.loads(replies[-1]['text'])
+        self.assertEqual(error['type'], 'error')
+        self.assertIn(fragment, error['error'])
+
+    def test_streams_scores(self):
+        pcm = self.take.astype('<f4').tobytes()
+        sent = self.converse(
+            self.start(sample_rate=SR), pcm, {'type': 'stop'}
+        )
+        kinds = [json.loads(m['text'])['type'] for m in sent[:-1]]
+        self.assertEqual(kinds[0], 'ready')
+        self.assertEqual(kinds[-1], 'final')
+        self.assertEqual(sent[-1]['code'], 1000)
+
+    def test_partial_sample_is_rejected(self):
+        sent = self.converse(self.start(format='s16'), b'\x00\x01\x02')
+        self.assertRejected(sent, '2-byte samples')
+
+    def test_unknown_format_is_rejected(self):
+        self.assertRejected(
+            self.converse(self.start(format='mp3')), 'format'
+        )
+
+    def test_bad_sample_rates_are_rejected(self):
+        for sample_rate in ['fast', -44100, 10 ** 9, [44100], 1.5e12]:
+            with self.subTest(sample_rate=sample_rate):
+                self.assertRejected(
+                    self.converse(self.start(sample_rate=sample_rate)),
+                    'sample_rate'
+                )
+
+    def test_reference_must_be_a_name(self):
+        self.assertRejected(
+            self.converse(self.start(reference=['ref.wav'])), 'reference'
+        )
+
+    def test_non_object_message_is_answered(self):
+        sent = self.converse([1, 2])
+        self.assertEqual(json.loads(sent[0]['text'])['type'], 'error')
+
+
+class MigrateExerciseMetricsTests(TestCase):
+    undated = [
+        {'pitch_score': 50, 'final_score': 40},
+        {'pitch': 70, 'createdAt': 'yesterday'},
+        ['not', 'a', 'dict'],
+    ]
+
+    def setUp(self):
+        self.exercise = Exercise.objects.create(
+            id=str(ObjectId()), title='scale', user=make_user('student'),
+            metrics=[
+                {'pitch_score': 80, 'tempo': 90, 'overall_score': 85,
+                 'createdAt': '2025-01-02T10:00:00+00:00'},
+                self.undated[0],
+                {'pitchScore': 60, 'finalScore': 55,
+                 'created_at': '2025-01-03T10:00:00'},
+                self.undated[1],
+                self.undated[2],
+            ]
+        )
+
+    def migrate(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command(
+            'migrate_exercise_metrics', *args, stdout=out, stderr=err
+        )
+        return out.getvalue(), err.getvalue()
+
+    def test_undated_entries_stay_on_the_exercise(self):
+        _, err = self.migrate()
+        self.assertIn('3 entries without a usable date', err)
+        metrics = ExerciseMetric.objects.filter(
+            exercise=self.exercise
+        ).order_by('createdAt')
+        self.assertEqual(
+            [(m.pitch_score, m.final_score) for m in metrics],
+            [(80, 85), (60, 55)]
+        )
+        self.exercise.refresh_from_db()
+        self.assertEqual(self.exercise.metrics, self.undated)
+
+        # a second run neither duplicates nor loses anything
+        self.migrate()
+        self.assertEqual(
+            ExerciseMetric.objects.filter(exercise=self.exercise).count(), 2
+        )
+        self.exercise.refresh_from_db()
+        self.assertEqual(self.exercise.metrics, self.undated)
+
+    def test_history_is_complete_before_the_migration(self):
+        self.exercise.add_metrics(
+            90, 90, 90, 90, '2025-01-04T10:00:00+00:00'
+        )
+        self.assertEqual(len(legacy_metrics(self.exercise)), 2)
+        rows, cursor = metrics_page(self.exercise, limit=2)
+        self.assertEqual([m.pitch_score for m in rows], [60, 90])
+        rows, cursor = metrics_page(self.exercise, limit=2, cursor=cursor)
+        self.assertEqual([m.pitch_score for m in rows], [80])
+        self.assertIsNone(cursor)
+
+        self.migrate()
+        self.exercise.refresh_from_db()
+        self.assertEqual(legacy_metrics(self.exercise), [])
+        rows, _ = metrics_page(self.exercise)
+        self.assertEqual([m.pitch_score for m in rows], [80, 60, 90])
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_dashboard_counts_legacy_history(self):
+        session = self.client.session
+        session['user_id'] = self.exercise.user_id
+        session.save()
+        response = self.client.get(reverse('exercise'))
+        self.assertEqual(
+            [ex.metric_count for ex in response.context['exercises']], [2]
+        )
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_rollup_includes_legacy_history(self):
+        with mock.patch('exercise.metrics.connections') as connections:
+            connections.__getitem__().get_collection().aggregate\
+                .return_value = []
+            buckets = metrics_rollup(self.exercise, 'week')
+        # 2025-01-02 and 01-03 are a Thursday and Friday of one week
+        self.assertEqual(buckets, [{
+            'start': '2024-12-28T00:00:00+00:00', 'count': 2,
+            'pitch_score': {'mean': 70.0, 'min': 60.0, 'max': 80.0},
+            'tempo_score': {'mean': 45.0, 'min': 0.0, 'max': 90.0},
+            'energy_score': {'mean': 0.0, 'min': 0.0, 'max': 0.0},
+            'final_score': {'mean': 70.0, 'min': 55.0, 'max': 85.0},
+        }])
+
+    def test_dry_run_warns_and_writes_nothing(self):
+        out, err = self.migrate('--dry-run')
+        self.assertIn('Would migrate 2 metrics', out)
+        self.assertIn('3 entries without a usable date', err)
+        self.assertFalse(ExerciseMetric.objects.exists())
+        self.exercise.refresh_from_db()
+        self.assertEqual(len(self.exercise.metrics), 5)
+
+
+@override_settings(EXERCISE_ANALYSIS_WORKERS=1, EXERCISE_TIERED_SCORING=True)
+class TieredScoringTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        patches = [
+            mock.patch.object(views.feature_cache, 'directory', tmp.name),
+            # the pool runs in-process, so the test sees the same caches
+            mock.patch.object(views, 'get_executor', return_value=executor),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    @staticmethod
+    def without_timings(result):
+        return {k: v for k, v in result.items() if k != 'tiers'}
+
+    def test_batch_matches_single_evaluations(self):
+        ref_data = _wav_bytes(
+            synthetic.piano_sequence(synthetic.c_major_scale(), sr=SR), SR
+        )
+        takes = [_wav_bytes(y, SR) for _, y in tiered_takes(SR)]
+        batch = views.score_batch(ref_data, takes, 'fast')
+        single = [
+            views.score_recordings(ref_data, data, profile='fast')
+            for data in takes
+        ]
+        self.assertEqual(
+            [self.without_timings(r) for r in batch],
+            [self.without_timings(r) for r in single]
+        )
+        self.assertIn('silent', [r['early_exit'] for r in batch])
+
+    def test_summary_is_logged(self):
+        stats = TierStats(log_every=2)
+        with self.assertLogs('exercise.tiered', 'INFO') as logs:
+            stats.record(0.01)
+            stats.record(0.01, 0.5)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("'early_exit_rate': 0.5", logs.output[0])
+
+
+@override_settings(
+    EXERCISE_ANALYSIS_WORKERS=1, EXERCISE_PARALLEL_WINDOW_SECONDS=10
+)
+class WindowedAnalysisTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        notes = synthetic.c_major_scale() + synthetic.chord_progression()
+        # 29 s, three windows of 10 s
+        cls.take = synthetic.piano_sequence(
+            notes * 2 + notes[:11], sr=SR, noise=1e-3, seed=3
+        )
+        cls.executor = ThreadPoolExecutor(max_workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.executor.shutdown()
+        super().tearDownClass()
+
+    def test_tracks_match_single_process(self):
+        single = SpectralAnalysis(self.take, SR)
+        windowed = analyze_windowed(
+            self.take, SR, self.executor, window_seconds=10,
+            hpss_tonnetz=False
+        )
+        for name, expected in [
+            ('rms', single.rms),
+            ('chroma', single.chroma()),
+            ('contrast', single.contrast()),
+            ('mfcc', single.mfcc()),
+            ('onset_envelope', single.onset_envelope),
+        ]:
+            with self.subTest(track=name):
+                self.assertEqual(windowed[name].shape, expected.shape)
+                np.testing.assert_allclose(
+                    windowed[name], expected, rtol=1e-4,
+                    atol=1e-4 * np.max(np.abs(expected))
+                )
+        self.assertEqual(float(windowed['tempo']), float(single.tempo))
+
+    def test_features_match_single_process(self):
+        features = SCORING_PROFILES['full'].similarity
+        single = load_and_extract_features_from_array(
+            self.take, SR, features=features
+        )
+        windowed = extract_features_windowed(
+            self.take, SR, self.executor, features=features
+        )
+        self.assertEqual(windowed.tempo, single.tempo)
+        np.testing.assert_array_equal(windowed.pitches, single.pitches)
+        np.testing.assert_allclose(windowed.energy, single.energy, rtol=1e-5)
+        for name in features:
+            with self.subTest(feature=name):
+                # tonnetz estimates tuning per window
+                np.testing.assert_allclose(
+                    windowed[name], single[name], rtol=1e-3,
+                    atol=1e-3 * np.max(np.abs(single[name]))
+                )
+
+
+class UploadRetentionTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.library = ReferenceLibrary(
+            os.path.join(tmp.name, 'audio'),
+            os.path.join(tmp.name, 'features'), 1
+        )
+        now = time.time()
+        self.digests = []
+        for i, age_days in enumerate([30, 20, 10, 0]):
+            name, digest, _ = self.library.add(bytes([i]) * 1000, 'take.wav')
+            self.library.save_features(digest, {'tempo': 120.0})
+            mtime = now - age_days * 86400
+            os.utime(os.path.join(self.library.audio_dir, name), (mtime,) * 2)
+            self.digests.append(digest)
+
+    def stored(self):
+        return [
+            d for d in self.digests if self.library.audio_name(d) is not None
+        ]
+
+    def test_expired_recordings_are_deleted_with_features(self):
+        self.assertEqual(self.library.evict(max_age=15 * 86400), 2)
+        self.assertEqual(self.stored(), self.digests[2:])
+        self.assertFalse(self.library.has_features(self.digests[0]))
+        self.assertTrue(self.library.has_features(self.digests[2]))
+
+    def test_least_recently_stored_go_first_past_the_size_cap(self):
+        # storing the oldest again counts as using it
+        self.library.add(bytes([0]) * 1000, 'again.wav')
+        self.assertEqual(self.library.evict(max_bytes=2000), 2)
+        self.assertEqual(self.stored(), [self.digests[0], self.digests[3]])
+
+
+@override_settings(ALLOWED_HOSTS=['*'])
+class ReferenceUploadTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.library = ReferenceLibrary(
+            os.path.join(tmp.name, 'audio'),
+            os.path.join(tmp.name, 'features'), 1
+        )
+
+    def test_chunked_add_matches_add(self):
+        data = bytes(range(256)) * 100
+        chunks = [data[i:i + 1000] for i in range(0, len(data), 1000)]
+        name, digest, created = self.library.add_chunks(chunks, 'a.wav')
+        self.assertTrue(created)
+        self.assertEqual(digest, self.library.digest(data))
+        self.assertEqual(self.library.read_audio(digest), data)
+        self.assertEqual(
+            self.library.add(data, 'b.wav'), (name, digest, False)
+        )
+        self.assertEqual(
+            self.library.add_chunks(iter(chunks), 'c.wav'),
+            (name, digest, False)
+        )
+        self.assertEqual(os.listdir(self.library.audio_dir), [name])
+
+    @override_settings(EXERCISE_REFERENCE_MAX_BYTES=1000)
+    def test_oversized_uploads_are_rejected_unread(self):
+        upload = SimpleUploadedFile('big.wav', b'x' * 1001)
+        with mock.patch.object(views, 'reference_library') as library:
+            response = self.client.post(
+                reverse('ajax_upload_reference'),
+                {'reference_audio': upload}
+            )
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(response.json()['success'])
+        library.add_chunks.assert_not_called()
+
+
+class WarmupGateTests(SimpleTestCase):
+    def test_servers_warm_up(self):
+        child = {'RUN_MAIN': 'true'}
+        self.assertTrue(serving(['manage.py', 'runserver'], child))
+        self.assertTrue(serving(['manage.py', 'runserver', '--noreload'], {}))
+        self.assertTrue(serving(['/venv/bin/gunicorn', 'pianote.wsgi'], {}))
+        self.assertTrue(serving(['/venv/bin/uvicorn', 'pianote.asgi:app'], {}))
+        self.assertTrue(serving(['/venv/lib/daphne/__main__.py'], {}))
+
+    def test_other_processes_skip_warmup(self):
+        self.assertFalse(serving(['manage.py', 'runserver'], {}))
+        self.assertFalse(serving(['manage.py', 'shell'], {'RUN_MAIN': 'true'}))
+        self.assertFalse(serving(['manage.py', 'test'], {}))
+        self.assertFalse(serving(['/venv/bin/pytest'], {}))
+        self.assertFalse(serving(['/venv/bin/celery', 'worker'], {}))
+        self.assertFalse(serving(['-c'], {}))
+        self.assertFalse(serving([], {}))
+
+    def test_environment_opt_in(self):
+        self.assertTrue(serving(['-c'], {'EXERCISE_WARMUP': '1'}))
+
+    @override_settings(EXERCISE_WARMUP_ON_STARTUP=True)
+    def test_pool_workers_warm_up_before_their_first_task(self):
+        with mock.patch.object(warmup, 'warm_up', return_value={}):
+            pool = new_scoring_pool(1)
+            try:
+                calls = pool.submit(_warm_up_calls).result()
+            finally:
+                pool.shutdown()
+        self.assertEqual(calls, 1)
+
+    @override_settings(EXERCISE_WARMUP_ON_STARTUP=True)
+    def test_pool_workers_do_not_warm_up_twice(self):
+        with mock.patch.object(jobs.django, 'setup'), \
+                mock.patch.object(warmup, 'warm_up',
+                                  return_value={}) as warm, \
+                mock.patch.object(warmup.threading, 'Thread') as thread, \
+                mock.patch.object(warmup, '_started', False), \
+                mock.patch.object(jobs, '_in_worker', False), \
+                mock.patch.object(jobs, '_analysis_executor', None), \
+                mock.patch.object(jobs, '_extraction_executor', None):
+            jobs._init_worker()
+            # what ready() does when setup runs it in a spawned worker
+            warmup.start_warmup()
+        warm.assert_called_once_with()
+        thread.assert_not_called()
@@ -0,0 +1,147 @@
+"""
+Tiered scoring. A coarse pass over cheap features (duration, RMS and a
+low-resolution chroma summary) rejects takes that clearly cannot match
+the reference -- silence, very short clips, a different piece -- before
+the expensive pitch, beat tracking and HPSS stages are run.
+
+Each process keeps running totals in tier_stats and logs them to the
+'exercise.tiered' logger every SUMMARY_EVERY takes.
+"""
+import logging
+import threading
+
+import librosa
+import numpy as np
+
+COARSE_SR = 11025
+COARSE_FRAME = 2048
+
+# below this frame RMS everywhere the take is treated as silence
+SILENCE_RMS = 1e-3
+# takes shorter than this, or than this fraction of the reference
+MIN_SECONDS = 1.5
+MIN_DURATION_RATIO = 0.25
+# centered chroma correlation; unrelated keys land well below zero,
+# different pieces in the same key usually stay above 0.5
+MIN_CHROMA_CORRELATION = 0.3
+
+# takes between two logged summaries of tier_stats
+SUMMARY_EVERY = 100
+
+logger = logging.getLogger(__name__)
+
+
+def coarse_features(y, sr):
+    """Duration, frame RMS and mean chroma on a coarse 11 kHz grid."""
+    duration = len(y) / sr
+    y = librosa.resample(
+        np.asarray(y, dtype=np.float32), orig_sr=sr, target_sr=COARSE_SR,
+        res_type='soxr_lq'
+    )
+    # non-overlapping frames, a fraction of the full pipeline's frames
+    chroma = librosa.feature.chroma_stft(
+        y=y, sr=COARSE_SR, n_fft=COARSE_FRAME, hop_length=COARSE_FRAME,
+        tuning=0.0
+    )
+    rms = librosa.feature.rms(
+        y=y, frame_length=COARSE_FRAME, hop_length=COARSE_FRAME
+    )[0]
+    return {
+        'duration': duration,
+        'rms': rms,
+        'chroma': np.mean(chroma, axis=1),
+    }
+
+
+def chroma_correlation(a, b):
+    a = np.asarray(a, dtype=np.float64) - np.mean(a)
+    b = np.asarray(b, dtype=np.float64) - np.mean(b)
+    norm = np.linalg.norm(a) * np.linalg.norm(b)
+    return float(a @ b / norm) if norm > 0 else 0.0
+
+
+def coarse_check(ref_coarse, stu_coarse):
+    """
+    Returns (reason, chroma correlation). reason is None when the take
+    should go on to full scoring, otherwise 'silent', 'too_short' or
+    'different_piece'.
+    """
+    if np.max(stu_coarse['rms'], initial=0.0) < SILENCE_RMS:
+        return 'silent', 0.0
+    min_seconds = max(
+        MIN_SECONDS, MIN_DURATION_RATIO * float(ref_coarse['duration'])
+    )
+    if stu_coarse['duration'] < min_seconds:
+        return 'too_short', 0.0
+    corr = chroma_correlation(ref_coarse['chroma'], stu_coarse['chroma'])
+    if corr < MIN_CHROMA_CORRELATION:
+        return 'different_piece', corr
+    return None, corr
+
+
+def early_exit_result(reason, corr):
+    # same keys as a full result so callers and metrics need no changes
+    sim_score = round(max(0.0, corr) * 100, 2)
+    return {
+        'pitch_score': 0.0,
+        'tempo_score': 0.0,
+        'tempo_diff': 0.0,
+        'tempo_diff_percentage': 0.0,
+        'energy_score': 0.0,
+        'similarity_score': sim_score,
+        'overall_score': round(0.2 * sim_score, 2),
+        'early_exit': reason,
+    }
+
+
+class TierStats:
+    """
+    Running per-tier timings and early-exit rate of a scorer, logged
+    every log_every takes when it is set.
+    """
+
+    def __init__(self, log_every=None):
+        self.log_every = log_every
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.early_exits = 0
+        self.coarse_seconds = 0.0
+        self.full_seconds = 0.0
+        self.full_runs = 0
+
+    def record(self, coarse_seconds, full_seconds=None):
+        with self._lock:
+            self.runs += 1
+            self.coarse_seconds += coarse_seconds
+            if full_seconds is None:
+                self.early_exits += 1
+            else:
+                self.full_runs += 1
+                self.full_seconds += full_seconds
+            due = self.log_every and self.runs % self.log_every == 0
+        if due:
+            logger.info("tiered scoring: %s", self.summary())
+
+    def summary(self):
+        with self._lock:
+            if not self.runs:
+                return {'runs': 0}
+            coarse_ms = self.coarse_seconds / self.runs * 1000
+            full_ms = (
+                self.full_seconds / self.full_runs * 1000
+                if self.full_runs else 0.0
+            )
+            spent = self.coarse_seconds + self.full_seconds
+            # what running the full pipeline on every take would cost
+            untiered = full_ms / 1000 * self.runs
+            return {
+                'runs': self.runs,
+                'early_exit_rate': round(self.early_exits / self.runs, 3),
+                'coarse_ms': round(coarse_ms, 1),
+                'full_ms': round(full_ms, 1),
+                'cpu_saved': round(1 - spent / untiered, 3)
+                if untiered else 0.0,
+            }
+
+
+tier_stats = TierStats(log_every=SUMMARY_EVERY)
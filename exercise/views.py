@@ -3,16 +3,42 @@ from users.forms import UserSignupForm
 from .forms import AudioUploadForm, ExerciseCreateForm
 from django.http import JsonResponse
 import os
+import time
+from datetime import datetime
+from datetime import time as dt_time
+from functools import lru_cache, partial
 import librosa
 import numpy as np
 from users.views import session_login_required
 from scipy.spatial.distance import cosine
-from scipy.signal import butter, filtfilt
-from .models import Exercise
+from scipy.signal import butter, sosfiltfilt
+from .models import Exercise, ScoringJob
+from .alignment import evaluate_alignment, extract_alignment_features
+from .analysis import SpectralAnalysis, track_pitch
+from .cache import FeatureCache
+from .decoding import decode_audio
+from .features import FeatureRecord
+from .jobs import (
+    fail_stale_jobs, get_analysis_executor, get_executor, run_concurrently,
+    submit_background, submit_scoring_job
+)
+from .index import EMBEDDING_DIM, ReferenceIndex, reference_embedding
+from .library import ReferenceLibrary
+from .profiles import SCORING_PROFILES, SPECTRAL_FEATURES, get_profile
+from .tiered import (
+    coarse_check, coarse_features, early_exit_result, tier_stats
+)
+from .windowed import analyze_windowed
+from .metrics import (
+    METRICS_MAX_PAGE_SIZE, METRICS_PAGE_SIZE, ROLLUP_UNITS, legacy_metrics,
+    metrics_page, metrics_rollup
+)
+from django.conf import settings
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
-import io
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db.models import Count, Q
 
 
 REFERENCE_DIR = os.path.join(
@@ -23,45 +49,71 @@ REFERENCE_DIR = os.path.join(
 )
 os.makedirs(REFERENCE_DIR, exist_ok=True)
 
+# Bump whenever feature extraction changes so stale cache entries are ignored
+FEATURE_PIPELINE_VERSION = 5
+
+feature_cache = FeatureCache(
+    settings.EXERCISE_FEATURE_CACHE_DIR,
+    settings.EXERCISE_FEATURE_CACHE_MAX_BYTES,
+    f'{FEATURE_PIPELINE_VERSION}w{settings.EXERCISE_ANALYSIS_SECONDS}'
+    f'-{settings.EXERCISE_PITCH_BACKEND}'
+)
+
+reference_library = ReferenceLibrary(
+    REFERENCE_DIR,
+    settings.EXERCISE_REFERENCE_LIBRARY_DIR,
+    feature_cache.version
+)
+
+# Uploads behind saved attempts, only the audio side of the library is used
+upload_library = ReferenceLibrary(
+    settings.EXERCISE_UPLOAD_DIR,
+    settings.EXERCISE_UPLOAD_FEATURE_DIR,
+    feature_cache.version
+)
 
+# Embeddings of every analyzed library reference, keyed by filename
+reference_index = ReferenceIndex(EMBEDDING_DIM)
+_indexed_digests = set()
 
 
 
-def preprocess_audio(y, sr, target_sr=22050):
+@lru_cache(maxsize=None)
+def bandpass_sos(sr, lowcut=80, highcut=4000, order=4):
+    # Designed once per sample rate; float32 keeps filtering in float32
+    return butter(
+        order, [lowcut, highcut], btype='band', fs=sr, output='sos'
+    ).astype(np.float32)
+
+
+def preprocess_audio(y, sr, target_sr=22050, max_len=60000):
+    y = np.asarray(y, dtype=np.float32)
     if y.ndim > 1:
         y = librosa.to_mono(y)
     if sr != target_sr:
         y = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
         sr = target_sr
-
-    def butter_bandpass(lowcut, highcut, fs, order=4):
-        nyq = 0.5 * fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        b, a = butter(order, [low, high], btype='band')
-        return b, a
-
-    b, a = butter_bandpass(80, 4000, sr)
-    y = filtfilt(b, a, y)
-    y, _ = librosa.effects.trim(y, top_db=20)
-    y = librosa.util.normalize(y)
-    max_len = 60000
-    if len(y) < max_len:
-        y = np.pad(y, (0, max_len - len(y)))
-    else:
-        y = y[:max_len]
-    return y, sr
-
-
-def extract_pitch(y, sr):
+    y = sosfiltfilt(bandpass_sos(sr), y)
+    # Trim bounds and the normalization peak are both relative to the
+    # whole filtered signal, so filtering has to happen first
+    _, (start, end) = librosa.effects.trim(y, top_db=20)
+    span = y[start:end]
+    # normalize and pad/truncate straight into the output buffer
+    out = np.zeros(max_len, dtype=np.float32)
+    n = min(len(span), max_len)
+    out[:n] = span[:n]
+    if n:
+        peak = max(span.max(), -span.min())
+        if peak >= np.finfo(np.float32).tiny:
+            out[:n] /= peak
+    return out, sr
+
+
+def extract_pitch(y, sr, backend=None):
+    # preprocess_audio keeps the first max_len samples, a few seconds,
+    # so pitch tracking stays cheap even for long takes
     y, sr = preprocess_audio(y, sr)
-    pitches = librosa.yin(
-        y,
-        fmin=librosa.note_to_hz('C2'),
-        fmax=librosa.note_to_hz('C7')
-    )
-    voiced_flag = pitches > 0
-    return pitches, voiced_flag
+    return track_pitch(y, sr, backend or settings.EXERCISE_PITCH_BACKEND)
 
 
 def extract_energy(y, frame_length=2048, hop_length=512):
@@ -73,39 +125,12 @@ def extract_energy(y, frame_length=2048, hop_length=512):
 
 
 def extract_advanced_features(y, sr):
-    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=20)
-    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-    contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-    tonnetz_feat = librosa.feature.tonnetz(
-        y=librosa.effects.harmonic(y),
-        sr=sr
-    )
-    return {
-        'mfccs': np.mean(mfccs, axis=1),
-        'chroma': np.mean(chroma, axis=1),
-        'contrast': np.mean(contrast, axis=1),
-        'tonnetz': np.mean(tonnetz_feat, axis=1)
-    }
+    return SpectralAnalysis(y, sr).advanced_features()
 
 
 def load_and_extract_features(file_path):
     y, sr = librosa.load(file_path, sr=None)
-    pitches, voiced_flag = extract_pitch(y, sr)
-    energy = extract_energy(y)
-    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-    advanced = extract_advanced_features(y, sr)
-    return {
-        'y': y,
-        'sr': sr,
-        'pitches': pitches,
-        'voiced_flag': voiced_flag,
-        'energy': energy,
-        'tempo': tempo,
-        'mfccs': advanced['mfccs'],
-        'chroma': advanced['chroma'],
-        'contrast': advanced['contrast'],
-        'tonnetz': advanced['tonnetz']
-    }
+    return load_and_extract_features_from_array(y, sr)
 
 
 def pitch_histogram(pitches, bins=36):
@@ -116,19 +141,71 @@ def pitch_histogram(pitches, bins=36):
     return hist
 
 
-def evaluate_performance(ref_feats, stu_feats):
-    results = {}
+def evaluate_performance(ref_feats, stu_feats, profile=None):
+    profile = get_profile(profile or settings.EXERCISE_SCORING_PROFILE)
     # similarity features
-    mfcc_sim = float(1 - cosine(ref_feats['mfccs'], stu_feats['mfccs']))
-    chroma_sim = float(1 - cosine(ref_feats['chroma'], stu_feats['chroma']))
-    contrast_sim = float(
-        1 - cosine(ref_feats['contrast'], stu_feats['contrast'])
-    )
-    tonnetz_sim = float(1 - cosine(ref_feats['tonnetz'], stu_feats['tonnetz']))
+    sims = {
+        name: float(1 - cosine(ref_feats[name], stu_feats[name]))
+        for name in profile.similarity
+    }
     # pitch
     ref_hist = pitch_histogram(ref_feats['pitches'])
     stu_hist = pitch_histogram(stu_feats['pitches'])
     pitch_sim = float(1 - cosine(ref_hist, stu_hist))
+    return _performance_result(
+        ref_feats, stu_feats, pitch_sim, sims, profile
+    )
+
+
+def cosine_similarities(ref, students):
+    """
+    1 - scipy's cosine distance between ref and every row of students,
+    computed as a single matrix-vector product.
+    """
+    ref = np.asarray(ref, dtype=np.float64)
+    students = np.asarray(students, dtype=np.float64)
+    uv = students @ ref
+    norms = np.sqrt(
+        np.dot(ref, ref) * np.einsum('ij,ij->i', students, students)
+    )
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dist = np.clip(1.0 - uv / norms, 0.0, 2.0)
+    return 1 - dist
+
+
+def evaluate_performances(ref_feats, stu_feats_list, profile=None):
+    """
+    Score many student recordings against one reference. Same results
+    as calling evaluate_performance for each student, but every
+    similarity is computed for the whole batch at once.
+    """
+    if not stu_feats_list:
+        return []
+    profile = get_profile(profile or settings.EXERCISE_SCORING_PROFILE)
+    sims = {
+        name: cosine_similarities(
+            ref_feats[name],
+            np.stack([feats[name] for feats in stu_feats_list])
+        )
+        for name in profile.similarity
+    }
+    pitch_sims = cosine_similarities(
+        pitch_histogram(ref_feats['pitches']),
+        np.stack([
+            pitch_histogram(feats['pitches']) for feats in stu_feats_list
+        ])
+    )
+    return [
+        _performance_result(
+            ref_feats, stu_feats, float(pitch_sims[i]),
+            {name: float(sim[i]) for name, sim in sims.items()}, profile
+        )
+        for i, stu_feats in enumerate(stu_feats_list)
+    ]
+
+
+def _performance_result(ref_feats, stu_feats, pitch_sim, sims, profile):
+    results = {}
     pitch_score = round(float(pitch_sim * 100), 2)
     results['pitch_score'] = pitch_score
     # tempo
@@ -155,19 +232,18 @@ def evaluate_performance(ref_feats, stu_feats):
     )
     results['energy_score'] = round(float(energy_score), 2)
     # similarity avg
-    sim_total = float(
-        (mfcc_sim + chroma_sim + contrast_sim + tonnetz_sim) / 4
-    )
+    sim_total = float(sum(sims.values()) / len(sims))
     sim_score = round(float(sim_total * 100), 2)
     results['similarity_score'] = sim_score
     # final weighted
     final_score = float(
-        (0.5 * pitch_score) +
-        (0.15 * tempo_score) +
-        (0.15 * energy_score) +
-        (0.2 * sim_score)
+        (profile.pitch_weight * pitch_score) +
+        (profile.tempo_weight * tempo_score) +
+        (profile.energy_weight * energy_score) +
+        (profile.similarity_weight * sim_score)
     )
     results['overall_score'] = round(float(final_score), 2)
+    results['profile'] = profile.name
     return results
 
 
@@ -176,117 +252,578 @@ def evaluate_performance(ref_feats, stu_feats):
 
 @session_login_required
 def exercise_view(request):
-    exercises = Exercise.objects.filter(
+    # Recordings are posted to ajax_submit_scoring_job by exercise.js and
+    # scored on the process pool, this page only renders the dashboard
+    exercises = list(Exercise.objects.filter(
         deleteFlag=False,
         user_id=request.user
+    ).annotate(metric_count=Count(
+        'metric_entries', filter=Q(metric_entries__deleteFlag=False)
+    )))
+    for ex in exercises:
+        # history migrate_exercise_metrics has not moved yet
+        ex.metric_count += len(legacy_metrics(ex))
+    return render(request, "exercise/exercise.html", {
+        "form": UserSignupForm(),
+        "audio_form": AudioUploadForm(),
+        "exercises": exercises,
+        "create_form": ExerciseCreateForm(),
+        "selected_exercise": request.GET.get('selected_exercise')
+    })
+
+
+def load_and_extract_features_from_array(y, sr, frames=False,
+                                         features=None):
+    """
+    FeatureRecord with pitch, energy, tempo and the averaged spectral
+    `features` (those of the full profile by default) of one recording.
+    """
+    if features is None:
+        features = SCORING_PROFILES['full'].similarity
+    executor = get_analysis_executor()
+    if executor is not None and \
+            len(y) > settings.EXERCISE_PARALLEL_MIN_SECONDS * sr:
+        return extract_features_windowed(y, sr, executor, frames, features)
+    pitches, voiced_flag = extract_pitch(y, sr)
+    # One STFT shared by energy, tempo and the spectral features
+    analysis = SpectralAnalysis(y, sr)
+    # frame-level features are only kept for library references
+    frame_feats = {
+        'onset_envelope': analysis.onset_envelope,
+        'chroma_frames': analysis.chroma(),
+        'mfcc_frames': analysis.mfcc(),
+    } if frames else {}
+    return FeatureRecord(
+        sr=sr,
+        tempo=analysis.tempo,
+        pitches=pitches,
+        voiced_flag=voiced_flag,
+        energy=analysis.rms,
+        spectral=analysis.advanced_features(features),
+        frames=frame_feats
     )
-    signup_form = UserSignupForm()
-    result = None
-    audio_form = AudioUploadForm(request.POST or None, request.FILES or None)
-    create_form = ExerciseCreateForm()
 
-    reference_files = []  # now just the uploaded files
-    selected_ex_id = None
 
-    if request.method == 'POST' and audio_form.is_valid():
-        ref_file = audio_form.cleaned_data.get('reference_audio')
-        user_file = audio_form.cleaned_data.get('user_audio')
+def extract_features_windowed(y, sr, executor, frames=False,
+                              features=SCORING_PROFILES['full'].similarity):
+    """
+    load_and_extract_features_from_array for long recordings, with the
+    analysis split into windows run on executor.
+    """
+    pitches, voiced_flag = extract_pitch(y, sr)
+    tracks = analyze_windowed(
+        y, sr, executor,
+        window_seconds=settings.EXERCISE_PARALLEL_WINDOW_SECONDS,
+        hpss_tonnetz='tonnetz' in features
+    )
+    frame_feats = {
+        'onset_envelope': tracks['onset_envelope'],
+        'chroma_frames': tracks['chroma'],
+        'mfcc_frames': tracks['mfcc'],
+    } if frames else {}
+    return FeatureRecord(
+        sr=sr,
+        tempo=tracks['tempo'],
+        pitches=pitches,
+        voiced_flag=voiced_flag,
+        energy=tracks['rms'],
+        spectral={
+            name: np.mean(tracks[WINDOWED_TRACKS[name]], axis=1)
+            for name in features
+        },
+        frames=frame_feats
+    )
 
-        if ref_file:
-            reference_files.append(ref_file.name)
-        if ref_file and user_file:
-            try:
-                # Load reference audio in memory
-                ref_bytes = io.BytesIO(ref_file.read())
-                ref_y, ref_sr = librosa.load(ref_bytes, sr=None)
-                ref_feats = load_and_extract_features_from_array(ref_y, ref_sr)
-
-                # Load user audio in memory
-                user_bytes = io.BytesIO(user_file.read())
-                stu_y, stu_sr = librosa.load(user_bytes, sr=None)
-                stu_feats = load_and_extract_features_from_array(stu_y, stu_sr)
-
-                result = evaluate_performance(ref_feats, stu_feats)
-
-                # Persist metrics to the selected exercise if provided
-                selected_ex_id = request.POST.get('selected_exercise') or \
-                    request.POST.get('selectedExercise') or None
-                if selected_ex_id:
-                    try:
-                        ex = Exercise.objects.get(
-                            id=selected_ex_id,
-                            user_id=request.user,
-                            deleteFlag=False
-                        )
-                        # add_metrics expects createdDate and scores
-                        createdDate = None
-                        # try to get createdAt from result or use now
-                        if isinstance(result, dict) and result.get('createdAt'):
-                            createdDate = result.get('createdAt')
-                        if not createdDate:
-                            createdDate = timezone.now()
-                        # map values
-                        pitch = result.get('pitch_score') or \
-                            result.get('pitch') or 0
-                        tempo = result.get('tempo_score') or \
-                            result.get('tempo') or 0
-                        energy = result.get('energy_score') or \
-                            result.get('energy') or 0
-                        final = result.get('overall_score') or \
-                            result.get('final_score') or 0
-                        ex.add_metrics(pitch, tempo, energy, final, createdDate)
-                    except Exercise.DoesNotExist:
-                        # ignore if exercise not found or not authorized
-                        pass
 
-            except Exception as e:
-                result = {'error': str(e)}
+# windowed track behind each averaged spectral feature
+WINDOWED_TRACKS = {
+    'mfccs': 'mfcc',
+    'chroma': 'chroma',
+    'contrast': 'contrast',
+    'tonnetz': 'tonnetz',
+    'tonnetz_chroma': 'tonnetz_chroma',
+}
 
-    return render(request, "exercise/exercise.html", {
-        "form": signup_form,
-        "audio_form": audio_form,
-        "reference_files": reference_files,
-        "result": result,
-        "exercises": exercises,
-        "create_form": create_form,
-        "selected_exercise": selected_ex_id
-    })
 
+def decode_upload(data):
+    return decode_audio(
+        data,
+        max_seconds=settings.EXERCISE_ANALYSIS_SECONDS,
+        max_duration=settings.EXERCISE_MAX_UPLOAD_SECONDS
+    )
 
-def load_and_extract_features_from_array(y, sr):
-    pitches, voiced_flag = extract_pitch(y, sr)
-    energy = extract_energy(y)
-    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-    advanced = extract_advanced_features(y, sr)
-    return {
-        'y': y,
-        'sr': sr,
-        'pitches': pitches,
-        'voiced_flag': voiced_flag,
-        'energy': energy,
-        'tempo': tempo,
-        'mfccs': advanced['mfccs'],
-        'chroma': advanced['chroma'],
-        'contrast': advanced['contrast'],
-        'tonnetz': advanced['tonnetz']
+
+def analyze_reference(filename):
+    """
+    Precompute library features for a stored reference recording. Runs
+    on the process pool right after upload.
+    """
+    with open(os.path.join(REFERENCE_DIR, filename), 'rb') as f:
+        data = f.read()
+    digest = reference_library.digest(data)
+    if reference_library.has_features(digest):
+        return
+    y, sr = decode_upload(data)
+    feats = load_and_extract_features_from_array(
+        y, sr, frames=True, features=SPECTRAL_FEATURES
+    )
+    reference_library.save_features(digest, feats)
+
+
+def sync_reference_index():
+    """
+    Add references analyzed since the last call to the index. Analysis
+    runs in worker processes, so the library directory is the source of
+    truth; only new entries are loaded.
+    """
+    for digest in reference_library.digests():
+        if digest in _indexed_digests:
+            continue
+        feats = reference_library.load_features(digest)
+        filename = reference_library.audio_name(digest)
+        if feats is None or filename is None:
+            continue
+        reference_index.add(filename, reference_embedding(feats))
+        _indexed_digests.add(digest)
+
+
+def load_embedding_from_bytes(data):
+    y, sr = decode_upload(data)
+    return reference_embedding(SpectralAnalysis(y, sr).advanced_features())
+
+
+def load_reference_features(data):
+    # Library references were analyzed at upload, map their features
+    feats = reference_library.load_features(reference_library.digest(data))
+    if feats is not None:
+        return feats
+    key = feature_cache.key(data)
+    feats = feature_cache.get_record(key)
+    if feats is None:
+        y, sr = decode_upload(data)
+        # every spectral feature, so one entry serves all profiles
+        feats = load_and_extract_features_from_array(
+            y, sr, features=SPECTRAL_FEATURES
+        )
+        feature_cache.set_record(key, feats)
+    return feats
+
+
+def load_features_from_bytes(data, profile=None):
+    profile = get_profile(profile or settings.EXERCISE_SCORING_PROFILE)
+    y, sr = decode_upload(data)
+    return load_and_extract_features_from_array(
+        y, sr, features=profile.similarity
+    )
+
+
+def load_alignment_features(data):
+    y, sr = decode_audio(
+        data,
+        max_seconds=settings.EXERCISE_ALIGNMENT_MAX_SECONDS,
+        max_duration=settings.EXERCISE_MAX_UPLOAD_SECONDS
+    )
+    return extract_alignment_features(
+        y, sr, settings.EXERCISE_PITCH_BACKEND
+    )
+
+
+def load_reference_alignment_features(data):
+    key = feature_cache.key(data, kind='align')
+    feats = feature_cache.get(key)
+    if feats is None:
+        feats = load_alignment_features(data)
+        feature_cache.set(key, feats)
+    return feats
+
+
+def load_reference_coarse_features(data):
+    key = feature_cache.key(data, kind='coarse')
+    feats = feature_cache.get(key)
+    if feats is None:
+        feats = coarse_features(*decode_upload(data))
+        feature_cache.set(key, feats)
+    return feats
+
+
+def score_tiered(ref_data, user_data, profile=None, stats=tier_stats):
+    """
+    Summary scoring behind a cheap coarse pass: takes that are silent,
+    far too short or clearly a different piece get a low score without
+    running pitch tracking, beat tracking or HPSS. The result carries
+    per-tier timings in ms and the early-exit reason, if any.
+    """
+    profile = get_profile(profile or settings.EXERCISE_SCORING_PROFILE)
+    started = time.perf_counter()
+    y, sr = decode_upload(user_data)
+    reason, corr = coarse_check(
+        load_reference_coarse_features(ref_data), coarse_features(y, sr)
+    )
+    coarse_seconds = time.perf_counter() - started
+    if reason:
+        stats.record(coarse_seconds)
+        result = early_exit_result(reason, corr)
+        result['profile'] = profile.name
+        result['tiers'] = {'coarse_ms': round(coarse_seconds * 1000, 1)}
+        return result
+
+    started = time.perf_counter()
+    stu_feats, ref_feats = run_concurrently(
+        (load_and_extract_features_from_array, y, sr, False,
+         profile.similarity),
+        (load_reference_features, ref_data),
+    )
+    result = evaluate_performance(ref_feats, stu_feats, profile.name)
+    full_seconds = time.perf_counter() - started
+    stats.record(coarse_seconds, full_seconds)
+    result['early_exit'] = None
+    result['tiers'] = {
+        'coarse_ms': round(coarse_seconds * 1000, 1),
+        'full_ms': round(full_seconds * 1000, 1),
     }
+    return result
+
+
+def score_recordings(ref_data, user_data, mode='summary', profile=None):
+    # The reference and the take are extracted side by side; reference
+    # features are cached by content hash
+    if mode == 'alignment':
+        stu_feats, ref_feats = run_concurrently(
+            (load_alignment_features, user_data),
+            (load_reference_alignment_features, ref_data),
+        )
+        return evaluate_alignment(
+            ref_feats, stu_feats,
+            max_cells=settings.EXERCISE_ALIGNMENT_MAX_CELLS
+        )
+    if settings.EXERCISE_TIERED_SCORING:
+        return score_tiered(ref_data, user_data, profile)
+    stu_feats, ref_feats = run_concurrently(
+        (load_features_from_bytes, user_data, profile),
+        (load_reference_features, ref_data),
+    )
+    return evaluate_performance(ref_feats, stu_feats, profile)
+
+
+def score_batch(ref_data, user_datas, profile=None):
+    """
+    Score several student recordings against one reference. The
+    reference is extracted once, students are extracted in parallel on
+    the scoring process pool. A student whose recording fails to load
+    gets {'error': ...} in place of its result. With tiered scoring
+    every take goes through score_tiered, like a single evaluation.
+    """
+    ref_feats = load_reference_features(ref_data)
+    executor = get_executor()
+    if settings.EXERCISE_TIERED_SCORING:
+        # both reference caches are filled here, workers only read them
+        load_reference_coarse_features(ref_data)
+        futures = [
+            executor.submit(score_tiered, ref_data, data, profile)
+            for data in user_datas
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({'error': str(e)})
+        return results
+    futures = [
+        executor.submit(load_features_from_bytes, data, profile)
+        for data in user_datas
+    ]
+    results = [None] * len(futures)
+    indices = []
+    stu_feats_list = []
+    for i, future in enumerate(futures):
+        try:
+            stu_feats_list.append(future.result())
+            indices.append(i)
+        except Exception as e:
+            results[i] = {'error': str(e)}
+    scored = evaluate_performances(ref_feats, stu_feats_list, profile)
+    for i, result in zip(indices, scored):
+        results[i] = result
+    return results
+
+
+def store_recordings(ref_file, ref_data, user_file, user_data):
+    """
+    Keep the uploads behind a saved attempt; returns their hashes for
+    ExerciseMetric so the attempt can be re-scored later.
+    """
+    _, ref_digest, ref_created = upload_library.add(ref_data, ref_file.name)
+    _, take_digest, take_created = upload_library.add(
+        user_data, user_file.name
+    )
+    if ref_created or take_created:
+        upload_library.evict(
+            settings.EXERCISE_UPLOAD_MAX_BYTES,
+            settings.EXERCISE_UPLOAD_MAX_AGE
+        )
+    return ref_digest, take_digest
+
+
+def rescore_recordings(reference_digest, take_digest, mode='', profile=None):
+    """Score a stored pair of uploads again with the current pipeline."""
+    return score_recordings(
+        upload_library.read_audio(reference_digest),
+        upload_library.read_audio(take_digest),
+        mode=mode or 'summary',
+        profile=profile
+    )
+
+
+def save_result_metrics(ex, result, createdDate=None, mode='',
+                        recordings=None):
+    # add_metrics expects createdDate and scores
+    # try to get createdAt from result or use now
+    if not createdDate and isinstance(result, dict):
+        createdDate = result.get('createdAt')
+    if not createdDate:
+        createdDate = timezone.now()
+    # map values
+    pitch = result.get('pitch_score') or result.get('pitch') or 0
+    tempo = result.get('tempo_score') or result.get('tempo') or 0
+    energy = result.get('energy_score') or result.get('energy') or 0
+    final = result.get('overall_score') or result.get('final_score') or 0
+    ex.add_metrics(
+        pitch, tempo, energy, final, createdDate,
+        profile=result.get('profile', ''), mode=mode, recordings=recordings
+    )
 
 
 def ajax_upload_reference_audio(request):
     if request.method == 'POST' and request.FILES.get('reference_audio'):
         ref_file = request.FILES['reference_audio']
-        ref_path = os.path.join(REFERENCE_DIR, ref_file.name)
-        with open(ref_path, 'wb+') as dest:
-            for chunk in ref_file.chunks():
-                dest.write(chunk)
-        return JsonResponse({'success': True, 'filename': ref_file.name})
+        if ref_file.size > settings.EXERCISE_REFERENCE_MAX_BYTES:
+            return JsonResponse(
+                {'success': False, 'error': 'file too large'},
+                status=413
+            )
+        # identical recordings are stored and analyzed only once; the
+        # upload is hashed and written chunk by chunk
+        filename, digest, created = reference_library.add_chunks(
+            ref_file.chunks(), ref_file.name
+        )
+        if not reference_library.has_features(digest):
+            submit_background(analyze_reference, filename)
+        return JsonResponse({
+            'success': True,
+            'filename': filename,
+            'duplicate': not created
+        })
     return JsonResponse({'success': False}, status=400)
 
 
+@session_login_required
+def ajax_match_reference(request):
+    """
+    Suggest the library references closest to a student recording.
+    Returns the top ?k= matches (default 5) with cosine similarity.
+    """
+    if request.method != 'POST' or not request.FILES.get('user_audio'):
+        return JsonResponse(
+            {'success': False, 'error': 'user_audio required'},
+            status=400
+        )
+    try:
+        k = max(1, min(int(request.GET.get('k') or 5), 50))
+    except ValueError:
+        k = 5
+    try:
+        embedding = load_embedding_from_bytes(
+            request.FILES['user_audio'].read()
+        )
+    except Exception as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    sync_reference_index()
+    started = time.perf_counter()
+    matches = reference_index.search(embedding, k)
+    search_ms = (time.perf_counter() - started) * 1000
+    return JsonResponse({
+        'success': True,
+        'matches': [
+            {'filename': name, 'score': round(score, 4)}
+            for name, score in matches
+        ],
+        'search_ms': round(search_ms, 3)
+    })
+
+
+def _record_job_metrics(job, mode='', recordings=None):
+    if job.exercise_id:
+        save_result_metrics(
+            job.exercise, job.result, job.createdAt, mode, recordings
+        )
+
+
+@session_login_required
+def ajax_submit_scoring_job(request):
+    """
+    Queue a reference/user recording pair for scoring and return the job
+    id immediately. Poll ajax_scoring_job_status for the result.
+    """
+    if request.method != 'POST':
+        return JsonResponse(
+            {'success': False, 'error': 'POST required'},
+            status=400
+        )
+    audio_form = AudioUploadForm(request.POST, request.FILES)
+    if not audio_form.is_valid():
+        return JsonResponse(
+            {'success': False, 'errors': audio_form.errors},
+            status=400
+        )
+    ref_file = audio_form.cleaned_data.get('reference_audio')
+    user_file = audio_form.cleaned_data.get('user_audio')
+    if not (ref_file and user_file):
+        return JsonResponse(
+            {'success': False, 'error': 'both recordings are required'},
+            status=400
+        )
+
+    ex = None
+    selected_ex_id = request.POST.get('selected_exercise') or \
+        request.POST.get('selectedExercise') or None
+    if selected_ex_id:
+        try:
+            ex = Exercise.objects.get(
+                id=selected_ex_id,
+                user_id=request.user,
+                deleteFlag=False
+            )
+        except Exercise.DoesNotExist:
+            return JsonResponse(
+                {'success': False, 'error': 'exercise not found'},
+                status=404
+            )
+
+    ref_data = ref_file.read()
+    user_data = user_file.read()
+    mode = audio_form.cleaned_data.get('scoring_mode')
+    recordings = store_recordings(
+        ref_file, ref_data, user_file, user_data
+    ) if ex else None
+    job = submit_scoring_job(
+        request.user,
+        ex,
+        score_recordings,
+        ref_data,
+        user_data,
+        mode,
+        audio_form.cleaned_data.get('scoring_profile'),
+        on_success=partial(
+            _record_job_metrics, mode=mode, recordings=recordings
+        )
+    )
+    return JsonResponse(
+        {'success': True, 'job_id': job.id, 'status': job.status},
+        status=202
+    )
+
+
+@session_login_required
+def ajax_batch_score(request):
+    """
+    Score many user_audio files against one reference_audio. Results are
+    saved to selected_exercise: either one id used for every recording,
+    or one id per recording in upload order.
+    """
+    if request.method != 'POST':
+        return JsonResponse(
+            {'success': False, 'error': 'POST required'},
+            status=400
+        )
+    ref_file = request.FILES.get('reference_audio')
+    user_files = request.FILES.getlist('user_audio')
+    if not (ref_file and user_files):
+        return JsonResponse(
+            {'success': False, 'error': 'both recordings are required'},
+            status=400
+        )
+
+    ex_ids = request.POST.getlist('selected_exercise')
+    if len(ex_ids) == 1:
+        ex_ids = ex_ids * len(user_files)
+    elif ex_ids and len(ex_ids) != len(user_files):
+        return JsonResponse(
+            {'success': False, 'error': 'one exercise per recording'},
+            status=400
+        )
+    exercises = {}
+    for ex_id in set(ex_ids):
+        try:
+            exercises[ex_id] = Exercise.objects.get(
+                id=ex_id,
+                user_id=request.user,
+                deleteFlag=False
+            )
+        except Exercise.DoesNotExist:
+            return JsonResponse(
+                {'success': False, 'error': 'exercise not found'},
+                status=404
+            )
+
+    profile = request.POST.get('scoring_profile') or None
+    if profile and profile not in SCORING_PROFILES:
+        return JsonResponse(
+            {'success': False, 'error': 'unknown scoring profile'},
+            status=400
+        )
+    ref_data = ref_file.read()
+    user_datas = [user_file.read() for user_file in user_files]
+    results = score_batch(ref_data, user_datas, profile)
+    response = []
+    for i, (user_file, result) in enumerate(zip(user_files, results)):
+        if ex_ids and 'error' not in result:
+            save_result_metrics(
+                exercises[ex_ids[i]], result, mode='summary',
+                recordings=store_recordings(
+                    ref_file, ref_data, user_file, user_datas[i]
+                )
+            )
+        response.append({'filename': user_file.name, **result})
+    return JsonResponse({'success': True, 'results': response})
+
+
+@session_login_required
+def ajax_scoring_job_status(request, job_id):
+    if request.method != 'GET':
+        return JsonResponse(
+            {'success': False, 'error': 'GET required'},
+            status=400
+        )
+    try:
+        job = ScoringJob.objects.get(id=job_id, user_id=request.user)
+    except ScoringJob.DoesNotExist:
+        return JsonResponse(
+            {'success': False, 'error': 'job not found'},
+            status=404
+        )
+    if job.status == ScoringJob.PENDING and fail_stale_jobs(
+        ScoringJob.objects.filter(id=job.id)
+    ):
+        job.refresh_from_db()
+    return JsonResponse({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'result': job.result,
+        'error': job.error or None,
+    })
+
+
 def ajax_exercise_metrics(request, exercise_id):
     """
     Return JSON metrics for a specific exercise
     belonging to the logged-in user.
+
+    Without parameters this is the latest page of attempts, oldest
+    first; pass next_cursor back as ?cursor= for older ones. ?since=
+    (ISO date or datetime) bounds the history, ?limit= sets the page
+    size and ?rollup=day|week returns per-period aggregates instead.
     """
     if request.method != 'GET':
         return JsonResponse(
@@ -305,31 +842,49 @@ def ajax_exercise_metrics(request, exercise_id):
             status=404
         )
 
-    metrics = ex.metrics or []
-    normalized = []
-    for m in metrics:
-        normalized.append({
-            'pitch_score': m.get('pitch_score') or
-            m.get('pitch') or m.get('pitchScore'),
-            'tempo_score': m.get('tempo_score') or
-            m.get('tempo') or m.get('tempoScore'),
-            'energy_score': m.get('energy_score') or
-            m.get('energy') or m.get('energyScore'),
-            'final_score': m.get('final_score') or
-            m.get('overall_score') or
-            m.get('finalScore') or
-            m.get('overallScore'),
-            'createdAt': m.get('createdAt') or
-            m.get('created_at') or
-            m.get('createdAt') or ''
+    since = None
+    if request.GET.get('since'):
+        since = parse_datetime(request.GET['since'])
+        if since is None:
+            since_date = parse_date(request.GET['since'])
+            if since_date is None:
+                return JsonResponse(
+                    {'success': False, 'error': 'invalid since'},
+                    status=400
+                )
+            since = datetime.combine(since_date, dt_time.min)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+    rollup = request.GET.get('rollup')
+    if rollup:
+        if rollup not in ROLLUP_UNITS:
+            return JsonResponse(
+                {'success': False, 'error': 'rollup must be day or week'},
+                status=400
+            )
+        return JsonResponse({
+            'success': True,
+            'rollup': rollup,
+            'buckets': metrics_rollup(ex, rollup, since)
         })
 
     try:
-        normalized.sort(key=lambda x: x.get('createdAt') or '')
-    except Exception:
-        pass
-
-    return JsonResponse({'success': True, 'metrics': normalized})
+        limit = int(request.GET.get('limit') or METRICS_PAGE_SIZE)
+    except ValueError:
+        limit = METRICS_PAGE_SIZE
+    limit = max(1, min(limit, METRICS_MAX_PAGE_SIZE))
+    try:
+        rows, next_cursor = metrics_page(
+            ex, since, limit, request.GET.get('cursor')
+        )
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({
+        'success': True,
+        'metrics': [m.as_dict() for m in rows],
+        'next_cursor': next_cursor
+    })
 
 
 def exercise_create(request):
@@ -0,0 +1,141 @@
+"""
+Warm-up of the scoring pipeline. The first evaluation in a fresh process
+pays numba compilation of librosa's pitch, beat tracking and
+interpolation kernels plus lazy imports of librosa and scipy submodules.
+warm_up() pays it up front on a short synthetic take, and the JIT cache
+directory keeps compiled kernels on disk across restarts. Server
+processes warm up on a background thread, scoring pool workers in the
+pool's initializer.
+"""
+import io
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WARMUP_SR = 22050
+_started = False
+_started_lock = threading.Lock()
+
+
+def configure_jit_cache(directory):
+    """
+    Point numba's on-disk cache at directory unless NUMBA_CACHE_DIR is
+    already set. Set through the environment so pool workers inherit it.
+    """
+    os.environ.setdefault('NUMBA_CACHE_DIR', str(directory))
+    if 'numba' in sys.modules:
+        # numba reads the variable at import, update the live config too
+        from numba.core import config
+        config.CACHE_DIR = os.environ['NUMBA_CACHE_DIR']
+
+
+def warm_up():
+    """
+    Run every scoring stage once on a three second synthetic take.
+    Returns the seconds spent per stage.
+    """
+    timings = {}
+
+    def stage(name, fn, *args):
+        started = time.perf_counter()
+        result = fn(*args)
+        timings[name] = time.perf_counter() - started
+        return result
+
+    def imports():
+        from . import views
+        return views
+
+    views = stage('imports', imports)
+    import soundfile as sf
+    from django.conf import settings
+
+    from . import synthetic
+    from .alignment import evaluate_alignment, extract_alignment_features
+    from .profiles import SPECTRAL_FEATURES
+    from .tiered import coarse_features
+
+    buf = io.BytesIO()
+    sf.write(buf, synthetic.piano_sequence(
+        synthetic.c_major_scale()[:6], sr=WARMUP_SR
+    ), WARMUP_SR, format='WAV')
+    y, sr = stage('decode', views.decode_upload, buf.getvalue())
+    stage('coarse', coarse_features, y, sr)
+    feats = stage(
+        'features', views.load_and_extract_features_from_array,
+        y, sr, False, SPECTRAL_FEATURES
+    )
+    stage('evaluate', views.evaluate_performance, feats, feats)
+    aligned = stage(
+        'alignment_features', extract_alignment_features,
+        y, sr, settings.EXERCISE_PITCH_BACKEND
+    )
+    stage('alignment', evaluate_alignment, aligned, aligned)
+    return timings
+
+
+def warm_up_logged():
+    try:
+        timings = warm_up()
+    except Exception:
+        logger.exception("scoring warm-up failed")
+        return
+    logger.info(
+        "scoring warm-up took %.0f ms (%s)",
+        sum(timings.values()) * 1000,
+        ', '.join(f'{k} {v * 1000:.0f} ms' for k, v in timings.items())
+    )
+
+
+def _claim():
+    global _started
+    with _started_lock:
+        claimed, _started = not _started, True
+    return claimed
+
+
+def start_warmup():
+    """Warm the pipeline once per process on a background thread."""
+    if not _claim():
+        return
+    threading.Thread(
+        target=warm_up_logged, name='scoring-warmup', daemon=True
+    ).start()
+
+
+def skip_background_warmup():
+    """Keep start_warmup() from starting a thread in this process."""
+    _claim()
+
+
+# executables of the servers that get a warm-up, checked against
+# sys.argv[0] (or the package run with python -m)
+SERVER_ENTRY_POINTS = {'gunicorn', 'uvicorn', 'daphne', 'hypercorn', 'uwsgi'}
+
+
+def serving(argv=None, environ=None):
+    """
+    Whether this process serves requests: a known application server or
+    the reloaded child of runserver. Anything else (tests, shells,
+    workers, scripts) skips the warm-up unless EXERCISE_WARMUP=1 is set
+    in the environment, e.g. for servers embedded in other programs.
+    """
+    argv = sys.argv if argv is None else argv
+    environ = os.environ if environ is None else environ
+    if environ.get('EXERCISE_WARMUP') == '1':
+        return True
+    if not argv:
+        return False
+    program = os.path.basename(argv[0])
+    if program == '__main__.py':
+        program = os.path.basename(os.path.dirname(argv[0]))
+    if program in SERVER_ENTRY_POINTS:
+        return True
+    return program in ('manage.py', 'django-admin') and \
+        argv[1:2] == ['runserver'] and (
+            environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+        )
@@ -0,0 +1,99 @@
+"""
+Windowed feature extraction for long recordings. The signal is cut into
+windows of whole STFT frames, each padded with margin_seconds of context
+on both sides, and the windows are analysed in a process pool. Frames
+taken from the inside of each window match the frames of a whole-signal
+analysis, so stitching is a concatenation.
+
+Only frame-local features are computed per window. Everything that
+looks across the whole recording is done once on the stitched tracks:
+the log-mel dB floor (relative to the global peak), the MFCCs and onset
+envelope derived from it, and tempo from the merged onset envelope.
+Chroma and tonnetz estimate tuning per window instead of once globally,
+which is the only difference from single-process output.
+"""
+import librosa
+import numpy as np
+
+from .analysis import SpectralAnalysis
+
+
+def window_bounds(n_samples, hop, window_frames, margin_frames):
+    """
+    (f0, f1, s0, s1) for each window: it yields frames f0..f1 and is
+    computed from samples s0..s1, which include the margins.
+    """
+    n_frames = 1 + n_samples // hop
+    bounds = []
+    for f0 in range(0, n_frames, window_frames):
+        f1 = min(f0 + window_frames, n_frames)
+        s0 = max(0, f0 - margin_frames) * hop
+        s1 = min(n_samples, (f1 + margin_frames) * hop)
+        bounds.append((f0, f1, s0, s1))
+    return bounds
+
+
+def analyze_window(y, sr, skip, n_frames, n_fft=2048, hop_length=512,
+                   hpss_tonnetz=True):
+    """Frame-local spectral features of one window, margins removed."""
+    analysis = SpectralAnalysis(y, sr, n_fft=n_fft, hop_length=hop_length)
+    feats = {
+        'mel': librosa.feature.melspectrogram(S=analysis.power, sr=sr),
+        'rms': analysis.rms,
+        'chroma': analysis.chroma(),
+        'contrast': analysis.contrast(),
+    }
+    if hpss_tonnetz:
+        feats['tonnetz'] = analysis.tonnetz()
+    return {
+        name: value[..., skip:skip + n_frames]
+        for name, value in feats.items()
+    }
+
+
+def _stitch(parts):
+    return {
+        name: np.concatenate([part[name] for part in parts], axis=-1)
+        for name in parts[0]
+    }
+
+
+def analyze_windowed(y, sr, executor=None, window_seconds=20.0,
+                     margin_seconds=3.0, n_fft=2048, hop_length=512,
+                     hpss_tonnetz=True):
+    """
+    Frame-level rms, chroma, contrast, tonnetz (both from HPSS and from
+    chroma), log-mel, MFCC and onset envelope of y plus tempo, with
+    windows run on executor (serially when it is None). hpss_tonnetz=False
+    skips the expensive HPSS tonnetz.
+    """
+    window_frames = max(1, int(window_seconds * sr / hop_length))
+    # the CQT behind tonnetz has the widest support, a few seconds at
+    # the lowest octave
+    margin_frames = int(np.ceil(margin_seconds * sr / hop_length))
+    args = [
+        (y[s0:s1], sr, f0 - s0 // hop_length, f1 - f0, n_fft, hop_length,
+         hpss_tonnetz)
+        for f0, f1, s0, s1 in window_bounds(
+            len(y), hop_length, window_frames, margin_frames
+        )
+    ]
+    if executor is None:
+        parts = [analyze_window(*a) for a in args]
+    else:
+        parts = list(executor.map(analyze_window, *zip(*args)))
+    feats = _stitch(parts)
+
+    # global steps on the stitched tracks, same as SpectralAnalysis
+    feats['log_mel'] = librosa.power_to_db(feats.pop('mel'))
+    feats['mfcc'] = librosa.feature.mfcc(S=feats['log_mel'])
+    feats['tonnetz_chroma'] = librosa.feature.tonnetz(chroma=feats['chroma'])
+    feats['onset_envelope'] = librosa.onset.onset_strength(
+        S=feats['log_mel'], sr=sr, hop_length=hop_length,
+        aggregate=np.median
+    )
+    feats['tempo'], _ = librosa.beat.beat_track(
+        onset_envelope=feats['onset_envelope'], sr=sr,
+        hop_length=hop_length
+    )
+    return feats
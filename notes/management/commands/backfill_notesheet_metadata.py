@@ -0,0 +1,70 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notes.models import Note
+from notes.previews import file_checksum, notesheet_metadata
+
+UPDATED_FIELDS = ['notesheet_checksum', *Note.NOTESHEET_METADATA]
+
+
+class Command(BaseCommand):
+    help = (
+        'Store page count, page size, file size and checksum of every '
+        'notesheet on its Note, for notes uploaded before they were '
+        'recorded at upload.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Recompute notes that already have metadata.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report how many notes would be updated.'
+        )
+
+    def handle(self, *args, **options):
+        notes = Note.objects.exclude(notesheet='').exclude(notesheet=None)
+        if not options['all']:
+            notes = notes.filter(page_count=None)
+        total = notes.count()
+        if options['dry_run']:
+            self.stdout.write(f'Would update {total} notes.')
+            return
+
+        started = time.perf_counter()
+        updated = failed = 0
+        batch = []
+        for done, note in enumerate(notes.only(
+            'id', 'notesheet', *UPDATED_FIELDS
+        ).iterator(), 1):
+            path = os.path.join(settings.MEDIA_ROOT, note.notesheet.name)
+            try:
+                note.notesheet_checksum = file_checksum(path)
+                for name, value in notesheet_metadata(path).items():
+                    setattr(note, name, value)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{note.id}: {e}')
+            else:
+                batch.append(note)
+            if len(batch) >= options['batch_size'] or done == total:
+                Note.objects.bulk_update(batch, UPDATED_FIELDS)
+                updated += len(batch)
+                batch.clear()
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'{done}/{total} notes, {done / elapsed:.1f}/s'
+                )
+        if batch:
+            Note.objects.bulk_update(batch, UPDATED_FIELDS)
+            updated += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated {updated} notes ({failed} failed).'
+        ))
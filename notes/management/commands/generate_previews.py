@@ -1,46 +1,197 @@
-from django.core.management.base import BaseCommand
-from django.conf import settings
+import json
 import os
-import fitz
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, time as dt_time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from notes.models import Note
+from notes.previews import PREVIEW_DIR, preview_store, refresh_previews
+
+UPDATED_FIELDS = ['preview', 'notesheet_checksum', 'preview_status']
+
+
+def _parse_since(value):
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'invalid date: {value}')
+        when = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when.timestamp()
 
 
 class Command(BaseCommand):
-    help = 'Generate preview images for new PDF files in media/notesheets.'
+    help = (
+        'Render page-1 previews of every note in all configured sizes and '
+        'formats under notesheets/previews/ on a process pool. A manifest '
+        'of notesheet mtimes and checksums skips unchanged notesheets.'
+    )
 
-    def handle(self, *args, **options):
-        notesheets_dir = os.path.join(
-            settings.BASE_DIR, 'notes', 'media', 'notesheets'
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1
+        )
+        parser.add_argument(
+            '--since',
+            help='Only look at notesheets modified at or after this date.'
         )
-        previews_dir = os.path.join(
-            settings.BASE_DIR, 'notes', 'media', 'previews'
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Hash and check every notesheet, ignoring the manifest.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report which notes would be refreshed.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    @staticmethod
+    def manifest_path():
+        return os.path.join(
+            settings.MEDIA_ROOT, PREVIEW_DIR, 'manifest.json'
         )
-        os.makedirs(previews_dir, exist_ok=True)
-        for filename in os.listdir(notesheets_dir):
-            if filename.lower().endswith('.pdf'):
-                pdf_path = os.path.join(notesheets_dir, filename)
-                preview_name = os.path.splitext(filename)[0] + '.png'
-                preview_path = os.path.join(previews_dir, preview_name)
-                if not os.path.exists(preview_path):
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_manifest(self, manifest):
+        directory = os.path.dirname(self.manifest_path())
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump(manifest, tmp)
+        os.replace(tmp_path, self.manifest_path())
+
+    def handle(self, *args, **options):
+        since = _parse_since(options['since']) if options['since'] else None
+        manifest = self.read_manifest()
+        default_size = settings.NOTES_PREVIEW_DEFAULT_SIZE
+
+        notes = {}
+        jobs = []
+        updates = []
+        missing = 0
+        for note in Note.objects.filter(deleteFlag=False).exclude(
+            notesheet=''
+        ).exclude(notesheet=None).only(
+            'id', 'notesheet', *UPDATED_FIELDS
+        ).iterator():
+            path = os.path.join(settings.MEDIA_ROOT, note.notesheet.name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                missing += 1
+                self.stderr.write(f'{note.id}: {note.notesheet.name} missing')
+                continue
+            if since is not None and stat.st_mtime < since:
+                continue
+            entry = manifest.get(note.id)
+            unchanged = entry and not options['force'] and (
+                entry['notesheet'] == note.notesheet.name and
+                entry['mtime'] == stat.st_mtime and
+                entry['size'] == stat.st_size and
+                preview_store.exists(note.id, entry['checksum'])
+            )
+            notes[note.id] = (note, stat)
+            if not unchanged:
+                jobs.append((note.id, path))
+            elif self.point_at(note, entry['checksum'], default_size):
+                # previews are current, only the note lags behind
+                updates.append(note)
+
+        if options['dry_run']:
+            self.stdout.write(
+                f'Would refresh {len(jobs)} notes and update '
+                f'{len(updates)} more ({missing} notesheets missing).'
+            )
+            return
+
+        rendered_files = failed = 0
+        started = time.perf_counter()
+        if jobs:
+            with ProcessPoolExecutor(
+                options['workers'], initializer=django.setup
+            ) as pool:
+                futures = {
+                    pool.submit(refresh_previews, *job): job[0]
+                    for job in jobs
+                }
+                for done, future in enumerate(as_completed(futures), 1):
+                    note_id = futures[future]
+                    note, stat = notes[note_id]
                     try:
-                        doc = fitz.open(pdf_path)
-                        page = doc.load_page(0)
-                        pix = page.get_pixmap()
-                        pix.save(preview_path)
-                        # Optional: show image (for debugging)
-                        # img = Image.open(preview_path)
-                        # img.show()
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f"Generated preview for {filename}"
-                            )
-                        )
+                        checksum, _, new_files = future.result()
                     except Exception as e:
+                        failed += 1
+                        self.stderr.write(f'{note_id}: {e}')
+                    else:
+                        rendered_files += new_files
+                        manifest[note_id] = {
+                            'notesheet': note.notesheet.name,
+                            'mtime': stat.st_mtime,
+                            'size': stat.st_size,
+                            'checksum': checksum,
+                        }
+                        if self.point_at(note, checksum, default_size):
+                            updates.append(note)
+                    if len(updates) >= options['batch_size']:
+                        self.flush(updates, manifest)
+                    if done % 50 == 0 or done == len(jobs):
+                        elapsed = time.perf_counter() - started
                         self.stdout.write(
-                            self.style.ERROR(
-                                f"Error generating preview for {filename}: {e}"
-                            )
+                            f'{done}/{len(jobs)} notes, '
+                            f'{done / elapsed:.1f}/s, '
+                            f'{rendered_files} files written'
                         )
-                else:
-                    self.stdout.write(
-                        f"Preview already exists for {filename}"
-                    )
\ No newline at end of file
+        self.flush(updates, manifest)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed {len(jobs) - failed} notes, wrote {rendered_files} '
+            f'files ({failed} failed, {missing} notesheets missing).'
+        ))
+
+    @staticmethod
+    def point_at(note, checksum, default_size):
+        """Point note at this version's previews; False if it already is."""
+        name = preview_store.name(note.id, checksum, default_size)
+        if (note.preview.name == name and
+                note.notesheet_checksum == checksum and
+                note.preview_status == Note.PREVIEW_READY):
+            return False
+        note.preview = name
+        note.notesheet_checksum = checksum
+        note.preview_status = Note.PREVIEW_READY
+        return True
+
+    def flush(self, updates, manifest):
+        """Write pending notes, drop their stale files, save manifest."""
+        for note in updates:
+            # conditional on the notesheet that was rendered, like
+            # render_note_previews, so a notesheet replaced during the
+            # run keeps its own pending previews
+            if Note.objects.filter(
+                pk=note.id, notesheet=note.notesheet.name
+            ).update(
+                preview=note.preview.name,
+                notesheet_checksum=note.notesheet_checksum,
+                preview_status=note.preview_status
+            ):
+                preview_store.remove_stale(note.id, note.notesheet_checksum)
+            else:
+                manifest.pop(note.id, None)
+                self.stderr.write(f'{note.id}: notesheet replaced, skipped')
+        updates.clear()
+        self.write_manifest(manifest)
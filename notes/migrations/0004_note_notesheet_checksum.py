@@ -0,0 +1,18 @@
+# Generated by Django 5.1.8 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0003_alter_note_level'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='notesheet_checksum',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.8 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0004_note_notesheet_checksum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='preview_status',
+            field=models.CharField(choices=[('none', 'بدون پیش‌نمایش'), ('pending', 'در حال ساخت'), ('ready', 'آماده'), ('failed', 'ناموفق')], default='none', max_length=16),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.8 on 2026-10-18 22:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_note_preview_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='page_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='page_width',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='page_height',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='notesheet_size',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
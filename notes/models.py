@@ -1,7 +1,6 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import DEFERRED
 from django.contrib.auth import get_user_model
-from pdf2image import convert_from_path
-import os
 
 User = get_user_model()
 
@@ -12,6 +11,19 @@ class Note(models.Model):
         (2, "متوسط"),
         (3, "پیشرفته"),
     ]
+    PREVIEW_NONE = 'none'
+    PREVIEW_PENDING = 'pending'
+    PREVIEW_READY = 'ready'
+    PREVIEW_FAILED = 'failed'
+    PREVIEW_STATUS_CHOICES = [
+        (PREVIEW_NONE, "بدون پیش‌نمایش"),
+        (PREVIEW_PENDING, "در حال ساخت"),
+        (PREVIEW_READY, "آماده"),
+        (PREVIEW_FAILED, "ناموفق"),
+    ]
+    NOTESHEET_METADATA = (
+        'page_count', 'page_width', 'page_height', 'notesheet_size'
+    )
     id = models.CharField(max_length=24, primary_key=True, editable=False)
     name = models.CharField(max_length=150)
     genre = models.JSONField()
@@ -33,6 +45,28 @@ class Note(models.Model):
     preview = models.ImageField(
         blank=True, null=True, upload_to='notesheets/previews/'
     )
+    # sha256 of the notesheet the stored previews were rendered from
+    notesheet_checksum = models.CharField(
+        max_length=64, blank=True, default=''
+    )
+    # extracted from the notesheet with its previews, so pages never open
+    # the PDF; page size of page 1 in PDF points
+    page_count = models.IntegerField(null=True, blank=True)
+    page_width = models.FloatField(null=True, blank=True)
+    page_height = models.FloatField(null=True, blank=True)
+    notesheet_size = models.BigIntegerField(null=True, blank=True)
+    # previews are rendered in the background, the UI shows a placeholder
+    # until they are ready
+    preview_status = models.CharField(
+        max_length=16, choices=PREVIEW_STATUS_CHOICES, default=PREVIEW_NONE
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        note = super().from_db(db, field_names, values)
+        # remember the stored notesheet so save() can tell if it changed
+        note._loaded_notesheet = note.__dict__.get('notesheet', DEFERRED)
+        return note
 
     def add_comment(self, user_id, text, createdDate, delete_flag=False):
         # Convert datetime to ISO string for JSON serialization
@@ -77,45 +111,44 @@ class Note(models.Model):
         self.rate = (likes / total if total > 0 else 0) * 5
         self.save()
 
-    @staticmethod
-    def generate_pdf_preview(pdf_path, output_path):
-        images = convert_from_path(pdf_path, first_page=1, last_page=1)
-        if images:
-            image = images[0]
-            image.save(output_path, 'PNG')
-
     def __str__(self):
         return self.name
 
+    def notesheet_changed(self):
+        loaded = getattr(self, '_loaded_notesheet', None)
+        if loaded is DEFERRED:
+            # not loaded, so not assigned either
+            return False
+        return str(self.notesheet or '') != str(loaded or '')
+
     def save(self, *args, **kwargs):
-        # Check if notesheet is being added or changed
-        is_new = self._state.adding or not self.pk
-        old_notesheet = None
-        if not is_new and self.pk:
-            try:
-                old = Note.objects.get(pk=self.pk)
-                old_notesheet = old.notesheet
-            except Note.DoesNotExist:
-                pass
+        changed = self.notesheet_changed()
+        update_fields = kwargs.get('update_fields')
+        if changed and (update_fields is None or 'notesheet' in update_fields):
+            self.preview_status = (
+                self.PREVIEW_PENDING if self.notesheet else self.PREVIEW_NONE
+            )
+            # metadata of the old notesheet, filled in again with previews
+            for name in self.NOTESHEET_METADATA:
+                setattr(self, name, None)
+            if update_fields is not None:
+                kwargs['update_fields'] = {
+                    *update_fields, 'preview_status', *self.NOTESHEET_METADATA
+                }
+        else:
+            changed = False
         super().save(*args, **kwargs)
+        if changed:
+            self._loaded_notesheet = self.notesheet.name
 
-        # Only generate preview if notesheet is present and changed
-        if self.notesheet and (is_new or self.notesheet != old_notesheet):
-            pdf_path = self.notesheet.path
-            # Ensure preview directory exists
-            preview_dir = os.path.join('media', 'notesheets', 'previews')
-            os.makedirs(preview_dir, exist_ok=True)
-            preview_filename = f'{self.pk}_preview.png'
-            preview_path = os.path.join(preview_dir, preview_filename)
-            try:
-                Note.generate_pdf_preview(pdf_path, preview_path)
-                self.preview.name = os.path.join(
-                    'notesheets', 'previews', preview_filename
-                )
-                super().save(update_fields=['preview'])
-            except Exception:
-                # Optionally log the error
-                pass
+        # Render previews off the request once the new notesheet is stored
+        if changed and self.notesheet:
+            from .previews import submit_preview
+            note_id, name = self.pk, self.notesheet.name
+            transaction.on_commit(
+                lambda: submit_preview(note_id, name),
+                using=kwargs.get('using')
+            )
 
     @property
     def level_value(self):
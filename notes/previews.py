@@ -0,0 +1,229 @@
+"""
+Page-1 thumbnails of notesheets, rendered once per notesheet version and
+stored under MEDIA_ROOT. File names carry the note id, a checksum of the
+PDF and the size, so a file never changes once written and can be served
+with far-future cache headers; a new notesheet gets new names.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import fitz  # PyMuPDF
+from django.conf import settings
+from django.db import close_old_connections
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DIR = 'notesheets/previews'
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def notesheet_metadata(pdf_path):
+    """Page count, page-1 size in points and file size of a notesheet."""
+    with fitz.open(pdf_path) as doc:
+        rect = doc.load_page(0).rect if doc.page_count else None
+        return {
+            'page_count': doc.page_count,
+            'page_width': rect.width if rect else None,
+            'page_height': rect.height if rect else None,
+            'notesheet_size': os.path.getsize(pdf_path),
+        }
+
+
+class PreviewStore:
+    """
+    Thumbnails of a note in every width of `sizes` ({name: pixels}) and
+    every format of `formats` ('png', lossy 'webp' and 'jpg'), named
+    {note id}_{checksum[:16]}_{size}.{format} under root/PREVIEW_DIR.
+    """
+
+    def __init__(self, root, sizes, formats=('png',), quality=80):
+        self.root = str(root)
+        self.sizes = dict(sizes)
+        self.formats = tuple(formats)
+        self.quality = quality
+
+    @staticmethod
+    def name(note_id, checksum, size, fmt='png'):
+        """Media-relative name of one thumbnail."""
+        return f'{PREVIEW_DIR}/{note_id}_{checksum[:16]}_{size}.{fmt}'
+
+    def names(self, note_id, checksum, fmt='png'):
+        return {
+            size: self.name(note_id, checksum, size, fmt)
+            for size in self.sizes
+        }
+
+    def outputs(self, note_id, checksum):
+        """Every file stored for this version of the notesheet."""
+        return [
+            self.name(note_id, checksum, size, fmt)
+            for size in self.sizes for fmt in self.formats
+        ]
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def exists(self, note_id, checksum):
+        return all(
+            os.path.exists(self.path(name))
+            for name in self.outputs(note_id, checksum)
+        )
+
+    def encode(self, pix, fmt):
+        if fmt == 'png':
+            return pix.tobytes('png')
+        if fmt == 'jpg':
+            return pix.tobytes('jpg', jpg_quality=self.quality)
+        if fmt == 'webp':
+            image = Image.frombytes(
+                'RGB', (pix.width, pix.height), pix.samples
+            )
+            buf = io.BytesIO()
+            image.save(buf, 'WEBP', quality=self.quality)
+            return buf.getvalue()
+        raise ValueError(f'unknown preview format: {fmt}')
+
+    def render(self, note_id, pdf_path, checksum=None):
+        """
+        Rasterize page 1 of pdf_path once per size and encode it in every
+        format, skipping files that are already stored. Returns
+        {size: media-relative name} of the PNGs.
+        """
+        checksum = checksum or file_checksum(pdf_path)
+        missing = {}
+        for size in self.sizes:
+            for fmt in self.formats:
+                name = self.name(note_id, checksum, size, fmt)
+                if not os.path.exists(self.path(name)):
+                    missing.setdefault(size, []).append((fmt, name))
+        if missing:
+            directory = os.path.join(self.root, PREVIEW_DIR)
+            os.makedirs(directory, exist_ok=True)
+            with fitz.open(pdf_path) as doc:
+                page = doc.load_page(0)
+                for size, outputs in missing.items():
+                    scale = self.sizes[size] / page.rect.width
+                    pix = page.get_pixmap(
+                        matrix=fitz.Matrix(scale, scale), alpha=False
+                    )
+                    for fmt, name in outputs:
+                        self._write(directory, name, self.encode(pix, fmt))
+        return self.names(note_id, checksum)
+
+    def _write(self, directory, name, data):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            # readers never see a partially written thumbnail
+            os.replace(tmp_path, self.path(name))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def remove_stale(self, note_id, checksum):
+        """Delete thumbnails of earlier notesheets of this note."""
+        directory = os.path.join(self.root, PREVIEW_DIR)
+        keep = {
+            os.path.basename(name)
+            for name in self.outputs(note_id, checksum)
+        }
+        try:
+            filenames = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        for filename in filenames:
+            if filename.startswith(f'{note_id}_') and filename not in keep:
+                os.remove(os.path.join(directory, filename))
+
+
+preview_store = PreviewStore(
+    settings.MEDIA_ROOT,
+    settings.NOTES_PREVIEW_SIZES,
+    settings.NOTES_PREVIEW_FORMATS,
+    settings.NOTES_PREVIEW_QUALITY
+)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def refresh_previews(note_id, pdf_path):
+    """
+    Hash pdf_path and render whatever thumbnails of that version are
+    missing. Returns (checksum, {size: PNG name}, number of new files);
+    used by generate_previews on its process pool.
+    """
+    checksum = file_checksum(pdf_path)
+    outputs = preview_store.outputs(note_id, checksum)
+    missing = sum(
+        not os.path.exists(preview_store.path(name)) for name in outputs
+    )
+    names = preview_store.render(note_id, pdf_path, checksum)
+    return checksum, names, missing
+
+
+def get_preview_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.NOTES_PREVIEW_WORKERS,
+                thread_name_prefix='previews'
+            )
+    return _executor
+
+
+def submit_preview(note_id, notesheet_name):
+    """Render a note's previews on the local background worker."""
+    return get_preview_executor().submit(
+        render_note_previews, note_id, notesheet_name
+    )
+
+
+def render_note_previews(note_id, notesheet_name):
+    """
+    Render the previews of notesheet_name, store its checksum and PDF
+    metadata and mark the note ready, unless its notesheet was replaced
+    in the meantime.
+    """
+    from .models import Note
+
+    close_old_connections()
+    try:
+        current = Note.objects.filter(
+            pk=note_id, notesheet=notesheet_name
+        )
+        pdf_path = os.path.join(settings.MEDIA_ROOT, notesheet_name)
+        try:
+            checksum = file_checksum(pdf_path)
+            metadata = notesheet_metadata(pdf_path)
+            names = preview_store.render(note_id, pdf_path, checksum)
+        except Exception:
+            logger.exception("preview rendering failed for note %s", note_id)
+            current.update(preview_status=Note.PREVIEW_FAILED)
+            return
+        # a single conditional write, no read-modify-save of the note
+        if current.update(
+            preview=names[settings.NOTES_PREVIEW_DEFAULT_SIZE],
+            notesheet_checksum=checksum,
+            preview_status=Note.PREVIEW_READY,
+            **metadata
+        ):
+            preview_store.remove_stale(note_id, checksum)
+    finally:
+        close_old_connections()
@@ -1,4 +1,5 @@
 from django import template
+from django.conf import settings
 from datetime import datetime, timezone as dt_timezone
 from django.utils import timezone
 
@@ -16,6 +17,25 @@ def star_class(rate, index):
         return "bi-star"
 
 
+@register.filter
+def preview_srcset(preview, fmt='png'):
+    """
+    srcset with every stored preview width in fmt, given the default-size
+    PNG name from Note.preview. Older single-size previews and formats
+    that are not stored get an empty srcset.
+    """
+    name = str(preview or '')
+    suffix = f'_{settings.NOTES_PREVIEW_DEFAULT_SIZE}.png'
+    stored = fmt in settings.NOTES_PREVIEW_FORMATS
+    if not (stored and name.endswith(suffix)):
+        return ''
+    base = name[:-len(suffix)]
+    return ', '.join(
+        f'{settings.MEDIA_URL}{base}_{size}.{fmt} {width}w'
+        for size, width in settings.NOTES_PREVIEW_SIZES.items()
+    )
+
+
 def to_persian_digits(value):
     persian_digits = {
         '0': '۰', '1': '۱', '2': '۲', '3': '۳', '4': '۴',
@@ -1 +1,151 @@
-# Create your tests here.
\ No newline at end of file
+import io
+from unittest import mock
+
+from bson import ObjectId
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from users.testing import make_user
+
+from .management.commands.generate_previews import Command
+from .models import Note
+
+
+def comment(user_id):
+    return {
+        "userID": user_id, "text": "comment",
+        "createdAt": timezone.now().isoformat(), "deleteFlag": False
+    }
+
+
+# on backends without transactions on_commit runs at once, and the notes
+# here have no PDF to render
+@mock.patch('notes.previews.submit_preview')
+@override_settings(ALLOWED_HOSTS=['*'])
+class NoteDetailQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # Note.createdBy is the auth user, commenters are users.User
+        cls.owner = get_user_model().objects.create(
+            id=ObjectId(), username='owner'
+        )
+        cls.commenters = [make_user(f'user {i}') for i in 'abcdefghij' * 5]
+        cls.note = cls.make_note([
+            comment(user.id) for user in cls.commenters * 2
+        ] + [comment(str(ObjectId()))])
+        cls.empty_note = cls.make_note([])
+
+    @classmethod
+    def make_note(cls, comments):
+        with mock.patch('notes.previews.submit_preview'):
+            note = Note(
+                id=str(ObjectId()), name='sheet', genre=['classic'],
+                composer='composer', level=1, rate=0, likes=0, views=0,
+                createdAt=timezone.now(), createdBy=cls.owner,
+                notesheet='notesheets/sheet.pdf', comments=comments
+            )
+            note.save()
+        return note
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('note-detail', args=[self.note.id])
+
+    def queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return len(ctx), response
+
+    def page_queries(self):
+        """Queries of a detail page without comments."""
+        return self.queries(
+            reverse('note-detail', args=[self.empty_note.id])
+        )[0]
+
+    def test_commenters_are_loaded_with_one_query(self, submit_preview):
+        count, response = self.queries(self.url)
+        self.assertEqual(count, self.page_queries() + 1)
+        names = [c["fullName"] for c in response.context["comments"]]
+        self.assertEqual(names[:50], [u.fullName for u in self.commenters])
+        self.assertEqual(names[-1], "کاربر حذف شده")
+
+    def test_cached_names_need_no_query(self, submit_preview):
+        self.client.get(self.url)
+        # only the deleted commenter is looked up again
+        self.assertEqual(self.queries(self.url)[0], self.page_queries() + 1)
+        self.note.comments.pop()
+        Note.objects.filter(pk=self.note.pk).update(
+            comments=self.note.comments
+        )
+        self.assertEqual(self.queries(self.url)[0], self.page_queries())
+
+    def test_renamed_user_is_shown_under_new_name(self, submit_preview):
+        self.client.get(self.url)
+        user = self.commenters[0]
+        user.fullName = 'renamed'
+        user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response.context["comments"][0]["fullName"], 'renamed'
+        )
+
+
+@mock.patch('notes.previews.submit_preview')
+class GeneratePreviewsFlushTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = get_user_model().objects.create(
+            id=ObjectId(), username='owner'
+        )
+
+    def make_note(self, notesheet):
+        with mock.patch('notes.previews.submit_preview'):
+            note = Note(
+                id=str(ObjectId()), name='sheet', genre=['classic'],
+                composer='composer', level=1, rate=0, likes=0, views=0,
+                createdAt=timezone.now(), createdBy=self.owner,
+                notesheet=notesheet, comments=[]
+            )
+            note.save()
+        return note
+
+    def flush(self, rendered):
+        command = Command(stdout=io.StringIO(), stderr=io.StringIO())
+        Command.point_at(rendered, 'abc', 'md')
+        manifest = {rendered.id: {'checksum': 'abc'}}
+        with mock.patch.object(command, 'write_manifest'), \
+                mock.patch('notes.management.commands.generate_previews.'
+                           'preview_store.remove_stale') as remove_stale:
+            command.flush([rendered], manifest)
+        return manifest, remove_stale
+
+    def test_rendered_notesheet_is_marked_ready(self, submit_preview):
+        note = self.make_note('notesheets/sheet.pdf')
+        rendered = Note.objects.get(pk=note.pk)
+        manifest, remove_stale = self.flush(rendered)
+        note.refresh_from_db()
+        self.assertEqual(note.preview_status, Note.PREVIEW_READY)
+        self.assertEqual(note.notesheet_checksum, 'abc')
+        remove_stale.assert_called_once_with(note.id, 'abc')
+        self.assertIn(note.id, manifest)
+
+    def test_replaced_notesheet_keeps_its_pending_previews(
+            self, submit_preview):
+        note = self.make_note('notesheets/old.pdf')
+        rendered = Note.objects.get(pk=note.pk)
+        # replaced while the old file was being rendered
+        note.notesheet = 'notesheets/new.pdf'
+        note.save()
+        manifest, remove_stale = self.flush(rendered)
+        note.refresh_from_db()
+        self.assertEqual(note.preview_status, Note.PREVIEW_PENDING)
+        self.assertEqual(note.notesheet_checksum, '')
+        remove_stale.assert_not_called()
+        self.assertNotIn(note.id, manifest)
@@ -3,9 +3,9 @@ from django.shortcuts import render, redirect
 from users.forms import UserSignupForm
 from .models import Note
 from django.utils import timezone
-from PyPDF2 import PdfReader
 from django.core.paginator import Paginator
 from pymongo import MongoClient
+from users.names import display_name, display_names
 from users.views import session_login_required
 from django.db.models import Q
 
@@ -13,21 +13,8 @@ from django.db.models import Q
 # Create your views here.
 def notes_view(request):
     signup_form = UserSignupForm()
+    # previews are rendered once at upload, the list does no PDF work
     notes = Note.objects.filter(deleteFlag=False)
-    for note in notes:
-        if note.notesheet and note.notesheet.path:
-            try:
-                import fitz  # PyMuPDF
-                doc = fitz.open(note.notesheet.path)
-                page = doc.load_page(0)
-                pix = page.get_pixmap()
-                img_bytes = pix.tobytes("png")
-                import base64
-                note.preview = base64.b64encode(img_bytes).decode('utf-8')
-            except Exception:
-                note.preview = None
-        else:
-            note.preview = None
     return render(
         request, "notes/sheets.html", {"form": signup_form, "notes": notes}
     )
@@ -61,14 +48,8 @@ def note_detail_view(request, note_id):
     except Note.DoesNotExist:
         return render(request, "404.html", status=404)
 
-    # Extract PDF page count
-    pdf_page_count = None
-    if note.notesheet and note.notesheet.path:
-        try:
-            reader = PdfReader(note.notesheet.path)
-            pdf_page_count = len(reader.pages)
-        except Exception:
-            pdf_page_count = None
+    # Stored when the notesheet was uploaded, the PDF is not opened here
+    pdf_page_count = note.page_count
 
     if request.method == "POST" and request.session.get("user_id"):
         form_type = request.POST.get("form_type")
@@ -84,16 +65,11 @@ def note_detail_view(request, note_id):
         # Redirect with a query param to prevent view increment
         return redirect(f"{request.path}?from_action=1")
 
-    # Attach user fullName to each comment
-    from users.models import User
+    # Attach user fullName to each comment, one query for all commenters
+    names = display_names(c.get("userID") for c in note.comments)
     comments = []
     for comment in note.comments:
-        user_id = comment.get("userID")
-        try:
-            user = User.objects.get(id=user_id)
-            comment["fullName"] = user.fullName
-        except User.DoesNotExist:
-            comment["fullName"] = "کاربر حذف شده"
+        comment["fullName"] = display_name(comment.get("userID"), names)
         comments.append(comment)
 
     my_vote = None
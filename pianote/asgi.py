@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pianote.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported after the app registry is ready, it pulls in models
+from exercise.live import live_scoring_app  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # HTTP goes to Django, WebSockets to live exercise scoring
+    if scope['type'] == 'websocket':
+        await live_scoring_app(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
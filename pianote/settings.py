@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+
 import django_mongodb_backend
 
 from pathlib import Path
@@ -153,4 +155,114 @@ MIGRATION_MODULES = {
     "admin": "mongo_migrations.admin",
     "auth": "mongo_migrations.auth",
     "contenttypes": "mongo_migrations.contenttypes",
-}
\ No newline at end of file
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        # scoring warm-up, tiered scoring summaries and job failures
+        "exercise": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
+# Exercise scoring
+# Extracted reference features are cached on disk, keyed by content hash.
+EXERCISE_FEATURE_CACHE_DIR = BASE_DIR / 'cache' / 'features'
+EXERCISE_FEATURE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Deduplicated reference recordings get their features precomputed here,
+# one directory of memory-mapped .npy files per recording. Uploads larger
+# than EXERCISE_REFERENCE_MAX_BYTES are rejected before they are stored.
+EXERCISE_REFERENCE_LIBRARY_DIR = BASE_DIR / 'cache' / 'references'
+EXERCISE_REFERENCE_MAX_BYTES = 100 * 1024 * 1024
+# Recordings behind saved attempts, stored once per content hash so that
+# `manage.py rescore` can score them again after the formulas change.
+# Kept outside MEDIA_ROOT so they are never served. Recordings stored
+# longer than EXERCISE_UPLOAD_MAX_AGE ago (seconds) are deleted, then the
+# least recently stored ones while the directory exceeds
+# EXERCISE_UPLOAD_MAX_BYTES; their attempts can no longer be re-scored.
+EXERCISE_UPLOAD_DIR = BASE_DIR / 'storage' / 'exercise_uploads'
+EXERCISE_UPLOAD_FEATURE_DIR = BASE_DIR / 'cache' / 'uploads'
+EXERCISE_UPLOAD_MAX_BYTES = 5 * 1024 * 1024 * 1024
+EXERCISE_UPLOAD_MAX_AGE = 180 * 24 * 60 * 60
+# Where an interrupted `manage.py rescore` run records its progress.
+EXERCISE_RESCORE_CHECKPOINT = BASE_DIR / 'cache' / 'rescore.json'
+# Size of the local process pool that runs queued scoring jobs.
+EXERCISE_SCORING_WORKERS = 2
+# Jobs are tracked by the process that queued them. One still pending
+# after this many seconds lost that process (a restart or a crash) and is
+# reported as failed instead of being polled forever.
+EXERCISE_SCORING_JOB_TIMEOUT = 15 * 60
+# Uploads are only decoded up to the analysis window; anything whose
+# header reports a longer duration than the upload limit is rejected.
+EXERCISE_ANALYSIS_SECONDS = 60
+EXERCISE_MAX_UPLOAD_SECONDS = 600
+# Pitch tracker used for scoring, see exercise.analysis.PITCH_BACKENDS:
+# 'yin', 'yin_coarse', 'autocorr' or 'pyin' (slow, for offline re-scoring).
+# `manage.py benchmark_exercise pitch` compares their cost and agreement.
+EXERCISE_PITCH_BACKEND = 'yin'
+# Default scoring profile, see exercise.profiles: 'full' (HPSS tonnetz),
+# 'balanced' (tonnetz from chroma) or 'fast' (MFCC and chroma only).
+EXERCISE_SCORING_PROFILE = 'full'
+# Run a cheap coarse pass before summary scoring and give silent, too
+# short or clearly unrelated takes a low score without the full pipeline.
+EXERCISE_TIERED_SCORING = True
+# Alignment scoring mode: whole takes up to this length are aligned to the
+# reference with DTW evaluating at most this many cells per resolution.
+EXERCISE_ALIGNMENT_MAX_SECONDS = 300
+EXERCISE_ALIGNMENT_MAX_CELLS = 1_000_000
+# Recordings longer than EXERCISE_PARALLEL_MIN_SECONDS are analysed in
+# overlapping windows of EXERCISE_PARALLEL_WINDOW_SECONDS on a pool of
+# EXERCISE_ANALYSIS_WORKERS processes, split evenly between the scoring
+# workers (a share below 2 analyses in one piece). Uploads are cut at
+# EXERCISE_ANALYSIS_SECONDS first, so longer recordings only reach the
+# windowed path once that is raised.
+EXERCISE_ANALYSIS_WORKERS = os.cpu_count() or 1
+EXERCISE_PARALLEL_MIN_SECONDS = 30
+EXERCISE_PARALLEL_WINDOW_SECONDS = 20
+# Compiled numba kernels (librosa's pitch and beat tracking) are kept here
+# across restarts. Server processes (runserver, gunicorn, uvicorn, daphne,
+# hypercorn, uwsgi, or any process started with EXERCISE_WARMUP=1) also
+# run the whole scoring pipeline once on a short synthetic take at
+# startup, on a background thread, so the first request doesn't pay for
+# compilation and lazy imports. Scoring pool workers do the same before
+# taking their first job.
+# `manage.py warmup --compare` reports cold and warm latency.
+EXERCISE_JIT_CACHE_DIR = BASE_DIR / 'cache' / 'numba'
+EXERCISE_WARMUP_ON_STARTUP = True
+# The reference and the student take of an evaluation are extracted side
+# by side on a pool of EXERCISE_EXTRACTION_THREADS threads in each scoring
+# worker (fewer than 2 extracts them one after the other). BLAS calls are
+# capped at EXERCISE_EXTRACTION_BLAS_THREADS threads each, divided among
+# the EXERCISE_SCORING_WORKERS workers, so the concurrent extractions
+# don't oversubscribe the cores.
+EXERCISE_EXTRACTION_THREADS = 2
+EXERCISE_EXTRACTION_BLAS_THREADS = max(
+    1, (os.cpu_count() or 1) // EXERCISE_EXTRACTION_THREADS
+)
+
+# Notesheet previews
+# Page 1 of every notesheet is rendered once per upload into these widths
+# (pixels) under MEDIA_ROOT/notesheets/previews; Note.preview holds the
+# default size. Names include a checksum of the PDF, so the files never
+# change and are served with long-lived cache headers.
+NOTES_PREVIEW_SIZES = {'sm': 240, 'md': 480, 'lg': 960}
+NOTES_PREVIEW_DEFAULT_SIZE = 'md'
+# Formats every size is stored in: 'png', which Note.preview points at and
+# must stay, plus lossy 'webp' or 'jpg' at NOTES_PREVIEW_QUALITY.
+NOTES_PREVIEW_FORMATS = ('png', 'webp')
+NOTES_PREVIEW_QUALITY = 80
+NOTES_PREVIEW_CACHE_SECONDS = 365 * 24 * 60 * 60
+# Previews of new notesheets are rendered after the upload commits, on a
+# local pool of this many background threads.
+NOTES_PREVIEW_WORKERS = 1
+
+# Users
+# Display names of commenters and bidders are cached for this long. The
+# entry of a user is dropped when that User is saved or deleted, but only
+# in the cache of the saving process: with the default per-process cache,
+# other server processes show the old name until the entry expires.
+USERS_DISPLAY_NAME_CACHE_SECONDS = 10 * 60
@@ -16,13 +16,15 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from users import views
 from notes import views as notes_view
 from estimator import views as estimator_view
 from exercise import views as exercise_view
 from django.conf import settings
 from django.conf.urls.static import static
+from django.views.decorators.cache import cache_control
+from django.views.static import serve
 
 
 urlpatterns = [
@@ -47,6 +49,26 @@ urlpatterns = [
         exercise_view.ajax_exercise_metrics,
         name="ajax_exercise_metrics"
     ),
+    path(
+        "exercise/ajax/jobs/submit/",
+        exercise_view.ajax_submit_scoring_job,
+        name="ajax_submit_scoring_job"
+    ),
+    path(
+        "exercise/ajax/batch_score/",
+        exercise_view.ajax_batch_score,
+        name="ajax_batch_score"
+    ),
+    path(
+        "exercise/ajax/match_reference/",
+        exercise_view.ajax_match_reference,
+        name="ajax_match_reference"
+    ),
+    path(
+        "exercise/ajax/jobs/<str:job_id>/",
+        exercise_view.ajax_scoring_job_status,
+        name="ajax_scoring_job_status"
+    ),
     path("price-estimator/", estimator_view.estimator_view, name="estimator"),
     path(
         "exercises/create/",
@@ -57,4 +79,15 @@ urlpatterns = [
     path('auctions/', include('auctions.urls')),
 ]
 if settings.DEBUG:
+    # previews are named by notesheet checksum and never change
+    urlpatterns += [
+        re_path(
+            r'^media/(?P<path>notesheets/previews/.*)$',
+            cache_control(
+                public=True, immutable=True,
+                max_age=settings.NOTES_PREVIEW_CACHE_SECONDS
+            )(serve),
+            {'document_root': settings.MEDIA_ROOT}
+        ),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
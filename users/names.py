@@ -0,0 +1,55 @@
+"""
+Display names of users, looked up with one batched query per page and
+cached across requests. Entries are dropped whenever a User is saved or
+deleted, so a renamed user shows up under the new name right away.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User
+
+DELETED_USER_NAME = "کاربر حذف شده"
+
+
+def _key(user_id):
+    return f'users:display_name:{user_id}'
+
+
+def display_names(user_ids):
+    """
+    {user id: fullName} for every existing user in user_ids, with at most
+    one query for the ids missing from the cache.
+    """
+    ids = {str(user_id) for user_id in user_ids if user_id}
+    if not ids:
+        return {}
+    cached = cache.get_many([_key(user_id) for user_id in ids])
+    names = {
+        user_id: cached[_key(user_id)]
+        for user_id in ids if _key(user_id) in cached
+    }
+    missing = ids - names.keys()
+    if missing:
+        found = {
+            user_id: user.fullName
+            for user_id, user in User.objects.only('id', 'fullName')
+            .in_bulk(missing).items()
+        }
+        cache.set_many(
+            {_key(user_id): name for user_id, name in found.items()},
+            settings.USERS_DISPLAY_NAME_CACHE_SECONDS
+        )
+        names.update(found)
+    return names
+
+
+def display_name(user_id, names):
+    return names.get(str(user_id), DELETED_USER_NAME)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_display_name(sender, instance, **kwargs):
+    cache.delete(_key(instance.pk))
@@ -0,0 +1,23 @@
+"""Fixtures shared by the tests of every app."""
+from bson import ObjectId
+from django.utils import timezone
+
+from .models import User
+
+
+def make_user(full_name, **fields):
+    """
+    A users.User with the fields UserSignupForm.save() fills in, without
+    the password hashing that makes the form slow in bulk.
+    """
+    now = timezone.now()
+    return User.objects.create(**{
+        'id': str(ObjectId()),
+        'fullName': full_name,
+        'password': '!',
+        'email': f'{ObjectId()}@example.com',
+        'phoneNumber': '09120000000',
+        'premiumDate': now,
+        'createdDate': now,
+        **fields,
+    })